@@ -1,131 +1,182 @@
+import ast
 import csv
 import os
 import sys
+import Diff_Engine
+import Results_Dataset
 
-def read_csv(csv_files_root_directory):
+def iter_csv_paths(csv_files_root_directory):
+    """
+    Walks the root directory and its subdirectories with os.scandir, which reads the type of every entry along
+    with its name instead of a stat per entry, and yields the clusters csv files as they are found.
 
-    # Csv names list
-    csv_paths = []
+    Parameter:
+    csv_files_root_directory (string): path to the root directory holding the csv files
 
-    # Iterate through each item in root directory
-    for item in os.listdir(csv_files_root_directory):
+    Return:
+    csv_path (string): path of each csv file containing 'clusters-data' in its name, in directory order
+    """
 
-        # Construct current item path
-        item_path = os.path.join(csv_files_root_directory, item)
+    with os.scandir(csv_files_root_directory) as entries:
 
-        # If current item is a file skip
-        if os.path.isdir(item_path):
+        for entry in entries:
 
             # Recursively traverse subdirectories
-            subdirectory_csv_names = read_csv(item_path)
-            csv_paths.extend(subdirectory_csv_names)
+            if entry.is_dir():
 
-        # Else if path is a file of type .csv and contains 'clusters-data' in name, record name of file in csv_names list
-        elif os.path.isfile(item_path) and item.endswith('.csv') and ('clusters-data' in item):
+                yield from iter_csv_paths(entry.path)
 
-            # Append name of file to csv names list
-            csv_paths.append(item_path)
+            # Else if path is a file of type .csv and contains 'clusters-data' in name, yield it
+            elif entry.is_file() and entry.name.endswith('.csv') and ('clusters-data' in entry.name):
 
-        # If anything else, skip
-        else:
-            
-            continue
+                yield entry.path
 
-    # Dictioanry to store csv data
-    csv_data = {}
 
-    # Loop through each csv in csv_names list
-    for csv_file in csv_paths:
+def program_key(program_name):
+    """
+    Reduces a program name to the key the results dataset uses, the original file name. Clusters csv files
+    written before hold the stringified (original file, optimized file) index instead, e.g. "('x.ll', 'x.ll')".
 
-        # Initialize an empty list for the current csv's entry in the dictionary
-        csv_data[csv_file] = []
+    Parameter:
+    program_name (string): program name as found in a clusters csv file
 
-        # Open the current csv for reading
-        with open(csv_file, 'r') as file:
-            
-            # Read the csv into reader
-            reader = csv.DictReader(file)
+    Return:
+    program_key (string): original file name of the program
+    """
 
-            # Append each row of csv to list stored in dictionary
-            for row in reader:
+    if program_name.startswith('('):
+        return ast.literal_eval(program_name)[0]
 
-                csv_data[csv_file].append(row)
+    return program_name
 
 
-    return csv_data
-        
-def store_clusters(csv_pass_data):
+def read_csv_rows(csv_file):
+    """
+    Reads the rows of one clusters csv file, keeping only the program name and cluster columns, keyed and
+    typed the same as Results_Dataset.read_program_clusters().
 
-    # Dictionary to store each programs cluster
-    program_clusters = {}
+    Parameter:
+    csv_file (string): path to the csv file
 
-    # Iterate over each item in csv_pass_data, which contains the csv data for each pass
-    for csv_file, data in csv_pass_data.items():
+    Return:
+    rows (list: dict): 'Program Name' and 'Cluster' of every row
+    """
 
-        # For each csv_file and its corresponding data, iterate over each row in the data
-        for row in data:
+    rows = []
 
-            # Extract the program name and cluster information from the current row
-            program_name = row['Program Name']
-            cluster = row['Cluster']
+    with open(csv_file, 'r', newline = '') as file:
 
-            # Check if current program name already exists as a key in program_clusters
-            if program_name not in program_clusters:
+        reader = csv.reader(file)
+        next(reader, None)
 
-                # If not add the program name as a new key with an empty list as its value
-                program_clusters[program_name] = []
-            
-            # If program name already exists, append the cluster value to the list associated with that program name
-            program_clusters[program_name].append(cluster)
+        for row in reader:
 
-    return program_clusters
+            # The program count of every cluster follows the first blank row
+            if len(row) == 0:
+                break
 
-def compare_cluster_lists(program_clusters):
+            rows.append({'Program Name': program_key(row[0]), 'Cluster': int(row[1])})
 
-    # List to store list of consistent clusters
-    consistent_clusters = []
+    return rows
 
-    # Iterate over each program in program_clusters
-    for program_name, clusters in program_clusters.items():
 
-        # Tracks if a program is repeated in the main list
-        repeats = False
+def iter_csv_rows(csv_files_root_directory, jobs = 1):
+    """
+    Lazily yields the rows of every clusters csv file under the root directory. Files are read in parallel,
+    with only a bounded number of them in memory at once, and rows come out in the same order as a serial read.
 
-        # To ensure no repetitions, check if current_program name is not in main list already
-        for sub_list in consistent_clusters:
-            
-            # If it is in one of the sublist, update state of repeats to True and break out
-            if program_name in sub_list:
+    Parameter:
+    csv_files_root_directory (string): path to the root directory holding the csv files
+    jobs (int): number of files read concurrently
 
-                repeats = True
-                break
+    Return:
+    (csv_file, row) (tuple): each row with the path of the csv file it comes from
+    """
+
+    csv_paths = iter_csv_paths(csv_files_root_directory)
 
-        # If no repeats, start checking for consistency
-        if repeats == False:
+    for csv_file, rows in Diff_Engine.ordered_map(lambda csv_file: (csv_file, read_csv_rows(csv_file)), csv_paths, jobs):
+        for row in rows:
+            yield csv_file, row
 
-            # Sublist to store programs that are consistent with current program
-            current_matches = [program_name]
 
-            # Iterate over all other programs
-            for other_program, other_clusters in program_clusters.items():
+def read_csv(csv_files_root_directory):
 
-                # As long as it's not the same program
-                if program_name != other_program:
+    # Dictioanry to store csv data
+    csv_data = {}
 
-                    # If the set of clusters is the same, note down consistency
-                    if set(clusters) == set(other_clusters):
-                        
-                        current_matches.append(other_program)
+    # Append each row of every csv to the list stored in dictionary for that csv
+    for csv_file, row in iter_csv_rows(csv_files_root_directory):
 
-            # If matches were found, append, else don't
-            if len(current_matches) > 1:
-                # Append current matches to main list
-                consistent_clusters.append(current_matches)
+        csv_data.setdefault(csv_file, []).append(row)
 
-        # Else skip to next program as current program already in a consistency list
-        else:
+    return csv_data
+        
+def store_clusters(csv_pass_data):
+    """
+    Collects the clusters of every program across all passes.
 
-            continue
+    Parameter:
+    csv_pass_data (dict or iterable): either the csv data of read_csv(), or (csv_file, row) pairs as yielded
+                                      lazily by iter_csv_rows(), so only the clusters are ever kept in memory
+
+    Return:
+    program_clusters (dict: list): clusters of every program, one per pass
+    """
+
+    # Accept the csv data of read_csv() as well
+    if isinstance(csv_pass_data, dict):
+        csv_pass_data = ((csv_file, row) for csv_file, data in csv_pass_data.items() for row in data)
+
+    # Dictionary to store each programs cluster
+    program_clusters = {}
+
+    # Iterate over each row of every csv file
+    for csv_file, row in csv_pass_data:
+
+        # Extract the program name and cluster information from the current row
+        program_name = row['Program Name']
+        cluster = row['Cluster']
+
+        # Check if current program name already exists as a key in program_clusters
+        if program_name not in program_clusters:
+
+            # If not add the program name as a new key with an empty list as its value
+            program_clusters[program_name] = []
+        
+        # If program name already exists, append the cluster value to the list associated with that program name
+        program_clusters[program_name].append(cluster)
+
+    return program_clusters
+
+def compare_cluster_lists(program_clusters, ordered = False):
+    """
+    Groups together the programs that fall in the same clusters. Every program is reduced to a hashable cluster
+    signature in a single pass, so grouping is linear in the number of programs.
+
+    Parameter:
+    program_clusters (dict: list): clusters of every program, one per pass
+    ordered (bool): if True programs must have the same cluster for every pass (ordered tuple), if False
+                    only the same set of clusters
+
+    Return:
+    consistent_clusters (list: list): groups of at least 2 programs sharing a signature, each group and the
+                                      programs within it in order of first appearance
+    """
+
+    # Programs of every signature, dictionaries keep the order signatures are first seen in
+    signature_groups = {}
+
+    # Iterate over each program in program_clusters
+    for program_name, clusters in program_clusters.items():
+
+        # Signature of the program's clusters
+        signature = tuple(clusters) if ordered else frozenset(clusters)
+
+        signature_groups.setdefault(signature, []).append(program_name)
+
+    # Only keep signatures shared by more than one program
+    consistent_clusters = [group for group in signature_groups.values() if len(group) > 1]
 
     return consistent_clusters
 
@@ -139,11 +190,21 @@ def main():
         original_stdout = sys.stdout
         sys.stdout = file # Ensures any prints moving forward are to the file not terminal
 
-        # Step 1: Read csv files for each pass
-        csv_pass_data = read_csv(csv_files_root_directory = '/Users/ahmedelzaria/Documents/LLVM/llvm-diff-csv')
+        # Columnar results dataset written by LLVM-DIFF.py
+        dataset_root = '/Users/ahmedelzaria/Documents/LLVM/llvm-diff-dataset'
+
+        if os.path.isdir(dataset_root):
+
+            # Step 1 and 2: Load only the program, pass and cluster columns of the dataset, grouped by program
+            program_clusters = Results_Dataset.read_program_clusters(dataset_root)
+
+        else:
+
+            # Step 1: Lazily read the csv files of each pass in parallel
+            csv_rows = iter_csv_rows('/Users/ahmedelzaria/Documents/LLVM/llvm-diff-csv', jobs = Diff_Engine.default_jobs())
 
-        # Step 2: Create a dictionary to store clusters for each program
-        program_clusters = store_clusters(csv_pass_data)
+            # Step 2: Create a dictionary to store clusters for each program as the rows arrive
+            program_clusters = store_clusters(csv_rows)
 
         # Step 3: Compare cluster lists for each program
         consistent_clusters = compare_cluster_lists(program_clusters)
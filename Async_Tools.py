@@ -0,0 +1,494 @@
+# Asynchronous execution of opt, llvm-diff and clang. The pipelines spend nearly all their time waiting on
+# these processes, so they are started with asyncio.create_subprocess_exec and a semaphore bounds how many
+# run at once. IR generation checks and compiles every file concurrently, diff sweeps run a whole chunk of
+# pairs at once, and the exploration applies the passes on the next state while the current one is being
+# deduped, with the llvm-diff comparisons of a dedup lookup running side by side. Results are the same as
+# the synchronous code's, and every entry point falls back to it when asyncio can't be used (inside a
+# running event loop, without subprocess support, or with LLVM_EVOLUTION_SYNC set).
+
+import os
+import time
+import asyncio
+import subprocess
+
+import Diff_Engine
+import Exploration
+import Profiling
+import Tiered_Dedup
+import Toolchain
+
+# Setting this environment variable forces the synchronous path everywhere
+SYNC_VARIABLE = 'LLVM_EVOLUTION_SYNC'
+
+
+def can_run_async():
+    """
+    Whether the asynchronous path can be used.
+
+    Return:
+    usable (bool): False if forced off by the environment or if an event loop already runs in this thread
+    """
+
+    if os.environ.get(SYNC_VARIABLE):
+        return False
+
+    # asyncio.run() can't be called from inside a running loop, e.g. in a notebook
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return True
+
+    return False
+
+
+def run(coroutine_function, fallback):
+    """
+    Runs the asynchronous version of a pipeline, or its synchronous version if asyncio can't be used.
+
+    Parameter:
+    coroutine_function (callable): returns the coroutine of the asynchronous version
+    fallback (callable): runs the synchronous version
+
+    Return:
+    result: the result of whichever version ran
+    """
+
+    if not can_run_async():
+        return fallback()
+
+    try:
+        return asyncio.run(coroutine_function())
+    except NotImplementedError:
+        # Event loop without subprocess support
+        return fallback()
+
+
+class ToolRunner:
+    """
+    Runs the tools of a toolchain as asyncio subprocesses, at most limit at once. Must be created inside
+    the event loop it is used in.
+
+    Parameter:
+    toolchain (Toolchain): toolchain whose tools are run, the tools on PATH if None
+    limit (int): maximum number of tools running at once, one per core if None
+    profiler (Profiler): profiler timing the 'opt', 'llvm-diff' and 'clang' stages, None to not profile
+    """
+
+    def __init__(self, toolchain = None, limit = None, profiler = None):
+
+        self.opt_path = 'opt' if toolchain is None else toolchain.opt
+        self.llvm_diff_path = 'llvm-diff' if toolchain is None else toolchain.llvm_diff
+        self.clang_path = 'clang' if toolchain is None or toolchain.clang is None else toolchain.clang
+
+        self.semaphore = asyncio.Semaphore(limit or Diff_Engine.default_jobs())
+        self.profiler = Profiling.active(profiler)
+
+    async def run(self, command, stage):
+        """
+        Runs a command once a slot is free.
+
+        Parameter:
+        command (list: string): command and its arguments
+        stage (string): profiler stage the run is timed in
+
+        Return:
+        returncode (int): exit code of the command
+        stdout (bytes): its standard output
+        stderr (bytes): its standard error
+        """
+
+        async with self.semaphore:
+            with self.profiler.stage(stage):
+                process = await asyncio.create_subprocess_exec(*command, stdout = asyncio.subprocess.PIPE, stderr = asyncio.subprocess.PIPE)
+                stdout, stderr = await process.communicate()
+
+        return process.returncode, stdout, stderr
+
+    async def opt(self, program, opt_pass, output_path):
+        """
+        Applies a pass on a program with opt.
+
+        Parameter:
+        program (string): path to the program
+        opt_pass (string): pass to apply
+        output_path (string): path the optimized program is written to
+
+        Return:
+        returncode (int): exit code of opt, the optimized program is in output_path if 0
+        """
+
+        returncode, stdout, stderr = await self.run([self.opt_path, '-S', '-passes=' + opt_pass, '-o', output_path, program], 'opt')
+
+        return returncode
+
+    async def opt_output(self, program, opt_pass):
+        """
+        Applies a pass on a program with opt and captures the optimized program.
+
+        Parameter:
+        program (string): path to the program
+        opt_pass (string): pass to apply
+
+        Return:
+        returncode (int): exit code of opt, the optimized program is only valid if it is 0
+        optimized_ir (bytes): optimized program, as written by opt to its standard output
+        errors (bytes): standard error of opt
+        """
+
+        return await self.run([self.opt_path, '-S', '-passes=' + opt_pass, '-o', '-', program], 'opt')
+
+    async def llvm_diff(self, first_path, second_path):
+        """
+        Compares two programs with llvm-diff.
+
+        Parameter:
+        first_path (string): path to the first program
+        second_path (string): path to the second program
+
+        Return:
+        diff_output (list: string): llvm-diff output split into lines
+        """
+
+        returncode, stdout, stderr = await self.run([self.llvm_diff_path, first_path, second_path], 'llvm-diff')
+
+        return stderr.decode().splitlines()
+
+    async def compile_ir(self, source_path, output_path):
+        """
+        Generates the IR of a .c file with clang, if clang can compile it.
+
+        Parameter:
+        source_path (string): path to the .c file
+        output_path (string): path the IR is written to
+
+        Return:
+        compiled (bool): whether the IR was generated
+        """
+
+        returncode, stdout, stderr = await self.run([self.clang_path, '-fsyntax-only', source_path], 'clang')
+        if returncode != 0:
+            return False
+
+        returncode, stdout, stderr = await self.run([self.clang_path, '-S', '-emit-llvm', source_path, '-o', output_path, '-O0', '-Xclang', '-disable-O0-optnone'], 'clang')
+
+        return returncode == 0
+
+
+def source_files(directory):
+    """
+    Every .c file of a directory and its subdirectories, in the order Exploration.generate_ir() visits them.
+
+    Parameter:
+    directory (string): path to the root directory
+
+    Return:
+    paths (list: string): paths to the .c files
+    """
+
+    paths = []
+
+    for item in os.listdir(directory):
+        itempath = os.path.join(directory, item)
+        if os.path.isfile(itempath) and itempath.endswith('.c'):
+            paths.append(itempath)
+        elif os.path.isdir(itempath):
+            paths += source_files(itempath)
+
+    return paths
+
+
+async def generate_ir_async(directory, output_directory, toolchain = None, limit = None, profiler = None):
+    """
+    Asynchronous version of generate_ir(), same parameters.
+    """
+
+    runner = ToolRunner(toolchain, limit, profiler)
+
+    await asyncio.gather(*(runner.compile_ir(path, os.path.join(output_directory, os.path.basename(path) + '.ll')) for path in source_files(directory)))
+
+
+def generate_ir(directory, output_directory, toolchain = None, limit = None, profiler = None):
+    """
+    Generates the IR of every clang compilable .c file of a directory tree, like Exploration.generate_ir()
+    but with the clang runs overlapping.
+
+    Parameter:
+    directory (string): path to the root directory of interest
+    output_directory (string): path to the directory to store the IR in
+    toolchain (Toolchain): toolchain whose clang is used, clang on PATH if None
+    limit (int): maximum number of clang processes at once, one per core if None
+    profiler (Profiler): profiler timing the 'clang' stage, None to not profile
+
+    Return:
+    Nothing, the IR files are added to output_directory
+    """
+
+    return run(lambda: generate_ir_async(directory, output_directory, toolchain, limit, profiler),
+               lambda: Exploration.generate_ir(directory, output_directory, toolchain))
+
+
+async def diff_sweep_async(pairs, toolchain = None, limit = None):
+    """
+    Asynchronous version of one chunk of diff_sweep(), same parameters.
+    """
+
+    runner = ToolRunner(toolchain, limit)
+
+    outputs = await asyncio.gather(*(runner.llvm_diff(original_path, optimized_path) for original_path, optimized_path in pairs))
+
+    return [(pair, [line for line in output if line.strip().startswith(('>', '<'))]) for pair, output in zip(pairs, outputs)]
+
+
+def diff_sweep(pairs, toolchain = None, limit = None, chunk_size = 4096):
+    """
+    Runs llvm-diff on every pair of files concurrently, like Diff_Engine.diff_sweep(). Pairs are pulled
+    lazily, chunk_size at a time.
+
+    Parameter:
+    pairs (iterable: tuple): (original path, optimized path) pairs
+    toolchain (Toolchain): toolchain whose llvm-diff is used, llvm-diff on PATH if None
+    limit (int): maximum number of llvm-diff processes at once, one per core if None
+    chunk_size (int): pairs in flight at once, bounds the memory held by their outputs
+
+    Return:
+    (pair, diff_lines) (tuple): each pair with its addition and deletion lines, in the order of the pairs
+    """
+
+    # The synchronous fallback must run the same llvm-diff, with as many processes at once
+    llvm_diff = 'llvm-diff' if toolchain is None else toolchain.llvm_diff
+    jobs = limit or Diff_Engine.default_jobs()
+
+    def sweep(chunk):
+        return run(lambda: diff_sweep_async(chunk, toolchain, limit), lambda: list(Diff_Engine.diff_sweep(chunk, jobs, llvm_diff = llvm_diff)))
+
+    chunk = []
+
+    for pair in pairs:
+
+        chunk.append(pair)
+
+        if len(chunk) == chunk_size:
+            yield from sweep(chunk)
+            chunk = []
+
+    if chunk:
+        yield from sweep(chunk)
+
+
+async def opt_outputs_async(jobs, toolchain = None, limit = None):
+    """
+    Asynchronous version of opt_outputs(), same parameters.
+    """
+
+    runner = ToolRunner(toolchain, limit)
+
+    return await asyncio.gather(*(runner.opt_output(program, opt_pass) for program, opt_pass in jobs))
+
+
+def opt_outputs(jobs, toolchain = None, limit = None):
+    """
+    Applies passes on programs concurrently and captures the optimized programs.
+
+    Parameter:
+    jobs (list: tuple): (program path, pass) of every opt run
+    toolchain (Toolchain): toolchain whose opt is used, opt on PATH if None
+    limit (int): maximum number of opt processes at once, one per core if None
+
+    Return:
+    outcomes (list: tuple): (exit code, optimized program, standard error) of every job, in the order of the jobs
+    """
+
+    def run_serially():
+        opt = 'opt' if toolchain is None else toolchain.opt
+        outcomes = [subprocess.run([opt, '-S', '-passes=' + opt_pass, '-o', '-', program], capture_output = True) for program, opt_pass in jobs]
+        return [(outcome.returncode, outcome.stdout, outcome.stderr) for outcome in outcomes]
+
+    return run(lambda: opt_outputs_async(jobs, toolchain, limit), run_serially)
+
+
+async def apply_passes_async(runner, node, passes, optimized_path, toolchain, cache, source, profiler):
+    """
+    Applies every pass on a state, like Exploration.apply_pass() for each of them, with the opt runs overlapping.
+
+    Return:
+    optimized_program_paths (list: string): path to the result of every pass, None for the passes opt failed on
+    """
+
+    async def apply(opt_pass):
+
+        optimized_program_path = os.path.join(optimized_path, node.split('/')[-1] + '_' + opt_pass + '.ll')
+        use_cache = cache is not None and source is not None
+
+        # Known transition, no need to run opt
+        if use_cache:
+            target = cache.transition(toolchain.key, source, opt_pass)
+            if target is not None:
+                profiler.count('transition hits')
+                cache.materialize(target, optimized_program_path)
+                profiler.count('bytes written', os.path.getsize(optimized_program_path))
+                return optimized_program_path
+
+        returncode = await runner.opt(node, opt_pass, optimized_program_path)
+        profiler.count('opt runs')
+
+        if returncode != 0:
+            profiler.count('opt failures')
+            return None
+
+        profiler.count('bytes written', os.path.getsize(optimized_program_path))
+        if use_cache:
+            cache.add_transition(toolchain.key, source, opt_pass, cache.put_file(optimized_program_path))
+
+        return optimized_program_path
+
+    return await asyncio.gather(*(apply(opt_pass) for opt_pass in passes))
+
+
+async def find_equivalent_async(runner, optimized_program_path, graph, cache, profiler, chunk_size):
+    """
+    Finds a node of the graph llvm-diff finds no differences with, like Exploration.find_equivalent() with
+    the same tiers before llvm-diff, with chunk_size comparisons running at once. Comparisons past the
+    equivalent node in its chunk are wasted but the node found is the same.
+
+    Return:
+    node (string): equivalent node, None if there is none
+    target (string): content address of the optimized file, None without a cache
+    """
+
+    target = None
+    nodes = list(graph.nodes)
+
+    if os.path.exists(optimized_program_path):
+        node, target, nodes = Tiered_Dedup.index_for(graph).candidates(optimized_program_path, cache, profiler)
+        if node is not None:
+            return node, target
+
+    async def compare(node):
+
+        if target is not None:
+            differences = cache.diff(target, graph.nodes[node]['hash'])
+            if differences is not None:
+                profiler.count('diff hits')
+                return differences
+
+        differences = Exploration.analyze_differences(await runner.llvm_diff(optimized_program_path, node))
+        profiler.count('diff runs')
+
+        if target is not None:
+            cache.add_diff(target, graph.nodes[node]['hash'], differences)
+
+        return differences
+
+    for start in range(0, len(nodes), chunk_size):
+
+        chunk = nodes[start:start + chunk_size]
+        verdicts = await asyncio.gather(*(compare(node) for node in chunk))
+
+        for node, differences in zip(chunk, verdicts):
+            if differences['Num Additions'] == 0 and differences['Num Deletions'] == 0:
+                return node, target
+
+    return None, target
+
+
+async def explore_async(root_program_path, passes, optimized_path, toolchain = None, cache = None, max_nodes = 10000, time_limit = 10000, profiler = None, limit = None, analytics = None):
+    """
+    Asynchronous version of explore(), same parameters.
+    """
+
+    import networkx as nx
+
+    profiler = Profiling.active(profiler)
+    runner = ToolRunner(toolchain, limit, profiler)
+    chunk_size = limit or Diff_Engine.default_jobs()
+
+    # Transitions are cached per toolchain, so the cache needs to know which one runs
+    if cache is not None and toolchain is None:
+        toolchain = Toolchain.default_toolchain()
+
+    graph = nx.DiGraph()
+    queue = []
+
+    Exploration.add_graph_node(root_program_path, queue, graph, program_hash = None if cache is None else cache.put_file(root_program_path))
+    profiler.count('new nodes')
+    if analytics is not None:
+        analytics.add_node(root_program_path)
+
+    profiler.gauge('node budget', max_nodes)
+    profiler.gauge('time budget', time_limit)
+
+    start_time = asyncio.get_running_loop().time()
+    profiler.gauge('exploration start', time.time())
+
+    def expand(node):
+        return asyncio.ensure_future(apply_passes_async(runner, node, passes, optimized_path, toolchain, cache, graph.nodes[node].get('hash'), profiler))
+
+    # Pass results of the next state, computed while the current one is deduped
+    prefetched = {}
+
+    try:
+        while queue:
+
+            node = queue.pop(0)
+            profiler.gauge('queue depth', len(queue))
+            profiler.count('nodes expanded')
+
+            expansion = prefetched.pop(node, None) or expand(node)
+
+            # Start on the next state right away, its opt runs overlap this state's llvm-diff runs
+            if queue and queue[0] not in prefetched:
+                prefetched[queue[0]] = expand(queue[0])
+
+            with profiler.stage('apply_pass'):
+                optimized_program_paths = await expansion
+
+            for opt_pass, optimized_program_path in zip(passes, optimized_program_paths):
+
+                # The pass failed on this program, there is no state to add
+                if optimized_program_path is None:
+                    continue
+
+                profiler.count('dedup lookups')
+                with profiler.stage('dedup compare'):
+                    equivalent, target = await find_equivalent_async(runner, optimized_program_path, graph, cache, profiler, chunk_size)
+
+                Exploration.insert_program(optimized_program_path, graph, node, opt_pass, queue, equivalent, target, profiler, analytics)
+
+            elapsed_time = asyncio.get_running_loop().time() - start_time
+            profiler.gauge('graph nodes', graph.number_of_nodes())
+            profiler.gauge('graph edges', graph.number_of_edges())
+            profiler.gauge('frontier', len(queue))
+
+            if elapsed_time > time_limit or graph.number_of_nodes() > max_nodes:
+                break
+    finally:
+        for expansion in prefetched.values():
+            expansion.cancel()
+        await asyncio.gather(*prefetched.values(), return_exceptions = True)
+
+    return graph
+
+
+def explore(root_program_path, passes, optimized_path, toolchain = None, cache = None, max_nodes = 10000, time_limit = 10000, profiler = None, limit = None, analytics = None):
+    """
+    Builds the same graph as Exploration.explore(), applying the passes on the next state while the current
+    one is deduped and running the llvm-diff comparisons of a lookup concurrently.
+
+    Parameter:
+    root_program_path (string): path to the LLVM IR file of the program
+    passes (list: string): passes applied on every state
+    optimized_path (string): path to the directory the optimized programs are stored in
+    toolchain (Toolchain): toolchain used, the binaries on PATH if None
+    cache (IRCache): cache shared with other explorations and toolchains
+    max_nodes (int): stop once the graph has more nodes than this
+    time_limit (float): stop once the exploration has run for longer than this, in seconds
+    profiler (Profiler): profiler recording the stages, cache hits and queue depth
+    limit (int): maximum number of tools running at once, one per core if None
+    analytics (GraphAnalytics): analytics kept up to date as the graph grows, None to not keep them
+
+    Return:
+    graph (DiGraph): graph of the program states, nodes are program paths and edges hold the passes in 'relationship'
+    """
+
+    return run(lambda: explore_async(root_program_path, passes, optimized_path, toolchain, cache, max_nodes, time_limit, profiler, limit, analytics),
+               lambda: Exploration.explore(root_program_path, passes, optimized_path, toolchain, cache, max_nodes, time_limit, profiler, analytics))
@@ -0,0 +1,572 @@
+# Benchmark suite of the tool itself. Times the exploration loop (with and without the IR cache), the dedup
+# lookup, the llvm-diff output parsing, the IR generation, the clustering, the export and the start up of
+# worker processes, and reports the operations per second and peak RSS of each. By default the LLVM tools
+# are the deterministic stand-ins of Fake_LLVM.py, so the numbers measure this code rather than LLVM; real
+# tools can be given instead. Timings and memory depend on the machine and its load, so they are only
+# reported. The run fails if a benchmark's deterministic values changed relative to the stored baseline:
+# its number of operations (tool runs, lookups, rows, ...) and its check value (graph sizes, clusters, ...).
+# The tool runs of the explorations are what the caches and the dedup tiers save, so the gate catches
+# those regressions on any machine.
+#
+# Usage: python Benchmark.py [--tools fake|real|<LLVM bin directory>] [--only <benchmark> ...]
+#                            [--baseline Benchmark_Baseline.json] [--save-baseline] [--repeat 3]
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import tempfile
+import subprocess
+import networkx as nx
+
+import Exploration
+import Fake_LLVM
+import IR_Cache
+import Pass_Registry
+import Profiling
+import Toolchain
+
+# Baseline compared against by default, next to this file
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Benchmark_Baseline.json')
+
+# Root program of the explorations with real tools
+SAMPLE_IR = '''; ModuleID = 'sample.c'
+source_filename = "sample.c"
+
+define dso_local i32 @sum(i32 %n) #0 {
+entry:
+  br label %loop
+
+loop:
+  %i = phi i32 [ 0, %entry ], [ %next, %loop ]
+  %total = phi i32 [ 0, %entry ], [ %add, %loop ]
+  %add = add nsw i32 %total, %i
+  %next = add nsw i32 %i, 1
+  %done = icmp sge i32 %next, %n
+  br i1 %done, label %exit, label %loop
+
+exit:
+  ret i32 %add
+}
+
+attributes #0 = { noinline nounwind uwtable }
+'''
+
+# Modules a worker process must not need to load, reported by the worker startup benchmark
+HEAVY_MODULES = ['bs4', 'matplotlib', 'networkx', 'numpy', 'pandas', 'pyarrow', 'pygraphviz', 'pyvis', 'scipy', 'sklearn']
+
+# What a worker imports to apply passes and compare programs
+WORKER_IMPORTS = 'import sys, Exploration, IR_Cache, Diff_Engine, Pass_Registry'
+
+# Source of the programs compiled by the IR generation benchmark
+SAMPLE_C = 'int f{0}(int n) {{ int total = 0; for (int i = 0; i < n; i++) total += i * {0}; return total; }}\n'
+
+
+def root_program(work_directory, fake):
+    """
+    Writes the program every exploration starts from.
+
+    Parameter:
+    work_directory (string): scratch directory of the benchmark
+    fake (bool): whether the tools are the fake ones, which only read their own states
+
+    Return:
+    path (string): path to the LLVM IR file
+    """
+
+    path = os.path.join(work_directory, 'root.ll')
+    with open(path, 'w') as file:
+        file.write(Fake_LLVM.render_state(0, 0) if fake else SAMPLE_IR)
+
+    return path
+
+
+def bench_explore(toolchain, work_directory, scale, fake):
+    """
+    Exploration without a cache, every new state is compared with llvm-diff against every node.
+
+    Return:
+    ops (int): opt and llvm-diff runs
+    seconds (float): time of the exploration
+    check (list: int): nodes and edges of the graph, opt runs and llvm-diff runs
+    """
+
+    profiler = Profiling.Profiler()
+    optimized_path = os.path.join(work_directory, 'optimized')
+    os.makedirs(optimized_path, exist_ok = True)
+
+    root = root_program(work_directory, fake)
+
+    start_time = time.perf_counter()
+    graph = Exploration.explore(root, Pass_Registry.LOOP_PASSES, optimized_path, toolchain, max_nodes = 6 * scale, profiler = profiler)
+    seconds = time.perf_counter() - start_time
+
+    opt_runs = profiler.counters.get('opt runs', 0)
+    diff_runs = profiler.counters.get('diff runs', 0)
+
+    return opt_runs + diff_runs, seconds, [graph.number_of_nodes(), graph.number_of_edges(), opt_runs, diff_runs]
+
+
+def bench_explore_async(toolchain, work_directory, scale, fake):
+    """
+    The uncached exploration with asyncio subprocesses, 4 tools at once. Its graph must match bench_explore()'s.
+
+    Return:
+    ops (int): opt and llvm-diff runs
+    seconds (float): time of the exploration
+    check (list: int): nodes and edges of the graph, opt runs and llvm-diff runs
+    """
+
+    import Async_Tools
+
+    profiler = Profiling.Profiler()
+    optimized_path = os.path.join(work_directory, 'optimized')
+    os.makedirs(optimized_path, exist_ok = True)
+    root = root_program(work_directory, fake)
+
+    start_time = time.perf_counter()
+    graph = Async_Tools.explore(root, Pass_Registry.LOOP_PASSES, optimized_path, toolchain, max_nodes = 6 * scale, profiler = profiler, limit = 4)
+    seconds = time.perf_counter() - start_time
+
+    opt_runs = profiler.counters.get('opt runs', 0)
+    diff_runs = profiler.counters.get('diff runs', 0)
+
+    return opt_runs + diff_runs, seconds, [graph.number_of_nodes(), graph.number_of_edges(), opt_runs, diff_runs]
+
+
+def bench_explore_cached(toolchain, work_directory, scale, fake):
+    """
+    An exploration on a fresh IR cache, then the same exploration repeated while served by the cached
+    transitions and verdicts. Only the repeats are timed.
+
+    Return:
+    ops (int): transitions looked up by the repeats
+    seconds (float): time of the repeats
+    check (list: int): nodes and edges of the graph, and the tool runs of the repeats (0 when every lookup hits)
+    """
+
+    cache = IR_Cache.IRCache(os.path.join(work_directory, 'cache.sqlite'))
+    optimized_path = os.path.join(work_directory, 'optimized')
+    os.makedirs(optimized_path, exist_ok = True)
+    root = root_program(work_directory, fake)
+
+    try:
+        cold = Profiling.Profiler()
+        Exploration.explore(root, Pass_Registry.LOOP_PASSES, optimized_path, toolchain, cache, max_nodes = 8 * scale, profiler = cold)
+
+        warm = Profiling.Profiler()
+        start_time = time.perf_counter()
+        for repeat in range(10):
+            graph = Exploration.explore(root, Pass_Registry.LOOP_PASSES, optimized_path, toolchain, cache, max_nodes = 8 * scale, profiler = warm)
+        seconds = time.perf_counter() - start_time
+    finally:
+        cache.close()
+
+    return warm.counters.get('dedup lookups', 0), seconds, [graph.number_of_nodes(), graph.number_of_edges(), warm.counters.get('opt runs', 0) + warm.counters.get('diff runs', 0)]
+
+
+def bench_dedup(toolchain, work_directory, scale, fake):
+    """
+    Dedup lookups by hash against a graph of distinct states, no tool runs.
+
+    Return:
+    ops (int): lookups
+    seconds (float): time of the lookups
+    check (int): lookups that found their state
+    """
+
+    cache = IR_Cache.IRCache(os.path.join(work_directory, 'cache.sqlite'))
+    states = 1000 * scale
+
+    try:
+        # A graph of distinct states, as explore() builds it
+        graph = nx.DiGraph()
+        paths = []
+        for state in range(states):
+            path = os.path.join(work_directory, 'state' + str(state) + '.ll')
+            with open(path, 'w') as file:
+                file.write(Fake_LLVM.render_state(state, 0))
+            graph.add_node(path, hash = cache.put_file(path))
+            paths.append(path)
+
+        found = 0
+        start_time = time.perf_counter()
+        for path in paths:
+            node, target = Exploration.find_equivalent(path, graph, toolchain, cache)
+            if node == path:
+                found += 1
+        seconds = time.perf_counter() - start_time
+    finally:
+        cache.close()
+
+    return states, seconds, found
+
+
+def bench_diff_parsing(toolchain, work_directory, scale, fake):
+    """
+    Parsing of a large synthetic llvm-diff output.
+
+    Return:
+    ops (int): lines parsed
+    seconds (float): time of the parsing
+    check (list: int): additions and deletions found
+    """
+
+    rng = random.Random(0)
+    lines = ['in function main:', '  in block %entry:']
+    for index in range(500000 * scale):
+        lines.append(rng.choice(['    > ', '    < ', '      ']) + '%' + str(index) + ' = add i32 %a, %b')
+
+    start_time = time.perf_counter()
+    differences = Exploration.analyze_differences(lines)
+    seconds = time.perf_counter() - start_time
+
+    return len(lines), seconds, [differences['Num Additions'], differences['Num Deletions']]
+
+
+def bench_ir_generation(toolchain, work_directory, scale, fake):
+    """
+    IR generation of a directory tree of C files.
+
+    Return:
+    ops (int): C files compiled, None if the toolchain has no clang
+    seconds (float): time of the IR generation
+    check (int): IR files generated
+    """
+
+    if toolchain.clang is None:
+        return None, None, None
+
+    source_directory = os.path.join(work_directory, 'sources')
+    ir_directory = os.path.join(work_directory, 'ir')
+    os.makedirs(ir_directory, exist_ok = True)
+
+    files = 10 * scale
+    for index in range(files):
+        directory = os.path.join(source_directory, 'group' + str(index % 3))
+        os.makedirs(directory, exist_ok = True)
+        with open(os.path.join(directory, 'program' + str(index) + '.c'), 'w') as file:
+            file.write(SAMPLE_C.format(index))
+
+    start_time = time.perf_counter()
+    Exploration.generate_ir(source_directory, ir_directory, toolchain)
+    seconds = time.perf_counter() - start_time
+
+    return files, seconds, len(os.listdir(ir_directory))
+
+
+def bench_clustering(toolchain, work_directory, scale, fake):
+    """
+    Clustering of a seeded programs x metrics matrix with 4 well separated groups.
+
+    Return:
+    ops (int): rows clustered
+    seconds (float): time of the clustering
+    check (int): number of clusters found
+    """
+
+    import numpy as np
+    import Corpus_Clustering
+
+    rng = np.random.default_rng(0)
+    rows = 5000 * scale
+    centers = rng.normal(0, 10, size = (4, 16))
+    matrix = centers[rng.integers(0, 4, size = rows)] + rng.normal(0, 1, size = (rows, 16))
+
+    start_time = time.perf_counter()
+    labels, k, scores = Corpus_Clustering.cluster_matrix(matrix, k_values = range(2, 7), sample_size = 2000)
+    seconds = time.perf_counter() - start_time
+
+    return rows, seconds, k
+
+
+def bench_export(toolchain, work_directory, scale, fake):
+    """
+    GML export of a synthetic exploration graph, then the Parquet partition of its pass metrics.
+
+    Return:
+    ops (int): nodes and rows written
+    seconds (float): time of the writes and the read back
+    check (list: int): nodes and edges read back from the GML file
+    """
+
+    import Results_Dataset
+
+    rng = random.Random(0)
+    nodes = 2000 * scale
+
+    graph = nx.DiGraph()
+    for node in range(nodes):
+        graph.add_node('P' + str(node), label = 'P' + str(node))
+    for node in range(1, nodes):
+        for opt_pass in rng.sample(Pass_Registry.LOOP_PASSES, 3):
+            parent = 'P' + str(rng.randrange(node))
+            if graph.has_edge(parent, 'P' + str(node)):
+                graph[parent]['P' + str(node)]['relationship'] += ',' + opt_pass
+            else:
+                graph.add_edge(parent, 'P' + str(node), relationship = opt_pass)
+
+    programs = ['program' + str(node) + '.c.ll' for node in range(nodes)]
+    metrics = {'Num Additions': [rng.random() for node in range(nodes)], 'Num Deletions': [rng.random() for node in range(nodes)]}
+
+    start_time = time.perf_counter()
+
+    gml_path = os.path.join(work_directory, 'graph.gml')
+    nx.write_gml(graph, gml_path)
+    read_graph = nx.read_gml(gml_path)
+
+    Results_Dataset.write_pass_partition(os.path.join(work_directory, 'dataset'), 'licm', programs, metrics, [node % 4 for node in range(nodes)])
+
+    seconds = time.perf_counter() - start_time
+
+    return 2 * nodes, seconds, [read_graph.number_of_nodes(), read_graph.number_of_edges()]
+
+
+def bench_worker_startup(toolchain, work_directory, scale, fake):
+    """
+    Start up of fresh worker processes importing the compute paths (apply, diff, dedup and explore).
+
+    Return:
+    ops (int): processes started
+    seconds (float): time of the start ups
+    check (list: string): heavy modules the compute paths loaded, should stay empty
+    """
+
+    package_directory = os.path.dirname(os.path.abspath(__file__))
+    processes = 20 * scale
+
+    start_time = time.perf_counter()
+    for process in range(processes):
+        subprocess.run([sys.executable, '-c', WORKER_IMPORTS], check = True, cwd = package_directory)
+    seconds = time.perf_counter() - start_time
+
+    outcome = subprocess.run([sys.executable, '-c', WORKER_IMPORTS + '; print(",".join(sorted(set(sys.modules) & set(' + repr(HEAVY_MODULES) + '))))'],
+                             capture_output = True, text = True, check = True, cwd = package_directory)
+
+    return processes, seconds, [module for module in outcome.stdout.strip().split(',') if module]
+
+
+# Every benchmark, in the order they run. A benchmark takes the toolchain, a scratch directory, the size
+# multiplier and whether the tools are fake, and returns its number of operations, the seconds they took
+# (setup excluded) and a check value. The operations and the check value must not change between runs
+BENCHMARKS = {
+    'explore': bench_explore,
+    'explore async': bench_explore_async,
+    'explore cached': bench_explore_cached,
+    'dedup': bench_dedup,
+    'diff parsing': bench_diff_parsing,
+    'ir generation': bench_ir_generation,
+    'clustering': bench_clustering,
+    'export': bench_export,
+    'worker startup': bench_worker_startup
+}
+
+
+def tools_toolchain(tools, directory):
+    """
+    Toolchain the benchmarks run with.
+
+    Parameter:
+    tools (string): 'fake', 'real' for the tools on PATH, or the bin directory or prefix of an LLVM install
+    directory (string): directory the fake tools are installed in
+
+    Return:
+    toolchain (Toolchain): the toolchain
+    """
+
+    if tools == 'fake':
+        return Toolchain.toolchain(Fake_LLVM.install(directory))
+    if tools == 'real':
+        return Toolchain.default_toolchain()
+    return Toolchain.toolchain(tools)
+
+
+def run_child(name, tools_path, scale, fake):
+    """
+    Runs one benchmark in this process and prints its result as JSON, so its peak RSS is its own.
+
+    Parameter:
+    name (string): name of the benchmark
+    tools_path (string): bin directory of the toolchain, 'real' for the tools on PATH
+    scale (int): size multiplier of the benchmark
+    fake (bool): whether the toolchain is the fake one
+
+    Return:
+    Nothing, prints the result
+    """
+
+    toolchain = Toolchain.default_toolchain() if tools_path == 'real' else Toolchain.toolchain(tools_path)
+
+    with tempfile.TemporaryDirectory(prefix = 'llvm-evolution-benchmark-') as work_directory:
+
+        ops, seconds, check = BENCHMARKS[name](toolchain, work_directory, scale, fake)
+
+    # ru_maxrss is in KB on Linux, in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak_rss //= 1024
+
+    print(json.dumps({'ops': ops, 'seconds': seconds, 'ops per second': None if ops is None else ops / max(seconds, 1e-9), 'peak rss kb': peak_rss, 'check': check}))
+
+
+def run_benchmark(name, tools_path, scale, fake):
+    """
+    Runs one benchmark in a fresh Python process.
+
+    Parameter:
+    name (string): name of the benchmark
+    tools_path (string): bin directory of the toolchain, 'real' for the tools on PATH
+    scale (int): size multiplier of the benchmark
+    fake (bool): whether the toolchain is the fake one
+
+    Return:
+    result (dict): ops, seconds, ops per second, peak rss kb and check value of the benchmark
+    """
+
+    command = [sys.executable, os.path.abspath(__file__), '--child', name, '--tools', tools_path, '--scale', str(scale)]
+    if fake:
+        command.append('--fake')
+
+    outcome = subprocess.run(command, capture_output = True, text = True, cwd = os.path.dirname(os.path.abspath(__file__)))
+
+    if outcome.returncode != 0:
+        raise RuntimeError('Benchmark ' + name + ' failed:\n' + outcome.stderr)
+
+    return json.loads(outcome.stdout.splitlines()[-1])
+
+
+def compare(results, baseline):
+    """
+    Finds the regressions of a run relative to the baseline. Only the deterministic values are compared,
+    timings and memory are not.
+
+    Parameter:
+    results (dict: dict): result of every benchmark run
+    baseline (dict: dict): operations and check value of every benchmark in the baseline
+
+    Return:
+    regressions (list: string): one description per regression, empty if there is none
+    """
+
+    regressions = []
+
+    for name, result in results.items():
+
+        if name not in baseline or result['ops'] is None or baseline[name]['ops'] is None:
+            continue
+        expected = baseline[name]
+
+        if result['ops'] != expected['ops']:
+            regressions.append('{}: {} operations, baseline {}'.format(name, result['ops'], expected['ops']))
+
+        if result['check'] != expected['check']:
+            regressions.append('{}: result changed from {} to {}'.format(name, expected['check'], result['check']))
+
+    return regressions
+
+
+def deterministic_values(results):
+    """
+    Values of a run that are the same on every machine, the content of a baseline.
+
+    Parameter:
+    results (dict: dict): result of every benchmark run
+
+    Return:
+    values (dict: dict): operations and check value of every benchmark
+    """
+
+    return {name: {'ops': result['ops'], 'check': result['check']} for name, result in results.items()}
+
+
+def parse_arguments():
+
+    parser = argparse.ArgumentParser(description = 'Benchmarks the exploration, dedup, diff parsing, IR generation, clustering and export code.')
+    parser.add_argument('--tools', default = 'fake', help = "'fake' for the deterministic stand-ins, 'real' for the LLVM tools on PATH, or the bin directory or prefix of an LLVM install")
+    parser.add_argument('--only', nargs = '+', choices = list(BENCHMARKS), default = None, help = 'benchmarks to run, all of them by default')
+    parser.add_argument('--scale', type = int, default = 1, help = 'size multiplier of every benchmark')
+    parser.add_argument('--baseline', default = BASELINE_PATH, help = 'baseline JSON file to compare against')
+    parser.add_argument('--save-baseline', action = 'store_true', help = 'replace the baseline with the operations and check values of this run')
+    parser.add_argument('--repeat', type = int, default = 3, help = 'runs of every benchmark, the fastest one is reported')
+    parser.add_argument('--output', default = None, help = 'JSON file the results, timings included, are written to')
+    parser.add_argument('--child', default = None, help = argparse.SUPPRESS)
+    parser.add_argument('--fake', action = 'store_true', help = argparse.SUPPRESS)
+
+    return parser.parse_args()
+
+
+def main():
+
+    arguments = parse_arguments()
+
+    if arguments.child is not None:
+        run_child(arguments.child, arguments.tools, arguments.scale, arguments.fake)
+        return
+
+    fake = arguments.tools == 'fake'
+    names = arguments.only or list(BENCHMARKS)
+
+    with tempfile.TemporaryDirectory(prefix = 'llvm-evolution-tools-') as tools_directory:
+
+        toolchain = tools_toolchain(arguments.tools, tools_directory)
+        tools_path = 'real' if arguments.tools == 'real' else os.path.dirname(toolchain.opt)
+
+        results = {}
+        unstable = []
+        for name in names:
+
+            # Report the fastest run, the others were slowed down by noise
+            runs = [run_benchmark(name, tools_path, arguments.scale, fake) for repeat in range(arguments.repeat)]
+            result = max(runs, key = lambda run: run['ops per second'] or 0)
+            results[name] = result
+
+            # The deterministic values must be the same in every run
+            if any((run['ops'], run['check']) != (result['ops'], result['check']) for run in runs):
+                unstable.append('{}: runs differ, {}'.format(name, [[run['ops'], run['check']] for run in runs]))
+
+            if result['ops'] is None:
+                print('{:<16} skipped'.format(name))
+            else:
+                print('{:<16} {:>12.1f} ops/s {:>10} KB peak RSS {:>8.2f}s'.format(name, result['ops per second'], result['peak rss kb'], result['seconds']))
+
+    report = {'tools': arguments.tools, 'toolchain': toolchain.key, 'scale': arguments.scale, 'python': sys.version.split()[0], 'results': results}
+
+    if arguments.output is not None:
+        with open(arguments.output, 'w') as file:
+            json.dump(report, file, indent = 2)
+
+    for instability in unstable:
+        print('UNSTABLE ' + instability)
+
+    if arguments.save_baseline:
+        if unstable:
+            sys.exit(1)
+        with open(arguments.baseline, 'w') as file:
+            json.dump({'tools': arguments.tools, 'scale': arguments.scale, 'results': deterministic_values(results)}, file, indent = 2)
+        return
+
+    if not os.path.exists(arguments.baseline):
+        sys.exit(1 if unstable else 0)
+
+    with open(arguments.baseline, 'r') as file:
+        baseline = json.load(file)
+
+    # Numbers of other tools or sizes aren't comparable
+    if baseline['tools'] != arguments.tools or baseline['scale'] != arguments.scale:
+        print('Baseline is for --tools {} --scale {}, not compared'.format(baseline['tools'], baseline['scale']))
+        sys.exit(1 if unstable else 0)
+
+    regressions = compare(results, baseline['results'])
+
+    for regression in regressions:
+        print('REGRESSION ' + regression)
+
+    if regressions or unstable:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
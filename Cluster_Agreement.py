@@ -0,0 +1,316 @@
+# Graded agreement between the per-pass clusterings of LLVM-DIFF.py. The clusters are loaded as a
+# programs x passes integer label matrix, every pair of passes is compared with the adjusted Rand index
+# and normalized mutual information, and near-identical programs are grouped with MinHash signatures and
+# locality sensitive hashing instead of comparing every pair of programs.
+
+import csv
+import sys
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+import Results_Dataset
+
+# Label of a program that is missing from a pass
+MISSING = -1
+
+# Prime modulus of the MinHash hash functions, small enough for products to fit in 64 bits
+PRIME = 2147483647
+
+
+def label_matrix(dataset_root, passes = None):
+    """
+    Loads the cluster of every program for every pass from the results dataset as an integer matrix.
+
+    Parameter:
+    dataset_root (string): path to the root directory of the results dataset
+    passes (list: string): passes to load, all of them if None
+
+    Return:
+    programs (list: string): program name of every row
+    pass_names (list: string): pass name of every column
+    labels (ndarray): int32 matrix of shape (programs, passes), MISSING where a program has no cluster
+    """
+
+    filter = None if passes is None else Results_Dataset.pass_filter(passes)
+    table = Results_Dataset.read_table(dataset_root, columns = [Results_Dataset.PROGRAM, Results_Dataset.PASS, Results_Dataset.CLUSTER], filter = filter)
+
+    # Row and column of every record
+    programs, rows = np.unique(np.asarray(table.column(Results_Dataset.PROGRAM).to_pylist(), dtype = object).astype(str), return_inverse = True)
+    pass_names, columns = np.unique(np.asarray(table.column(Results_Dataset.PASS).to_pylist(), dtype = object).astype(str), return_inverse = True)
+
+    labels = np.full((len(programs), len(pass_names)), MISSING, dtype = np.int32)
+    labels[rows, columns] = table.column(Results_Dataset.CLUSTER).to_numpy()
+
+    return programs.tolist(), pass_names.tolist(), labels
+
+
+def label_matrix_from_clusters(program_clusters):
+    """
+    Builds the label matrix from the program clusters of Analyze_Clusters.store_clusters(), where the i-th
+    cluster of every program belongs to the i-th pass.
+
+    Parameter:
+    program_clusters (dict: list): clusters of every program, one per pass
+
+    Return:
+    programs (list: string): program name of every row
+    labels (ndarray): int32 matrix of shape (programs, passes), MISSING where a program has fewer clusters
+    """
+
+    programs = list(program_clusters)
+    num_passes = max((len(clusters) for clusters in program_clusters.values()), default = 0)
+
+    labels = np.full((len(programs), num_passes), MISSING, dtype = np.int32)
+    for row, program in enumerate(programs):
+        clusters = program_clusters[program]
+        labels[row, :len(clusters)] = [int(cluster) for cluster in clusters]
+
+    return programs, labels
+
+
+def contingency(first, second):
+    """
+    Contingency table of two labelings of the same programs, ignoring programs missing from either.
+
+    Parameter:
+    first (ndarray): labels of the first pass
+    second (ndarray): labels of the second pass
+
+    Return:
+    table (ndarray): table[i][j] is the number of programs with label i in first and j in second
+    """
+
+    present = (first != MISSING) & (second != MISSING)
+    first = first[present]
+    second = second[present]
+
+    if len(first) == 0:
+        return np.zeros((1, 1), dtype = np.int64)
+
+    width = int(second.max()) + 1
+    counts = np.bincount(first.astype(np.int64) * width + second, minlength = (int(first.max()) + 1) * width)
+
+    return counts.reshape(-1, width)
+
+
+def adjusted_rand_index(table):
+    """
+    Adjusted Rand index of two labelings from their contingency table.
+
+    Parameter:
+    table (ndarray): contingency table
+
+    Return:
+    ari (float): 1 for identical partitions, around 0 for independent ones
+    """
+
+    def pairs(counts):
+        counts = counts.astype(np.float64)
+        return (counts * (counts - 1) / 2).sum()
+
+    total_pairs = pairs(np.array([table.sum()]))
+    index = pairs(table)
+    first_pairs = pairs(table.sum(axis = 1))
+    second_pairs = pairs(table.sum(axis = 0))
+
+    if total_pairs == 0:
+        return 1.0
+
+    expected = first_pairs * second_pairs / total_pairs
+    maximum = (first_pairs + second_pairs) / 2
+
+    # Both partitions put everything together or everything apart
+    if maximum == expected:
+        return 1.0
+
+    return float((index - expected) / (maximum - expected))
+
+
+def normalized_mutual_information(table):
+    """
+    Mutual information of two labelings normalized by the mean of their entropies, from their contingency table.
+
+    Parameter:
+    table (ndarray): contingency table
+
+    Return:
+    nmi (float): 1 for identical partitions, 0 for independent ones
+    """
+
+    total = table.sum()
+    if total == 0:
+        return 1.0
+
+    joint = table[table > 0] / total
+    first = table.sum(axis = 1) / total
+    second = table.sum(axis = 0) / total
+
+    first_entropy = -(first[first > 0] * np.log(first[first > 0])).sum()
+    second_entropy = -(second[second > 0] * np.log(second[second > 0])).sum()
+
+    # Both labelings put every program in one cluster
+    if first_entropy == 0 and second_entropy == 0:
+        return 1.0
+
+    rows, columns = np.nonzero(table)
+    mutual_information = (joint * np.log(joint / (first[rows] * second[columns]))).sum()
+
+    return float(mutual_information / ((first_entropy + second_entropy) / 2))
+
+
+def pairwise_agreement(labels):
+    """
+    Adjusted Rand index and normalized mutual information between every pair of passes.
+
+    Parameter:
+    labels (ndarray): label matrix of shape (programs, passes)
+
+    Return:
+    ari (ndarray): symmetric (passes x passes) matrix of adjusted Rand indices
+    nmi (ndarray): symmetric (passes x passes) matrix of normalized mutual information
+    """
+
+    num_passes = labels.shape[1]
+    ari = np.ones((num_passes, num_passes))
+    nmi = np.ones((num_passes, num_passes))
+
+    for i in range(num_passes):
+        for j in range(i + 1, num_passes):
+            table = contingency(labels[:, i], labels[:, j])
+            ari[i, j] = ari[j, i] = adjusted_rand_index(table)
+            nmi[i, j] = nmi[j, i] = normalized_mutual_information(table)
+
+    return ari, nmi
+
+
+def minhash_signatures(labels, num_hashes = 64, seed = 0):
+    """
+    MinHash signature of every program's set of (pass, label) tokens. The fraction of equal signature entries
+    of two programs estimates the Jaccard similarity of their token sets.
+
+    Parameter:
+    labels (ndarray): label matrix of shape (programs, passes)
+    num_hashes (int): length of the signatures
+    seed (int): seed of the hash functions
+
+    Return:
+    signatures (ndarray): int32 matrix of shape (programs, num_hashes)
+    """
+
+    random = np.random.default_rng(seed)
+    multipliers = random.integers(1, PRIME, size = num_hashes, dtype = np.int64)
+    offsets = random.integers(0, PRIME, size = num_hashes, dtype = np.int64)
+
+    # Hash of every possible (pass, label) token, computed once. Row 0 of every pass is the MISSING label
+    width = int(labels.max(initial = 0)) + 2
+    tokens = np.arange(labels.shape[1] * width, dtype = np.int64).reshape(labels.shape[1], width, 1)
+    token_hashes = ((tokens * multipliers + offsets) % PRIME).astype(np.int32)
+
+    # Minimum over the passes of the hash of each program's token, one pass at a time
+    signatures = np.full((labels.shape[0], num_hashes), PRIME, dtype = np.int32)
+    for pass_index in range(labels.shape[1]):
+        np.minimum(signatures, token_hashes[pass_index][labels[:, pass_index] + 1], out = signatures)
+
+    return signatures
+
+
+def near_identical_groups(programs, labels, threshold = 0.9, num_hashes = 64, bands = 16, seed = 0):
+    """
+    Groups programs whose per-pass clusters are near identical. Programs sharing a band of their MinHash
+    signature become candidates, candidates are kept if their estimated similarity is at least threshold,
+    and groups are the connected components of the kept pairs. No pair of programs is compared unless LSH
+    puts them in the same bucket.
+
+    Parameter:
+    programs (list: string): program name of every row
+    labels (ndarray): label matrix of shape (programs, passes)
+    threshold (float): minimum estimated Jaccard similarity of two programs in a group
+    num_hashes (int): length of the signatures
+    bands (int): number of LSH bands, num_hashes must be a multiple of it
+    seed (int): seed of the hash functions
+
+    Return:
+    groups (list: list): groups of at least 2 program names, largest first
+    """
+
+    signatures = minhash_signatures(labels, num_hashes, seed)
+    rows_per_band = num_hashes // bands
+
+    # Random weights folding each band into a single 64 bit bucket key, wrapping on overflow
+    weights = np.random.default_rng(seed + 1).integers(1, 2 ** 62, size = rows_per_band, dtype = np.int64).astype(np.uint64)
+
+    sources = []
+    targets = []
+
+    for band in range(bands):
+
+        # Bucket of every program for this band
+        band_signatures = signatures[:, band * rows_per_band:(band + 1) * rows_per_band].astype(np.uint64)
+        keys = (band_signatures * weights).sum(axis = 1)
+        representatives, buckets = np.unique(keys, return_index = True, return_inverse = True)[1:]
+
+        # Candidate pair between every program and the first program of its bucket
+        members = np.nonzero(representatives[buckets] != np.arange(len(programs)))[0]
+        firsts = representatives[buckets[members]]
+
+        # Keep the candidates that are similar enough
+        similarity = (signatures[members] == signatures[firsts]).mean(axis = 1)
+        sources.append(members[similarity >= threshold])
+        targets.append(firsts[similarity >= threshold])
+
+    sources = np.concatenate(sources) if sources else np.zeros(0, dtype = np.int64)
+    targets = np.concatenate(targets) if targets else np.zeros(0, dtype = np.int64)
+
+    graph = coo_matrix((np.ones(len(sources)), (sources, targets)), shape = (len(programs), len(programs)))
+    num_components, components = connected_components(graph, directed = False)
+
+    groups = {}
+    for row, component in enumerate(components):
+        groups.setdefault(component, []).append(programs[row])
+
+    return sorted((group for group in groups.values() if len(group) > 1), key = len, reverse = True)
+
+
+def write_agreement(csv_path, pass_names, ari, nmi):
+    """
+    Outputs the agreement between every pair of passes to a csv file.
+
+    Parameter:
+    csv_path (string): path of the csv file
+    pass_names (list: string): pass name of every row and column of the matrices
+    ari (ndarray): adjusted Rand index matrix
+    nmi (ndarray): normalized mutual information matrix
+
+    Return:
+    Nothing, generates the csv file
+    """
+
+    with open(csv_path, mode = 'w', newline = '') as file:
+
+        writer = csv.writer(file)
+        writer.writerow(['First Pass', 'Second Pass', 'Adjusted Rand Index', 'Normalized Mutual Information'])
+
+        for i in range(len(pass_names)):
+            for j in range(i + 1, len(pass_names)):
+                writer.writerow([pass_names[i], pass_names[j], ari[i, j], nmi[i, j]])
+
+
+def main():
+
+    # Columnar results dataset written by LLVM-DIFF.py
+    dataset_root = sys.argv[1] if len(sys.argv) > 1 else '/Users/ahmedelzaria/Documents/LLVM/llvm-diff-dataset'
+
+    programs, pass_names, labels = label_matrix(dataset_root)
+
+    # Agreement between every pair of passes
+    ari, nmi = pairwise_agreement(labels)
+    write_agreement('/Users/ahmedelzaria/Documents/LLVM/Cluster_Agreement.csv', pass_names, ari, nmi)
+
+    # Groups of programs that behave near identically across passes
+    for group in near_identical_groups(programs, labels):
+        print(group)
+
+
+if __name__ == '__main__':
+    main()
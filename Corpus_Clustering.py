@@ -0,0 +1,272 @@
+# Clustering stage of LLVM-DIFF.py. Builds one programs x (passes x metrics) matrix for the whole corpus
+# in a memory-mapped file, then clusters it out of core with MiniBatchKMeans. The number of clusters is
+# picked automatically with a silhouette score on a random sample of the rows, and every random choice is
+# seeded so the same corpus always gets the same clusters.
+
+import csv
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+
+import IR_Features
+
+# Metrics read from the llvm-diff csv of every pass
+METRICS = ['Num Additions', 'Num Deletions']
+
+# Number of rows processed at once when streaming over the matrix
+CHUNK_ROWS = 65536
+
+
+def build_corpus_matrix(pass_csv_paths, matrix_path, metrics = METRICS):
+    """
+    Builds the programs x (passes x metrics) matrix from the llvm-diff csv of every pass. Rows are streamed
+    from the csv files straight into a memory-mapped array, so only the program index is kept in memory.
+
+    Parameter:
+    pass_csv_paths (list: tuple): (pass name, path to the pass's metrics csv) for every pass
+    matrix_path (string): path of the .npy file that will hold the matrix
+    metrics (list: string): csv columns used for every pass
+
+    Return:
+    programs (list: string): program name of every row
+    columns (list: string): '<pass> <metric>' name of every column
+    matrix (memmap): matrix of shape (programs, passes x metrics), NaN where a program is missing from a pass
+    """
+
+    # The first pass defines the program order
+    with open(pass_csv_paths[0][1], 'r') as file:
+        programs = [row['Original File'] for row in csv.DictReader(file)]
+    program_index = {program: row for row, program in enumerate(programs)}
+
+    columns = [pass_name + ' ' + metric for pass_name, csv_path in pass_csv_paths for metric in metrics]
+
+    matrix = np.lib.format.open_memmap(matrix_path, mode = 'w+', dtype = np.float32, shape = (len(programs), len(columns)))
+    matrix[:] = np.nan
+
+    # Fill the block of columns of every pass
+    for pass_number, (pass_name, csv_path) in enumerate(pass_csv_paths):
+
+        first_column = pass_number * len(metrics)
+
+        with open(csv_path, 'r') as file:
+            for row in csv.DictReader(file):
+                program_row = program_index.get(row['Original File'])
+                if program_row is not None:
+                    matrix[program_row, first_column:first_column + len(metrics)] = [float(row[metric]) for metric in metrics]
+
+    matrix.flush()
+
+    return programs, columns, matrix
+
+
+def build_feature_matrix(pass_feature_paths, matrix_path):
+    """
+    Builds the programs x (passes x features) matrix from the IR feature matrices saved for every pass.
+
+    Parameter:
+    pass_feature_paths (list: tuple): (pass name, path to the pass's features .npz) for every pass
+    matrix_path (string): path of the .npy file that will hold the matrix
+
+    Return:
+    programs (list: string): program name of every row
+    columns (list: string): '<pass> <feature>' name of every column
+    matrix (memmap): matrix of shape (programs, passes x features), NaN where a program is missing from a pass
+    """
+
+    # The first pass defines the program order
+    programs, features, feature_names = IR_Features.load_features(pass_feature_paths[0][1])
+    program_index = {program: row for row, program in enumerate(programs)}
+
+    columns = [pass_name + ' ' + feature_name for pass_name, npz_path in pass_feature_paths for feature_name in feature_names]
+
+    matrix = np.lib.format.open_memmap(matrix_path, mode = 'w+', dtype = np.float32, shape = (len(programs), len(columns)))
+    matrix[:] = np.nan
+
+    # Copy the block of columns of every pass, one pass in memory at a time
+    for pass_number, (pass_name, npz_path) in enumerate(pass_feature_paths):
+
+        pass_programs, features, feature_names = IR_Features.load_features(npz_path)
+        rows = np.array([program_index.get(program, -1) for program in pass_programs])
+        found = rows >= 0
+
+        first_column = pass_number * len(feature_names)
+        matrix[rows[found], first_column:first_column + len(feature_names)] = features[found]
+
+    matrix.flush()
+
+    return programs, columns, matrix
+
+
+def column_statistics(matrix):
+    """
+    Mean and standard deviation of every column, computed one chunk of rows at a time. Missing values are ignored.
+
+    Parameter:
+    matrix (ndarray or memmap): programs x columns matrix
+
+    Return:
+    mean (ndarray): mean of every column
+    std (ndarray): standard deviation of every column, 1 for constant columns
+    """
+
+    count = np.zeros(matrix.shape[1])
+    total = np.zeros(matrix.shape[1])
+    total_squares = np.zeros(matrix.shape[1])
+
+    for start in range(0, matrix.shape[0], CHUNK_ROWS):
+        chunk = np.asarray(matrix[start:start + CHUNK_ROWS], dtype = np.float64)
+        present = ~np.isnan(chunk)
+        chunk = np.where(present, chunk, 0.0)
+        count += present.sum(axis = 0)
+        total += chunk.sum(axis = 0)
+        total_squares += (chunk * chunk).sum(axis = 0)
+
+    count = np.maximum(count, 1)
+    mean = total / count
+    std = np.sqrt(np.maximum(total_squares / count - mean * mean, 0.0))
+    std[std == 0] = 1.0
+
+    return mean, std
+
+
+def scale(chunk, mean, std):
+    """
+    Standardizes a chunk of rows, missing values become the column mean (0 once scaled).
+
+    Parameter:
+    chunk (ndarray): rows of the matrix
+    mean (ndarray): mean of every column
+    std (ndarray): standard deviation of every column
+
+    Return:
+    scaled (ndarray): standardized rows
+    """
+
+    scaled = (np.asarray(chunk, dtype = np.float64) - mean) / std
+
+    return np.nan_to_num(scaled, nan = 0.0)
+
+
+def choose_k(matrix, mean, std, k_values = range(2, 11), sample_size = 10000, seed = 0):
+    """
+    Picks the number of clusters with the best silhouette score on a random sample of the rows.
+
+    Parameter:
+    matrix (ndarray or memmap): programs x columns matrix
+    mean (ndarray): mean of every column
+    std (ndarray): standard deviation of every column
+    k_values (iterable: int): candidate numbers of clusters
+    sample_size (int): number of rows sampled for scoring
+    seed (int): seed of the sampling and of the clustering
+
+    Return:
+    best_k (int): number of clusters with the highest score
+    scores (dict: float): silhouette score of every candidate that could be scored
+    """
+
+    random = np.random.default_rng(seed)
+
+    # Sorted sample indices keep the reads of a memory-mapped matrix sequential
+    sample_rows = np.sort(random.choice(matrix.shape[0], size = min(sample_size, matrix.shape[0]), replace = False))
+    sample = scale(matrix[sample_rows], mean, std)
+
+    scores = {}
+
+    for k in k_values:
+
+        # Silhouette needs at least 2 clusters and fewer clusters than samples
+        if k < 2 or k >= len(sample):
+            continue
+
+        labels = MiniBatchKMeans(n_clusters = k, random_state = seed, n_init = 3).fit_predict(sample)
+        if len(set(labels)) < 2 or len(set(labels)) >= len(sample):
+            continue
+
+        scores[k] = float(silhouette_score(sample, labels, random_state = seed))
+
+    # Too few distinct programs to score anything
+    if len(scores) == 0:
+        return 1, scores
+
+    best_k = max(scores, key = lambda k: scores[k])
+
+    return best_k, scores
+
+
+def cluster_matrix(matrix, k = None, k_values = range(2, 11), seed = 0, batch_size = 4096, sample_size = 10000):
+    """
+    Clusters the rows of a matrix that may be larger than memory. The model is trained with partial_fit on
+    chunks of rows and the labels are predicted chunk by chunk.
+
+    Parameter:
+    matrix (ndarray or memmap): programs x columns matrix
+    k (int): number of clusters, chosen automatically with choose_k() if None
+    k_values (iterable: int): candidate numbers of clusters when k is None
+    seed (int): seed of every random choice
+    batch_size (int): number of rows per partial_fit call
+    sample_size (int): number of rows sampled to choose k
+
+    Return:
+    labels (ndarray): cluster of every row
+    k (int): number of clusters used
+    scores (dict: float): silhouette score of every candidate k, empty if k was given
+    """
+
+    labels = np.zeros(matrix.shape[0], dtype = np.int32)
+
+    mean, std = column_statistics(matrix)
+
+    scores = {}
+    if k is None:
+        k, scores = choose_k(matrix, mean, std, k_values, sample_size, seed)
+
+    # Nothing to separate
+    if k <= 1 or matrix.shape[0] <= k:
+        return labels, 1, scores
+
+    model = MiniBatchKMeans(n_clusters = k, random_state = seed, batch_size = batch_size, n_init = 3)
+
+    # Visit the batches in a seeded random order so clusters don't depend on the program order
+    batch_starts = np.arange(0, matrix.shape[0], batch_size)
+    np.random.default_rng(seed).shuffle(batch_starts)
+
+    # The first call needs at least k rows
+    pending = None
+    for start in batch_starts:
+        batch = scale(matrix[start:start + batch_size], mean, std)
+        pending = batch if pending is None else np.vstack([pending, batch])
+        if len(pending) >= k:
+            model.partial_fit(pending)
+            pending = None
+
+    # Rows left over after the last full batch
+    if pending is not None:
+        model.partial_fit(pending)
+
+    # Predict the labels one chunk at a time
+    for start in range(0, matrix.shape[0], CHUNK_ROWS):
+        labels[start:start + CHUNK_ROWS] = model.predict(scale(matrix[start:start + CHUNK_ROWS], mean, std))
+
+    return labels, k, scores
+
+
+def write_clusters(csv_path, programs, labels):
+    """
+    Outputs the program name and cluster of every row to a csv file.
+
+    Parameter:
+    csv_path (string): path of the csv file
+    programs (list: string): program name of every row
+    labels (ndarray): cluster of every row
+
+    Return:
+    Nothing, generates the csv file
+    """
+
+    with open(csv_path, mode = 'w', newline = '') as file:
+
+        writer = csv.writer(file)
+        writer.writerow(['Program Name', 'Cluster'])
+
+        for program, label in zip(programs, labels):
+            writer.writerow([program, int(label)])
@@ -0,0 +1,118 @@
+# Concurrent llvm-diff sweep shared by LLVM-DIFF.py and Optimize_Pass2.py. The work is bound by the
+# llvm-diff subprocesses, so a thread pool is enough to keep every core busy. The number of jobs in
+# flight is bounded and results come back in the order the pairs were given, so csv output stays
+# deterministic no matter which diff finishes first.
+
+import os
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def default_jobs():
+    """
+    Default number of concurrent jobs, one per core.
+
+    Return:
+    jobs (int): number of cores available
+    """
+
+    return os.cpu_count() or 1
+
+
+def ordered_map(function, items, jobs = 1, max_in_flight = None):
+    """
+    Applies a function to every item on a thread pool and yields the results in the order of the items.
+    Items are pulled lazily in the calling thread and at most max_in_flight of them are pending at once.
+
+    Parameter:
+    function (callable): function applied to every item
+    items (iterable): items to process
+    jobs (int): number of worker threads, 1 runs everything in the calling thread
+    max_in_flight (int): maximum number of pending items, twice the number of jobs by default
+
+    Return:
+    result: the result of function for each item, in order
+    """
+
+    # Serial sweep, no threads involved
+    if jobs <= 1:
+        for item in items:
+            yield function(item)
+        return
+
+    if max_in_flight is None:
+        max_in_flight = 2 * jobs
+
+    # Pending results, oldest first
+    in_flight = deque()
+
+    with ThreadPoolExecutor(max_workers = jobs) as executor:
+
+        for item in items:
+
+            in_flight.append(executor.submit(function, item))
+
+            # Wait for the oldest job once the bound is reached
+            if len(in_flight) >= max_in_flight:
+                yield in_flight.popleft().result()
+
+        # Drain the remaining jobs
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def stream_llvm_diff(original_path, optimized_path, llvm_diff = 'llvm-diff'):
+    """
+    Runs the llvm-diff command on 2 corresponding files and yields its output line by line
+
+    Parameter:
+    original_path (string): Path to the LLVM IR file that wasn't optimized
+    optimized_path (string): Path to the LLVM IR file that was optimized
+    llvm_diff (string): llvm-diff binary to run, the one on PATH by default
+
+    Return:
+    line (string): Each line of the command's output, without the trailing newline
+    """
+
+    # llvm-diff reports the differences on stderr
+    with subprocess.Popen([llvm_diff, original_path, optimized_path], stdout = subprocess.DEVNULL, stderr = subprocess.PIPE, text = True) as process:
+        for line in process.stderr:
+            yield line.rstrip('\n')
+
+
+def llvm_diff_lines(original_path, optimized_path, llvm_diff = 'llvm-diff'):
+    """
+    Runs the llvm-diff command on 2 corresponding files and keeps only the addition and deletion lines,
+    everything else in the output is dropped as it is read.
+
+    Parameter:
+    original_path (string): Path to the LLVM IR file that wasn't optimized
+    optimized_path (string): Path to the LLVM IR file that was optimized
+    llvm_diff (string): llvm-diff binary to run, the one on PATH by default
+
+    Return:
+    diff_lines (list: string): Lines of the output starting with '>' or '<'
+    """
+
+    return [line for line in stream_llvm_diff(original_path, optimized_path, llvm_diff) if line.strip().startswith(('>', '<'))]
+
+
+def diff_sweep(pairs, jobs = 1, max_in_flight = None, llvm_diff = 'llvm-diff'):
+    """
+    Runs llvm-diff on every pair of files concurrently.
+
+    Parameter:
+    pairs (iterable: tuple): (original path, optimized path) pairs, pulled lazily
+    jobs (int): number of concurrent llvm-diff processes
+    max_in_flight (int): maximum number of pending pairs, twice the number of jobs by default
+    llvm_diff (string): llvm-diff binary to run, the one on PATH by default
+
+    Return:
+    (pair, diff_lines) (tuple): each pair with its addition and deletion lines, in the order of the pairs
+    """
+
+    def diff_pair(pair):
+        return pair, llvm_diff_lines(pair[0], pair[1], llvm_diff)
+
+    return ordered_map(diff_pair, pairs, jobs, max_in_flight)
@@ -0,0 +1,593 @@
+# Exploration spread over many machines. A coordinator owns the graph, the dedup index (the IR cache) and
+# the frontier, and hands out (program, pass) jobs in leased batches. Workers pull a batch with the IR of its
+# programs, run opt, and push back the hash and canonical IR of every result. A lease that isn't completed
+# in time goes back to the frontier, so the jobs of a dead worker are run by another one. Results are merged
+# in the same order as Exploration.explore() does, so the graph doesn't depend on the number of workers.
+#
+# The transport is any object with the coordinator's lease() and complete() methods: the coordinator itself
+# for worker threads in the same process, or a proxy served over a socket by multiprocessing.managers for
+# worker processes on this or other machines. The socket accepts pickled calls, so only clients presenting
+# the coordinator's key are served: a random one unless given, which the workers read from the
+# LLVM_EVOLUTION_AUTHKEY environment variable so it doesn't show up in their command line.
+#
+# Usage: LLVM_EVOLUTION_AUTHKEY=<key> python Distributed_Exploration.py worker --address <host>:<port>
+#                                     [--tools <LLVM bin directory>] [--batch-size 8] [--work-directory <path>]
+
+import os
+import sys
+import zlib
+import time
+import socket
+import secrets
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import deque
+from multiprocessing.managers import BaseManager
+
+import Exploration
+import IR_Cache
+import Profiling
+import Toolchain
+
+# Environment variable holding the key of the coordinator
+AUTHKEY_VARIABLE = 'LLVM_EVOLUTION_AUTHKEY'
+
+
+class Coordinator:
+    """
+    Owns the explorations and leases their jobs to workers. Safe to share between threads, explore() runs
+    in the caller's thread while workers call lease() and complete() from theirs.
+
+    Parameter:
+    cache (IRCache): cache holding the programs, the transitions and the llvm-diff verdicts
+    toolchain (Toolchain): toolchain of the workers, its llvm-diff is used for dedup
+    profiler (Profiler): profiler recording the stages and counters, None to not profile
+    lease_seconds (float): seconds a worker has to complete a batch before its jobs are handed out again
+    window (int): number of states expanded ahead of the one being merged, so workers always have jobs
+    """
+
+    def __init__(self, cache, toolchain, profiler = None, lease_seconds = 300, window = 16):
+
+        self.cache = cache
+        self.toolchain = toolchain
+        self.profiler = Profiling.active(profiler)
+        self.lease_seconds = lease_seconds
+        self.window = window
+
+        self.condition = threading.Condition()
+        self.closed = False
+
+        # Job id to (source hash, pass), for the jobs of the current exploration without a result
+        self.jobs = {}
+
+        # Job ids waiting for a worker, oldest first
+        self.pending = deque()
+
+        # Lease id to the job ids, deadline and worker of every batch handed out
+        self.leases = {}
+
+        # Job id to the hash of the resulting program, None if opt failed
+        self.results = {}
+
+        self.next_job = 0
+        self.next_lease = 0
+
+    def submit(self, source, opt_pass):
+        """
+        Queues a job for the workers.
+
+        Parameter:
+        source (string): content address of the program
+        opt_pass (string): pass to apply on it
+
+        Return:
+        job (int): id of the job
+        """
+
+        with self.condition:
+            job = self.next_job
+            self.next_job += 1
+            self.jobs[job] = (source, opt_pass)
+            self.pending.append(job)
+            self.condition.notify_all()
+
+        return job
+
+    def reap(self):
+        """
+        Hands the jobs of expired leases out again. Called with the condition held.
+
+        Return:
+        Nothing, moves the jobs back to the front of the pending jobs
+        """
+
+        now = time.time()
+
+        for lease, (jobs, deadline, worker) in list(self.leases.items()):
+            if deadline < now:
+                del self.leases[lease]
+                self.pending.extendleft(reversed([job for job in jobs if job in self.jobs and job not in self.results]))
+                self.profiler.count('leases expired')
+
+    def lease(self, worker, toolchain_key, batch_size = 8):
+        """
+        Leases a batch of jobs to a worker.
+
+        Parameter:
+        worker (string): name of the worker, for diagnostics
+        toolchain_key (string): key of the worker's toolchain, must be the coordinator's
+        batch_size (int): maximum number of jobs in the batch
+
+        Return:
+        batch (dict): 'lease' id, 'jobs' as (job id, source hash, pass) and zlib compressed IR of every
+                      source in 'sources'. No jobs if there is nothing to do yet, None once closed
+        """
+
+        if toolchain_key != self.toolchain.key:
+            raise ValueError('Worker ' + worker + ' runs toolchain ' + toolchain_key + ', the coordinator ' + self.toolchain.key)
+
+        with self.condition:
+
+            if self.closed:
+                return None
+
+            self.reap()
+
+            jobs = []
+            while self.pending and len(jobs) < batch_size:
+                job = self.pending.popleft()
+                if job in self.jobs and job not in self.results:
+                    jobs.append(job)
+
+            if not jobs:
+                return {'lease': None, 'jobs': [], 'sources': {}}
+
+            lease = self.next_lease
+            self.next_lease += 1
+            self.leases[lease] = (jobs, time.time() + self.lease_seconds, worker)
+            batch_jobs = [(job, self.jobs[job][0], self.jobs[job][1]) for job in jobs]
+
+        self.profiler.count('leases')
+
+        sources = {source: zlib.compress(self.cache.get_ir(source).encode()) for job, source, opt_pass in batch_jobs}
+
+        return {'lease': lease, 'jobs': batch_jobs, 'sources': sources}
+
+    def complete(self, lease, results):
+        """
+        Receives the results of a batch. Results of expired leases are still used if the jobs weren't
+        completed by another worker yet, since every worker computes the same result.
+
+        Parameter:
+        lease (int): id of the lease
+        results (list: tuple): (job id, hash, zlib compressed canonical IR) of every job, hash and IR are None if opt failed
+
+        Return:
+        Nothing, records the results and the transitions
+        """
+
+        with self.condition:
+            self.leases.pop(lease, None)
+
+        for job, digest, blob in results:
+
+            with self.condition:
+                if job not in self.jobs or job in self.results:
+                    continue
+                source, opt_pass = self.jobs[job]
+
+            if digest is not None:
+
+                # The coordinator may already know the program from another transition
+                if not self.cache.has_ir(digest):
+                    stored_digest = self.cache.put_ir(zlib.decompress(blob).decode())
+                    if stored_digest != digest:
+                        self.profiler.count('hash mismatches')
+                        digest = stored_digest
+                    self.profiler.count('bytes received', len(blob))
+
+                self.cache.add_transition(self.toolchain.key, source, opt_pass, digest)
+                self.profiler.count('opt runs')
+            else:
+                self.profiler.count('opt failures')
+
+            with self.condition:
+                self.results[job] = digest
+                self.condition.notify_all()
+
+    def wait_for(self, jobs, deadline):
+        """
+        Waits until every job has a result, handing out expired leases again meanwhile.
+
+        Parameter:
+        jobs (list: int): ids of the jobs
+        deadline (float): time.time() after which to stop waiting
+
+        Return:
+        results (list: string): hash of the result of every job, None if opt failed. None if the deadline passed first
+        """
+
+        with self.condition:
+
+            while not all(job in self.results for job in jobs):
+
+                if self.closed or time.time() > deadline:
+                    return None
+
+                self.reap()
+                self.condition.wait(1)
+
+            return [self.results[job] for job in jobs]
+
+    def cancel(self):
+        """
+        Drops every job left, late results of them are ignored.
+
+        Return:
+        Nothing, empties the jobs, leases and results
+        """
+
+        with self.condition:
+            self.jobs.clear()
+            self.pending.clear()
+            self.leases.clear()
+            self.results.clear()
+
+    def explore(self, root_program_path, passes, optimized_path, max_nodes = 10000, time_limit = 10000, analytics = None):
+        """
+        Builds the graph of the program states reachable from a program by applying the passes, breadth
+        first, with the workers running opt. Same graph as Exploration.explore() with the same cache.
+
+        Parameter:
+        root_program_path (string): path to the LLVM IR file of the program
+        passes (list: string): passes applied on every state
+        optimized_path (string): path to the directory the programs compared with llvm-diff are written to
+        max_nodes (int): stop once the graph has more nodes than this
+        time_limit (float): stop once the exploration has run for longer than this, in seconds
+        analytics (GraphAnalytics): analytics kept up to date as the graph grows, None to not keep them
+
+        Return:
+        graph (DiGraph): graph of the program states, nodes are program paths and edges hold the passes in 'relationship'
+        """
+
+        import networkx as nx
+
+        profiler = self.profiler
+
+        graph = nx.DiGraph()
+        queue = []
+
+        Exploration.add_graph_node(root_program_path, queue, graph, program_hash = self.cache.put_file(root_program_path))
+        profiler.count('new nodes')
+        if analytics is not None:
+            analytics.add_node(root_program_path)
+
+        profiler.gauge('node budget', max_nodes)
+        profiler.gauge('time budget', time_limit)
+
+        start_time = time.time()
+        profiler.gauge('exploration start', start_time)
+
+        # States being expanded, oldest first, with the result hash or job id of every pass
+        expanding = deque()
+
+        try:
+            while queue or expanding:
+
+                # Expand states ahead, known transitions don't need a worker
+                while queue and len(expanding) < self.window:
+
+                    node = queue.pop(0)
+                    profiler.gauge('queue depth', len(queue))
+                    profiler.count('nodes expanded')
+
+                    source = graph.nodes[node]['hash']
+                    slots = []
+                    for opt_pass in passes:
+                        target = self.cache.transition(self.toolchain.key, source, opt_pass)
+                        if target is not None:
+                            profiler.count('transition hits')
+                            slots.append((target, None))
+                        else:
+                            slots.append((None, self.submit(source, opt_pass)))
+
+                    expanding.append((node, slots))
+
+                # Merge the oldest state once its results are in
+                node, slots = expanding[0]
+
+                with profiler.stage('wait for workers'):
+                    results = self.wait_for([job for target, job in slots if job is not None], start_time + time_limit)
+                if results is None:
+                    break
+                expanding.popleft()
+
+                results = iter(results)
+                for opt_pass, (target, job) in zip(passes, slots):
+
+                    if job is not None:
+                        target = next(results)
+
+                    # opt failed on this program, skipped like Exploration.apply_pass() does
+                    if target is None:
+                        continue
+
+                    # The program is compared with llvm-diff against the graph, so it needs a file
+                    optimized_program_path = os.path.join(optimized_path, target + '.ll')
+                    if not os.path.exists(optimized_program_path):
+                        self.cache.materialize(target, optimized_program_path)
+
+                    Exploration.is_existing(optimized_program_path, graph, node, opt_pass, queue, self.toolchain, self.cache, profiler, analytics)
+
+                elapsed_time = time.time() - start_time
+                profiler.gauge('graph nodes', graph.number_of_nodes())
+                profiler.gauge('graph edges', graph.number_of_edges())
+                profiler.gauge('frontier', len(queue) + len(expanding))
+
+                if elapsed_time > time_limit or graph.number_of_nodes() > max_nodes:
+                    break
+        finally:
+            self.cancel()
+
+        return graph
+
+    def close(self):
+        """
+        Tells the workers to exit on their next lease.
+
+        Return:
+        Nothing, closes the coordinator
+        """
+
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class CoordinatorServer(BaseManager):
+    """
+    Serves a coordinator over a socket.
+    """
+
+
+class CoordinatorClient(BaseManager):
+    """
+    Connects to a coordinator served over a socket.
+    """
+
+
+CoordinatorClient.register('coordinator')
+
+
+def parse_address(address):
+    """
+    Parses a 'host:port' address.
+
+    Parameter:
+    address (string): address, e.g. '0.0.0.0:50000'
+
+    Return:
+    address (tuple): (host, port)
+    """
+
+    host, port = address.rsplit(':', 1)
+
+    return host, int(port)
+
+
+def coordinator_authkey(authkey = None):
+    """
+    Key of a coordinator: the one given, else the one in LLVM_EVOLUTION_AUTHKEY, else a new random one.
+
+    Parameter:
+    authkey (string): key given on the command line, None if there is none
+
+    Return:
+    authkey (string): the key
+    generated (bool): True if the key is new and must be handed to the workers
+    """
+
+    authkey = authkey or os.environ.get(AUTHKEY_VARIABLE)
+    if authkey:
+        return authkey, False
+
+    return secrets.token_hex(16), True
+
+
+def serve(coordinator, address, authkey):
+    """
+    Serves a coordinator to remote workers in a background thread.
+
+    Parameter:
+    coordinator (Coordinator): the coordinator
+    address (string): 'host:port' to listen on, port 0 for any free port
+    authkey (bytes): key every worker must present
+
+    Return:
+    server (Server): the server, its address is in server.address and server.stop_event stops it
+    """
+
+    # Anyone presenting the key can send pickles to this process
+    if not authkey:
+        raise ValueError('A coordinator needs a key, see coordinator_authkey()')
+
+    CoordinatorServer.register('coordinator', callable = lambda: coordinator)
+
+    server = CoordinatorServer(address = parse_address(address), authkey = authkey).get_server()
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+
+    return server
+
+
+def connect(address, authkey):
+    """
+    Connects to a coordinator served by serve().
+
+    Parameter:
+    address (string): 'host:port' of the coordinator
+    authkey (bytes): key of the coordinator
+
+    Return:
+    coordinator (proxy): proxy with the coordinator's lease() and complete() methods
+    """
+
+    client = CoordinatorClient(address = parse_address(address), authkey = authkey)
+    client.connect()
+
+    return client.coordinator()
+
+
+def run_worker(coordinator, toolchain, work_directory, batch_size = 8, poll_interval = 0.5, name = None, profiler = None):
+    """
+    Runs the jobs of a coordinator until it closes.
+
+    Parameter:
+    coordinator (Coordinator or proxy): the coordinator, or a proxy returned by connect()
+    toolchain (Toolchain): toolchain whose opt runs the jobs, must be the coordinator's
+    work_directory (string): directory the programs of the jobs are written to
+    batch_size (int): jobs leased at once
+    poll_interval (float): seconds to wait when there are no jobs
+    name (string): name of the worker, host and process id if None
+    profiler (Profiler): profiler timing the 'opt' stage, None to not profile
+
+    Return:
+    completed (int): number of jobs run
+    """
+
+    profiler = Profiling.active(profiler)
+
+    if name is None:
+        name = socket.gethostname() + ':' + str(os.getpid())
+
+    os.makedirs(work_directory, exist_ok = True)
+    completed = 0
+
+    while True:
+
+        batch = coordinator.lease(name, toolchain.key, batch_size)
+        if batch is None:
+            return completed
+
+        if not batch['jobs']:
+            time.sleep(poll_interval)
+            continue
+
+        # Programs of the batch, written once per worker
+        for source, blob in batch['sources'].items():
+            source_path = os.path.join(work_directory, source + '.ll')
+            if not os.path.exists(source_path):
+                with open(source_path, 'wb') as file:
+                    file.write(zlib.decompress(blob))
+
+        results = []
+        for job, source, opt_pass in batch['jobs']:
+
+            # The optimized program is read from stdout, nothing else is written to disk
+            with profiler.stage('opt'):
+                outcome = subprocess.run([toolchain.opt, '-S', '-passes=' + opt_pass, os.path.join(work_directory, source + '.ll')], capture_output = True, text = True)
+            profiler.count('opt runs')
+
+            if outcome.returncode != 0:
+                results.append((job, None, None))
+                continue
+
+            canonical_ir = IR_Cache.canonicalize_ir(outcome.stdout)
+            results.append((job, IR_Cache.ir_hash(canonical_ir), zlib.compress(canonical_ir.encode())))
+
+        coordinator.complete(batch['lease'], results)
+        completed += len(results)
+
+
+def start_local_workers(coordinator, toolchain, count, work_directory, batch_size = 8):
+    """
+    Runs workers as threads of this process, calling the coordinator directly.
+
+    Parameter:
+    coordinator (Coordinator): the coordinator
+    toolchain (Toolchain): toolchain of the workers
+    count (int): number of workers
+    work_directory (string): directory the workers write the programs of their jobs to
+    batch_size (int): jobs leased at once by every worker
+
+    Return:
+    threads (list: Thread): the worker threads, they exit once the coordinator closes
+    """
+
+    threads = []
+
+    for index in range(count):
+        thread = threading.Thread(target = run_worker, args = (coordinator, toolchain, os.path.join(work_directory, 'worker' + str(index)), batch_size, 0.05, 'local' + str(index)), daemon = True)
+        thread.start()
+        threads.append(thread)
+
+    return threads
+
+
+def spawn_workers(address, authkey, count, tools = None, batch_size = 8):
+    """
+    Runs workers as processes of this machine, connecting to the coordinator over its socket like remote
+    workers do.
+
+    Parameter:
+    address (string): 'host:port' of the coordinator
+    authkey (bytes): key of the coordinator
+    count (int): number of workers
+    tools (string): bin directory or install prefix of the workers' toolchain, the tools on PATH if None
+    batch_size (int): jobs leased at once by every worker
+
+    Return:
+    processes (list: Popen): the worker processes, they exit once the coordinator closes
+    """
+
+    command = [sys.executable, os.path.abspath(__file__), 'worker', '--address', address, '--batch-size', str(batch_size)]
+    if tools is not None:
+        command += ['--tools', tools]
+
+    # The key goes through the environment, the command line of a process is visible to every user
+    environment = dict(os.environ)
+    environment[AUTHKEY_VARIABLE] = authkey.decode()
+
+    return [subprocess.Popen(command, env = environment) for index in range(count)]
+
+
+def parse_arguments():
+
+    parser = argparse.ArgumentParser(description = 'Worker of a distributed exploration, runs opt on the jobs of a coordinator.')
+    parser.add_argument('mode', choices = ['worker'], help = 'the coordinator runs inside Pass_Relations_Graph.py --serve')
+    parser.add_argument('--address', required = True, help = 'host:port of the coordinator')
+    parser.add_argument('--authkey', default = None, help = 'key of the coordinator, visible to other users in the process list, prefer setting ' + AUTHKEY_VARIABLE)
+    parser.add_argument('--tools', default = None, help = 'bin directory or install prefix of the LLVM toolchain, the tools on PATH by default')
+    parser.add_argument('--batch-size', type = int, default = 8, help = 'jobs leased at once')
+    parser.add_argument('--work-directory', default = None, help = 'directory the programs of the jobs are written to, a temporary one by default')
+
+    return parser.parse_args()
+
+
+def main():
+
+    arguments = parse_arguments()
+
+    authkey = arguments.authkey or os.environ.get(AUTHKEY_VARIABLE)
+    if not authkey:
+        sys.exit('The key of the coordinator must be in ' + AUTHKEY_VARIABLE + ' or given with --authkey')
+
+    toolchain = Toolchain.default_toolchain() if arguments.tools is None else Toolchain.toolchain(arguments.tools)
+    coordinator = connect(arguments.address, authkey.encode())
+
+    # The coordinator going away ends the worker too
+    try:
+        if arguments.work_directory is not None:
+            completed = run_worker(coordinator, toolchain, arguments.work_directory, arguments.batch_size)
+        else:
+            with tempfile.TemporaryDirectory(prefix = 'llvm-evolution-worker-') as work_directory:
+                completed = run_worker(coordinator, toolchain, work_directory, arguments.batch_size)
+    except (EOFError, ConnectionError):
+        return
+
+    print('Worker ran', completed, 'jobs', file = sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
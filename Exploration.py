@@ -0,0 +1,556 @@
+# Breadth first exploration of the program states reachable by applying passes, used by
+# Pass_Relations_Graph.py and Toolchain_Matrix.py. Every state is a node and every pass applied is an edge
+# to the resulting state, a new state is only added if llvm-diff finds it differs from every state on the
+# graph. Identical states are found by hash and states whose functions differ in structure are never
+# compared (see Tiered_Dedup.py). Runs with any toolchain, and with an IRCache known transitions skip opt
+# and known llvm-diff verdicts skip llvm-diff. Every stage is timed by an optional Profiler.
+#
+# Only imports what the compute paths need, networkx is loaded by explore() itself, so worker processes that
+# apply passes and compare programs start fast. Also usable as a lean worker exploring one program:
+#
+# Usage: python Exploration.py <program.ll> <output directory> [--passes ...] [--tools <LLVM bin directory>]
+#                              [--cache <path>] [--max-nodes 10000] [--time-limit 10000]
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+import Profiling
+import Tiered_Dedup
+import Toolchain
+
+
+def generate_ir(directory, output_directory, toolchain = None):
+    """
+    Traverses a directory with an arbitrary number of subdirectories. Extracts all .c clang compilable files and generates 
+    the IR files and places them in desired output directory.
+
+    Parameter:
+    directory (string): Path to the root directory of interest
+    output_directory (string): Path to the directory to store IR
+    optional argument, toolchain (Toolchain): Toolchain whose clang is used, clang on PATH if None
+
+    Return:
+    Nothing, IR(s) is/are appended to output_directory.
+    """
+
+    clang = 'clang' if toolchain is None or toolchain.clang is None else toolchain.clang
+
+    # Iterate over each item in directory
+    for item in os.listdir(directory):
+
+        # Construct current item path 
+        itempath = os.path.join(directory, item)
+
+        # Check if current item is a .c file
+        if os.path.isfile(itempath) and itempath.endswith(".c"):
+
+            # Check if file is compilable with clang
+            if is_compilable_clang(itempath, toolchain) == True:
+
+                # Generate the IR of .c file and store in output directory
+                subprocess.run([clang, "-S", "-emit-llvm", itempath, '-o', os.path.join(output_directory, item + ".ll"), '-O0', "-Xclang", "-disable-O0-optnone"])
+
+            # Skip to next item
+            else:
+                continue
+
+        # Check if current item is a sub-directory
+        elif os.path.isdir(itempath):
+
+            # Traverse subdirectory
+            generate_ir(itempath, output_directory, toolchain)
+
+        # Skip to next item
+        else:
+            continue
+
+
+def is_compilable_clang(filepath, toolchain = None):
+    """
+    Checks if .c file is compilable with clang
+
+    Parameters:
+    filepath (string): complete filepath to your .c file of interest
+    optional argument, toolchain (Toolchain): Toolchain whose clang is used, clang on PATH if None
+
+    Returns:
+    True: if .c file passed through is compilable with clang
+    False: if .c file passed through is not compilable with clang
+    """
+
+    clang = 'clang' if toolchain is None or toolchain.clang is None else toolchain.clang
+
+    # Run command to check if file is compilable with clang
+    outcome = subprocess.run([clang, "-fsyntax-only", filepath], capture_output = True, text = True)
+
+    # Check return code of the process
+    if outcome.returncode == 0:
+        return True # file is compilable with clang
+    else:
+        return False # file is not compilable with clang
+
+
+def add_graph_node(program_path, queue, graph, parent_node = None, pass_applied = None, program_hash = None):
+    """
+    Adds nodes to the given graph. Adds the program_path as a node and appeneds the node to the queue.
+    For all nodes besides the root, it will add an edge with the new node and parent node.
+
+    Arguments:
+    program_path (string): Path to program to be added as a node
+    queue (list: string): List that holds the programs to be visited
+    graph (Graph): Graph to which nodes will be added to
+    optional argument, parent_node (string): Path to the parent node program
+    optional argument, pass_applied (string): Pass applied to make new program
+    optional argument, program_hash (string): Content address of the program in the IR cache
+
+    Returns:
+    Nothing, adds nodes and/or edges.
+    """
+
+    # Add the node to the graph and enqueue
+    if program_hash is None:
+        graph.add_node(program_path)
+    else:
+        graph.add_node(program_path, hash = program_hash)
+    queue.append(program_path)
+
+    # For all nodes besides root, add an edge with the parent node
+    if parent_node:
+        graph.add_edge(parent_node, program_path, relationship = pass_applied)
+
+
+def add_graph_edge(graph, parent_node, node, pass_applied):
+    """
+    Connects the parent node to an existing node, appending the pass if the edge already exists.
+
+    Arguments:
+    graph (Graph): Graph you're working with
+    parent_node (string): Path to the parent node program
+    node (string): Path to the existing node program
+    pass_applied (string): Pass applied to make the program
+
+    Returns:
+    Nothing, adds or updates the edge.
+    """
+
+    if graph.has_edge(parent_node, node):
+        graph[parent_node][node]['relationship'] = graph[parent_node][node]['relationship'] + ',' + pass_applied
+        return
+
+    graph.add_edge(parent_node, node, relationship = pass_applied)
+
+
+def relabel_graph(graph, attribute = None, describe = None):
+    """
+    Renames the nodes of a graph P0, P1, ... in node order, so P0 is the root, the node names every script
+    outputs graphs with.
+
+    Arguments:
+    graph (Graph): Graph to rename
+    optional argument, attribute (string): Attribute the old name of every node is kept in, not kept if None
+    optional argument, describe (function): Turns an old name into the value of the attribute, the old name itself if None
+
+    Returns:
+    renamed_graph (Graph): Copy of the graph with the new names
+    """
+
+    import networkx as nx
+
+    names = {node: 'P' + str(index) for index, node in enumerate(graph.nodes)}
+    renamed_graph = nx.relabel_nodes(graph, names)
+
+    if attribute is not None:
+        for node, name in names.items():
+            renamed_graph.nodes[name][attribute] = node if describe is None else describe(node)
+
+    return renamed_graph
+
+
+def write_graph(graph, gml_path, attribute = None, describe = None):
+    """
+    Outputs a graph as GML with the node names of relabel_graph().
+
+    Arguments:
+    graph (Graph): Graph to output
+    gml_path (string): Path of the GML file
+    optional argument, attribute (string): Attribute the old name of every node is kept in, not kept if None
+    optional argument, describe (function): Turns an old name into the value of the attribute, the old name itself if None
+
+    Returns:
+    Nothing, generates the GML file
+    """
+
+    import networkx as nx
+
+    nx.write_gml(relabel_graph(graph, attribute, describe), gml_path)
+
+
+def apply_pass(program, optimized_path, opt_pass, toolchain = None, cache = None, source = None, profiler = None):
+    """
+    Applies the given pass on the given program and stores it in the given path. With a cache, a transition
+    already computed with the same toolchain is written from the cache instead of running opt.
+
+    Arguments:
+    program (string): Path to program to apply pass on
+    optimized_path (string): Path to which optimized program will be stored
+    opt_pass (string): Pass to apply on given program
+    optional argument, toolchain (Toolchain): Toolchain whose opt is used, opt on PATH if None
+    optional argument, cache (IRCache): Cache of the transitions
+    optional argument, source (string): Content address of the program in the cache
+    optional argument, profiler (Profiler): Profiler timing the 'apply_pass' and 'opt' stages
+
+    Returns:
+    optimized_program_path (string): Path to optimized file, None if opt failed
+    """
+
+    profiler = Profiling.active(profiler)
+
+    with profiler.stage('apply_pass'):
+
+        # Optimized program path
+        optimized_program_path = os.path.join(optimized_path, program.split('/')[-1] + '_' + opt_pass + '.ll')
+
+        use_cache = cache is not None and toolchain is not None and source is not None
+
+        # Known transition, no need to run opt
+        if use_cache:
+            target = cache.transition(toolchain.key, source, opt_pass)
+            if target is not None:
+                profiler.count('transition hits')
+                cache.materialize(target, optimized_program_path)
+                profiler.count('bytes written', os.path.getsize(optimized_program_path))
+                return optimized_program_path
+
+        # Apply pass via opt
+        with profiler.stage('opt'):
+            outcome = subprocess.run(['opt' if toolchain is None else toolchain.opt, '-S', '-passes=' + opt_pass, '-o', optimized_program_path, program])
+        profiler.count('opt runs')
+
+        # A failed pass leads to no program state, like a failed job of Distributed_Exploration.py
+        if outcome.returncode != 0:
+            profiler.count('opt failures')
+            return None
+
+        profiler.count('bytes written', os.path.getsize(optimized_program_path))
+
+        if use_cache:
+            cache.add_transition(toolchain.key, source, opt_pass, cache.put_file(optimized_program_path))
+
+        return optimized_program_path
+
+
+def find_equivalent(optimized_program_path, graph, toolchain = None, cache = None, profiler = None):
+    """
+    Finds a node of the graph llvm-diff finds no differences with: the first node with the same canonical IR,
+    found by hash, else the first node llvm-diff finds no differences with. Nodes that can't be equivalent
+    are skipped, and with a cache llvm-diff verdicts computed before are reused.
+
+    Arguments:
+    optimized_program_path (string): Path to optimized file
+    graph (Graph): Graph you're working with
+    optional argument, toolchain (Toolchain): Toolchain whose llvm-diff is used, llvm-diff on PATH if None
+    optional argument, cache (IRCache): Cache of the programs and llvm-diff verdicts
+    optional argument, profiler (Profiler): Profiler timing the 'llvm-diff' stage and counting cache hits and eliminated candidates
+
+    Returns:
+    node (string): Equivalent node, None if there is none
+    target (string): Content address of the optimized file, None without a cache
+    """
+
+    profiler = Profiling.active(profiler)
+
+    target = None
+    candidates = graph.nodes
+
+    # Nodes whose functions differ in structure can't be equivalent, and identical canonical IR is the same
+    # program state, so llvm-diff only runs on the candidates left (see Tiered_Dedup.py)
+    if os.path.exists(optimized_program_path):
+        node, target, candidates = Tiered_Dedup.index_for(graph).candidates(optimized_program_path, cache, profiler)
+        if node is not None:
+            return node, target
+
+    for node in candidates:
+
+        differences = None
+        if target is not None:
+            differences = cache.diff(target, graph.nodes[node]['hash'])
+
+        if differences is None:
+
+            # Run llvm-diff command and capture output
+            with profiler.stage('llvm-diff'):
+                llvm_diff_output = llvm_diff(optimized_program_path, node, toolchain)
+
+            # Analyze the llvm-diff output and record number of additions and deletions
+            differences = analyze_differences(llvm_diff_output)
+            profiler.count('diff runs')
+
+            if target is not None:
+                cache.add_diff(target, graph.nodes[node]['hash'], differences)
+        else:
+            profiler.count('diff hits')
+
+        # If there is an equivalent node in the graph
+        if differences['Num Additions'] == 0 and differences['Num Deletions'] == 0:
+            return node, target
+
+    return None, target
+
+
+def is_existing(optimized_program_path, graph, parent_node, pass_appled, queue, toolchain = None, cache = None, profiler = None, analytics = None):
+    """
+    Checks whether the optimized file already exists on the graph. If it does, then connects the
+    parent node to the existing node. If it doesn't, it will create a new node and connect it
+    accordingly.
+
+    Arguments:
+    optimized_program_path (string): Path to optimized file'
+    graph (Graph): Graph you're working with
+    parent_node (string): Path to the parent node program
+    pass_applied (string): Pass applied to make new program
+    queue (list: string): List that holds the programs to be visited
+    optional argument, toolchain (Toolchain): Toolchain whose llvm-diff is used, llvm-diff on PATH if None
+    optional argument, cache (IRCache): Cache of the programs and llvm-diff verdicts
+    optional argument, profiler (Profiler): Profiler timing the 'dedup compare' and 'node insert' stages
+    optional argument, analytics (GraphAnalytics): Analytics of the graph, updated with the transition
+
+    Returns:
+    graph.add_edge(): Adds an edge with existing node
+    graph.add_node(): Adds a new node to the graph and connects it accordingly
+    """
+
+    profiler = Profiling.active(profiler)
+    profiler.count('dedup lookups')
+
+    with profiler.stage('dedup compare'):
+        node, target = find_equivalent(optimized_program_path, graph, toolchain, cache, profiler)
+
+    return insert_program(optimized_program_path, graph, parent_node, pass_appled, queue, node, target, profiler, analytics)
+
+
+def insert_program(optimized_program_path, graph, parent_node, pass_applied, queue, node, target, profiler = None, analytics = None):
+    """
+    Adds a program to the graph once its equivalent node, if any, is known: an edge to the equivalent node,
+    or a new node.
+
+    Arguments:
+    optimized_program_path (string): Path to optimized file
+    graph (Graph): Graph you're working with
+    parent_node (string): Path to the parent node program
+    pass_applied (string): Pass applied to make new program
+    queue (list: string): List that holds the programs to be visited
+    node (string): Equivalent node found by find_equivalent(), None if there is none
+    target (string): Content address of the optimized file, None without a cache
+    optional argument, profiler (Profiler): Profiler timing the 'node insert' stage
+    optional argument, analytics (GraphAnalytics): Analytics of the graph, updated with the transition
+
+    Returns:
+    Nothing, adds an edge to the existing node or a new node
+    """
+
+    profiler = Profiling.active(profiler)
+
+    with profiler.stage('node insert'):
+
+        # If there is an equivalent node in the graph, add an edge from parent node to equivalent node
+        if node is not None:
+            profiler.count('dedup hits')
+            if not graph.has_edge(parent_node, node):
+                profiler.count('new edges')
+            if analytics is not None:
+                analytics.add_transition(parent_node, node, pass_applied)
+            return add_graph_edge(graph, parent_node, node, pass_applied)
+
+        # If non of the nodes in the graph are equivalent to the new program, add new node
+        profiler.count('new nodes')
+        profiler.count('new edges')
+        if analytics is not None:
+            analytics.add_node(optimized_program_path, parent_node)
+            analytics.add_transition(parent_node, optimized_program_path, pass_applied)
+        add_graph_node(optimized_program_path, queue, graph, parent_node = parent_node, pass_applied = pass_applied, program_hash = target)
+
+        # The dedup index learns the node now rather than rescanning the graph on the next lookup
+        Tiered_Dedup.index_for(graph).add(optimized_program_path)
+
+
+def llvm_diff(optimized_program_path, node_program, toolchain = None):
+    """
+    Runs the llvm-diff command on two passed in programs.
+
+    Arguments:
+    optimized_program_path (string): Path to optimized file
+    node_program (string): Program path of a node on the graph
+    optional argument, toolchain (Toolchain): Toolchain whose llvm-diff is used, llvm-diff on PATH if None
+
+    Returns:
+    diff_output (list: string): llvm-diff command captured and split into lines
+    """
+
+    # Run llvm-diff command
+    diff_output = subprocess.run(['llvm-diff' if toolchain is None else toolchain.llvm_diff, optimized_program_path, node_program], capture_output = True, text = True)
+
+    # Convert output to a string
+    diff_output = diff_output.stderr.splitlines()
+
+    return diff_output
+
+
+def analyze_differences(llvm_diff):
+    """
+    Analyzes the llvm-diff output captured and records the number of additions and deletions that were
+    made.
+
+    Arguments:
+    llvm-diff (list: string): llvm-diff output captured and split into lines
+
+    Returns:
+    differences (dict: int): Holds the number of additions and deletions from llvm-diff command
+    """
+
+    # Holds the number of additions and deletions from llvm-diff output
+    differences = {
+        'Num Additions': 0,
+        'Num Deletions': 0,
+    }
+
+    # Iterate over all lines in output and note the additions, deletions, and modifications
+    for line in llvm_diff:
+
+        # Check if line is an addition or deletion or modification and append it
+        if line.strip().startswith('>'):
+            differences['Num Additions'] += 1
+        elif line.strip().startswith('<'):
+            differences['Num Deletions'] += 1
+
+    return differences
+
+
+def explore(root_program_path, passes, optimized_path, toolchain = None, cache = None, max_nodes = 10000, time_limit = 10000, profiler = None, analytics = None):
+    """
+    Builds the graph of the program states reachable from a program by applying the passes, breadth first.
+
+    Arguments:
+    root_program_path (string): Path to the LLVM IR file of the program
+    passes (list: string): Passes applied on every state
+    optimized_path (string): Path to the directory the optimized programs are stored in
+    optional argument, toolchain (Toolchain): Toolchain used, the binaries on PATH if None
+    optional argument, cache (IRCache): Cache shared with other explorations and toolchains
+    optional argument, max_nodes (int): Stop once the graph has more nodes than this
+    optional argument, time_limit (float): Stop once the exploration has run for longer than this, in seconds
+    optional argument, profiler (Profiler): Profiler recording the stages, cache hits and queue depth
+    optional argument, analytics (GraphAnalytics): Analytics kept up to date as the graph grows
+
+    Returns:
+    graph (DiGraph): Graph of the program states, nodes are program paths and edges hold the passes in 'relationship'
+    """
+
+    import networkx as nx
+
+    profiler = Profiling.active(profiler)
+
+    # Transitions are cached per toolchain, so the cache needs to know which one runs
+    if cache is not None and toolchain is None:
+        toolchain = Toolchain.default_toolchain()
+
+    # Create an empty graph
+    graph = nx.DiGraph()
+
+    # Declare and initialize an empty queue
+    queue = []
+
+    # Add current program as root node
+    add_graph_node(root_program_path, queue, graph, program_hash = None if cache is None else cache.put_file(root_program_path))
+    profiler.count('new nodes')
+    if analytics is not None:
+        analytics.add_node(root_program_path)
+
+    # Budget of this exploration, for progress reports
+    profiler.gauge('node budget', max_nodes)
+    profiler.gauge('time budget', time_limit)
+
+    # Start timer
+    start_time = time.time()
+    profiler.gauge('exploration start', start_time)
+
+    # Loop through the queue
+    while queue:
+
+        # Get the front element from the queue
+        node = queue.pop(0)
+        profiler.gauge('queue depth', len(queue))
+        profiler.count('nodes expanded')
+
+        # Loop through each pass
+        for opt_pass in passes:
+
+            # Apply pass using opt and hold temporary program
+            optimized_program_path = apply_pass(node, optimized_path, opt_pass, toolchain, cache, graph.nodes[node].get('hash'), profiler)
+
+            # The pass failed on this program, there is no state to add
+            if optimized_program_path is None:
+                continue
+
+            # Check if post-pass-applied program is the same as any other nodes on graph
+            is_existing(optimized_program_path, graph, node, opt_pass, queue, toolchain, cache, profiler, analytics)
+
+        # Size of the graph so far, for progress reports
+        elapsed_time = time.time() - start_time
+        profiler.gauge('graph nodes', graph.number_of_nodes())
+        profiler.gauge('graph edges', graph.number_of_edges())
+        profiler.gauge('frontier', len(queue))
+
+        # Check if time or number of nodes exceeds the limits, break out of loop if any are met
+        if elapsed_time > time_limit or graph.number_of_nodes() > max_nodes:
+            break
+
+    return graph
+
+
+def parse_arguments():
+
+    parser = argparse.ArgumentParser(description = 'Explores the program states of one LLVM IR file and writes the graph as GML.')
+    parser.add_argument('program', help = 'LLVM IR file to explore')
+    parser.add_argument('output', help = 'directory the optimized programs and the graph are written to')
+    parser.add_argument('--passes', nargs = '+', default = None, help = 'passes applied on every state, the loop passes by default')
+    parser.add_argument('--tools', default = None, help = 'bin directory or install prefix of the LLVM toolchain, the tools on PATH by default')
+    parser.add_argument('--cache', default = None, help = 'path of the IR cache, no cache by default')
+    parser.add_argument('--max-nodes', type = int, default = 10000, help = 'node limit of the exploration')
+    parser.add_argument('--time-limit', type = float, default = 10000, help = 'time limit of the exploration, in seconds')
+
+    return parser.parse_args()
+
+
+def main():
+
+    arguments = parse_arguments()
+
+    import Pass_Registry
+
+    toolchain = Toolchain.default_toolchain() if arguments.tools is None else Toolchain.toolchain(arguments.tools)
+    passes = Pass_Registry.LOOP_PASSES if arguments.passes is None else arguments.passes
+
+    optimized_path = os.path.join(arguments.output, 'optimized')
+    os.makedirs(optimized_path, exist_ok = True)
+
+    cache = None
+    if arguments.cache is not None:
+        import IR_Cache
+        cache = IR_Cache.IRCache(arguments.cache)
+
+    try:
+        graph = explore(arguments.program, passes, optimized_path, toolchain, cache, arguments.max_nodes, arguments.time_limit)
+    finally:
+        if cache is not None:
+            cache.close()
+
+    # Same node names as Pass_Relations_Graph.py
+    write_graph(graph, os.path.join(arguments.output, os.path.basename(arguments.program) + '.gml'))
+
+    print(graph.number_of_nodes(), 'nodes', graph.number_of_edges(), 'edges', file = sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
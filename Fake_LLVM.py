@@ -0,0 +1,308 @@
+# Deterministic stand-ins for opt, llvm-diff and clang, used by Benchmark.py to measure the tool itself
+# without LLVM installed and without LLVM's own run time in the numbers. Programs are states of a seeded
+# synthetic state machine: every state renders to a small valid-looking IR file, and applying a pass moves
+# a state to the next one given by a hash of (seed, state, pass), or leaves it unchanged. install() writes
+# wrapper scripts named opt, llvm-diff and clang into a directory, which Toolchain.toolchain() accepts
+# like any LLVM install.
+#
+# Usage: python Fake_LLVM.py <opt|llvm-diff|clang> [arguments of the real tool]
+
+import os
+import sys
+import time
+import stat
+import hashlib
+
+# Version reported by the fake opt
+VERSION = '0.0.0'
+
+# Number of global flags of every state, states differing in k flags get 2k llvm-diff lines
+FLAGS = 8
+
+
+def mix(*values):
+    """
+    Deterministic 64 bit hash of some values.
+
+    Parameter:
+    values: values to hash, converted to strings
+
+    Return:
+    digest (int): the hash
+    """
+
+    return int.from_bytes(hashlib.blake2b(':'.join(str(value) for value in values).encode(), digest_size = 8).digest(), 'big')
+
+
+def next_state(state, opt_pass, states, seed):
+    """
+    State a pass moves a state to. One pass in three leaves the state unchanged, as real passes often
+    have nothing to do.
+
+    Parameter:
+    state (int): current state
+    opt_pass (string): pass applied
+    states (int): number of states of the machine
+    seed (int): seed of the machine
+
+    Return:
+    state (int): next state
+    """
+
+    digest = mix(seed, state, opt_pass)
+    if digest % 3 == 0:
+        return state
+
+    return (digest // 3) % states
+
+
+def render_state(state, seed):
+    """
+    Renders a state as a small LLVM IR module.
+
+    Parameter:
+    state (int): state to render
+    seed (int): seed of the machine, the flags of a state depend on it
+
+    Return:
+    ir (string): contents of the IR file
+    """
+
+    flags = mix(seed, 'flags', state)
+
+    lines = ["; ModuleID = 'fake-state-" + str(state) + "'", 'source_filename = "fake.c"', '']
+    for flag in range(FLAGS):
+        lines.append('@flag' + str(flag) + ' = global i32 ' + str((flags >> flag) & 1) + ', align 4')
+
+    lines += ['', 'define dso_local i32 @main() #0 {', 'entry:', '  %state = add i32 0, ' + str(state), '  ret i32 %state', '}', '']
+
+    return '\n'.join(lines)
+
+
+def read_state(path):
+    """
+    State of a fake IR file.
+
+    Parameter:
+    path (string): path to the IR file, '-' for stdin
+
+    Return:
+    state (int): state the file renders
+    """
+
+    text = sys.stdin.read() if path == '-' else open(path, 'r').read()
+
+    for line in text.splitlines():
+        if line.strip().startswith('%state = add i32 0, '):
+            return int(line.strip().split(', ')[-1])
+
+    raise ValueError('Not a fake IR file: ' + path)
+
+
+def configuration():
+    """
+    Parameters of the state machine, from the environment set by the wrapper scripts.
+
+    Return:
+    states (int): number of states
+    seed (int): seed of the machine
+    delay (float): seconds every tool invocation sleeps, to simulate the real tools' run time
+    """
+
+    return int(os.environ.get('FAKE_LLVM_STATES', '64')), int(os.environ.get('FAKE_LLVM_SEED', '0')), float(os.environ.get('FAKE_LLVM_DELAY', '0'))
+
+
+def known_passes():
+    """
+    Passes the fake opt accepts. The wrapper scripts pass them in the environment, importing Pass_Registry
+    on every invocation would cost more than the fake tool itself.
+
+    Return:
+    passes (list: string): names of the passes
+    """
+
+    if 'FAKE_LLVM_PASSES' in os.environ:
+        return os.environ['FAKE_LLVM_PASSES'].split(',')
+
+    import Pass_Registry
+    return Pass_Registry.O1_PASSES
+
+
+def fake_opt(arguments):
+    """
+    Fake opt. Supports --version, --print-passes and '-S -passes=<passes> -o <output> <input>'.
+
+    Parameter:
+    arguments (list: string): command line arguments
+
+    Return:
+    code (int): exit code
+    """
+
+    states, seed, delay = configuration()
+
+    if '--version' in arguments:
+        print('Fake LLVM version ' + VERSION)
+        return 0
+
+    if '--print-passes' in arguments:
+        print('Module passes:')
+        for opt_pass in known_passes():
+            print('  ' + opt_pass)
+        return 0
+
+    passes = []
+    output_path = '-'
+    input_path = '-'
+
+    index = 0
+    while index < len(arguments):
+        argument = arguments[index]
+        if argument.startswith('-passes='):
+            passes = argument[len('-passes='):].split(',')
+        elif argument == '-o':
+            output_path = arguments[index + 1]
+            index += 1
+        elif not argument.startswith('-'):
+            input_path = argument
+        index += 1
+
+    accepted = known_passes()
+    for opt_pass in passes:
+        if opt_pass not in accepted:
+            print("opt: unknown pass name '" + opt_pass + "'", file = sys.stderr)
+            return 1
+
+    time.sleep(delay)
+
+    state = read_state(input_path)
+    for opt_pass in passes:
+        state = next_state(state, opt_pass, states, seed)
+
+    if output_path == '-':
+        sys.stdout.write(render_state(state, seed))
+    else:
+        with open(output_path, 'w') as file:
+            file.write(render_state(state, seed))
+
+    return 0
+
+
+def fake_llvm_diff(arguments):
+    """
+    Fake llvm-diff. Reports the lines only in the first file as deletions and the lines only in the second
+    as additions, on stderr and in the layout of the real llvm-diff.
+
+    Parameter:
+    arguments (list: string): command line arguments, the 2 files to compare
+
+    Return:
+    code (int): exit code, 1 if the files differ
+    """
+
+    states, seed, delay = configuration()
+    time.sleep(delay)
+
+    first_path, second_path = [argument for argument in arguments if not argument.startswith('-')][:2]
+
+    def body(path):
+        with open(path, 'r') as file:
+            return [line for line in file.read().splitlines() if line.strip() and not line.startswith((';', 'source_filename'))]
+
+    first = body(first_path)
+    second = body(second_path)
+
+    deletions = [line for line in first if line not in second]
+    additions = [line for line in second if line not in first]
+
+    if not deletions and not additions:
+        return 0
+
+    sys.stderr.write('in function main:\n  in block %entry:\n')
+    for line in additions:
+        sys.stderr.write('    > ' + line + '\n')
+    for line in deletions:
+        sys.stderr.write('    < ' + line + '\n')
+
+    return 1
+
+
+def fake_clang(arguments):
+    """
+    Fake clang. '-fsyntax-only <file>' accepts every file, '-S -emit-llvm <file> -o <output>' renders the
+    state given by a hash of the source.
+
+    Parameter:
+    arguments (list: string): command line arguments
+
+    Return:
+    code (int): exit code
+    """
+
+    states, seed, delay = configuration()
+
+    if '--version' in arguments:
+        print('Fake clang version ' + VERSION)
+        return 0
+
+    if '-fsyntax-only' in arguments:
+        return 0
+
+    time.sleep(delay)
+
+    output_path = arguments[arguments.index('-o') + 1]
+    source_path = [argument for argument in arguments if argument.endswith('.c')][0]
+
+    with open(source_path, 'rb') as file:
+        state = mix(seed, 'source', hashlib.sha256(file.read()).hexdigest()) % states
+
+    with open(output_path, 'w') as file:
+        file.write(render_state(state, seed))
+
+    return 0
+
+
+def install(directory, states = 64, seed = 0, delay = 0.0):
+    """
+    Writes the opt, llvm-diff and clang wrapper scripts of a fake toolchain.
+
+    Parameter:
+    directory (string): directory of the fake toolchain, created if needed
+    states (int): number of states of the machine
+    seed (int): seed of the machine
+    delay (float): seconds every tool invocation sleeps
+
+    Return:
+    directory (string): the directory, usable with Toolchain.toolchain()
+    """
+
+    import Pass_Registry
+
+    os.makedirs(directory, exist_ok = True)
+
+    for tool in ['opt', 'llvm-diff', 'clang']:
+
+        path = os.path.join(directory, tool)
+        with open(path, 'w') as file:
+            file.write('#!/bin/sh\n')
+            file.write('FAKE_LLVM_STATES={} FAKE_LLVM_SEED={} FAKE_LLVM_DELAY={} FAKE_LLVM_PASSES={} exec "{}" -S -E "{}" {} "$@"\n'.format(
+                states, seed, delay, ','.join(Pass_Registry.O1_PASSES), sys.executable, os.path.abspath(__file__), tool))
+
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    return directory
+
+
+def main():
+
+    tools = {'opt': fake_opt, 'llvm-diff': fake_llvm_diff, 'clang': fake_clang}
+
+    if len(sys.argv) < 2 or sys.argv[1] not in tools:
+        print('Usage: python Fake_LLVM.py <opt|llvm-diff|clang> [arguments]', file = sys.stderr)
+        sys.exit(2)
+
+    sys.exit(tools[sys.argv[1]](sys.argv[2:]))
+
+
+if __name__ == '__main__':
+    main()
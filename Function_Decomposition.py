@@ -0,0 +1,313 @@
+# Function-level exploration of multi-function programs. Function passes (instcombine, sroa, the loop
+# passes, ...) transform every function of a module independently, so the module-level graph is roughly
+# the product of the graphs of its functions and grows exponentially with their number. This mode splits
+# a module into one unit per defined function with llvm-extract (the other functions become declarations),
+# explores the graph of every unit separately with the shared IR cache, and recombines them on demand:
+# ProductGraph is a lazy module-level view whose states are tuples of function states, a pass taking every
+# function along its own edge. Module passes that look across functions (inlining, ipsccp, globaldce, ...)
+# only see one function per unit, so the view is exact for function passes and an approximation otherwise.
+#
+# Usage: python Function_Decomposition.py <program.ll> <output directory> [--passes ...] [--max-nodes 10000]
+#                                         [--time-limit 10000] [--module-nodes 10000] [--tools <LLVM bin directory>]
+#                                         [--cache <path>]
+
+import os
+import re
+import json
+import shutil
+import argparse
+import subprocess
+from collections import deque
+
+import Exploration
+import IR_Cache
+import Pass_Registry
+import Tiered_Dedup
+import Toolchain
+
+
+def defined_functions(program_path):
+    """
+    Functions defined (not only declared) by an LLVM IR file, in order.
+
+    Parameter:
+    program_path (string): path to the LLVM IR file
+
+    Return:
+    functions (list: string): function names, without the @ and quotes
+    """
+
+    functions = []
+
+    with open(program_path, 'r') as file:
+        for line in file:
+            match = Tiered_Dedup.DEFINE.match(line)
+            if match is not None:
+                functions.append(match.group(1).strip('"'))
+
+    return functions
+
+
+def llvm_extract_path(toolchain):
+    """
+    llvm-extract of a toolchain: next to its opt, else on PATH.
+
+    Parameter:
+    toolchain (Toolchain): the toolchain
+
+    Return:
+    path (string): path to llvm-extract, raises FileNotFoundError if there is none
+    """
+
+    path = Toolchain.find_binary([os.path.dirname(toolchain.opt)], 'llvm-extract') or shutil.which('llvm-extract')
+    if path is None:
+        raise FileNotFoundError('No llvm-extract next to ' + toolchain.opt + ' or on PATH')
+
+    return path
+
+
+def decompose(program_path, output_directory, toolchain = None):
+    """
+    Splits a module into one unit per defined function.
+
+    Parameter:
+    program_path (string): path to the LLVM IR file of the module
+    output_directory (string): directory the units are written to
+    toolchain (Toolchain): toolchain whose llvm-extract is used, the tools on PATH if None
+
+    Return:
+    units (list: tuple): (function name, path to the unit's LLVM IR file), in definition order
+    """
+
+    if toolchain is None:
+        toolchain = Toolchain.default_toolchain()
+
+    llvm_extract = llvm_extract_path(toolchain)
+    os.makedirs(output_directory, exist_ok = True)
+
+    units = []
+    name = os.path.basename(program_path)
+
+    for index, function in enumerate(defined_functions(program_path)):
+
+        # The index keeps file names apart for functions whose names only differ in unsafe characters
+        unit_path = os.path.join(output_directory, '{}.{}.{}.ll'.format(name, index, re.sub(r'[^\w.-]', '_', function)))
+        subprocess.run([llvm_extract, '-S', '--func=' + function, '-o', unit_path, program_path], check = True)
+        units.append((function, unit_path))
+
+    return units
+
+
+def explore_functions(program_path, passes, optimized_path, toolchain = None, cache = None, max_nodes = 10000, time_limit = 10000, profiler = None):
+    """
+    Builds the graph of every function of a module separately.
+
+    Parameter:
+    program_path (string): path to the LLVM IR file of the module
+    passes (list: string): passes applied on every state
+    optimized_path (string): directory the units and optimized units are written to
+    toolchain (Toolchain): toolchain used, the tools on PATH if None
+    cache (IRCache): cache shared by the units and with other explorations
+    max_nodes (int): node budget of every function's exploration
+    time_limit (float): time budget of every function's exploration, in seconds
+    profiler (Profiler): profiler recording the stages of every exploration
+
+    Return:
+    graphs (list: tuple): (function name, graph of the function's states) in definition order
+    """
+
+    if toolchain is None:
+        toolchain = Toolchain.default_toolchain()
+
+    graphs = []
+
+    for function, unit_path in decompose(program_path, os.path.join(optimized_path, 'functions'), toolchain):
+        graph = Exploration.explore(unit_path, passes, optimized_path, toolchain, cache, max_nodes, time_limit, profiler)
+        graphs.append((function, graph))
+
+    return graphs
+
+
+class ProductGraph:
+    """
+    Lazy module-level view of per-function graphs. A state is a tuple holding one state of every function
+    graph, and a pass leads from it to the tuple of the states the pass leads every function to. Nothing is
+    built until a state's successors are asked for.
+
+    Parameter:
+    graphs (list: tuple): (function name, graph) as returned by explore_functions(), the first node of every graph is its root
+    """
+
+    def __init__(self, graphs):
+
+        self.functions = [function for function, graph in graphs]
+        self.graphs = [graph for function, graph in graphs]
+
+        # Pass to target of every state of every function, read from the comma separated 'relationship'
+        self.transitions = []
+        for graph in self.graphs:
+            transitions = {node: {} for node in graph.nodes}
+            for source, target, data in graph.edges(data = True):
+                for opt_pass in data['relationship'].split(','):
+                    transitions[source][opt_pass] = target
+            self.transitions.append(transitions)
+
+    def root(self):
+        """
+        Module-level root state.
+
+        Return:
+        state (tuple): root of every function graph
+        """
+
+        return tuple(next(iter(graph.nodes)) for graph in self.graphs)
+
+    def successors(self, state, passes):
+        """
+        States a module-level state leads to.
+
+        Parameter:
+        state (tuple): module-level state
+        passes (list: string): passes applied
+
+        Return:
+        successors (list: tuple): (pass, state) for every pass known for every function of the state, a
+                                  pass missing for one function (not explored, or opt failed) is left out
+        """
+
+        successors = []
+
+        for opt_pass in passes:
+            targets = tuple(transitions[node].get(opt_pass) for transitions, node in zip(self.transitions, state))
+            if None not in targets:
+                successors.append((opt_pass, targets))
+
+        return successors
+
+    def state_bound(self):
+        """
+        Upper bound of the module-level states: the product of the function graph sizes.
+
+        Return:
+        bound (int): product of the number of states of every function
+        """
+
+        bound = 1
+        for graph in self.graphs:
+            bound *= graph.number_of_nodes()
+
+        return bound
+
+    def to_graph(self, passes, max_nodes = 10000):
+        """
+        Module-level graph of the states reachable from the root, breadth first, in the format of
+        Exploration.explore(): edges hold the passes in 'relationship'.
+
+        Parameter:
+        passes (list: string): passes applied on every state
+        max_nodes (int): stop expanding once the graph has more nodes than this
+
+        Return:
+        graph (DiGraph): nodes are module-level states, with the state of every function in their 'functions' attribute
+        """
+
+        import networkx as nx
+
+        graph = nx.DiGraph()
+        root = self.root()
+        graph.add_node(root)
+        queue = deque([root])
+
+        while queue and graph.number_of_nodes() <= max_nodes:
+
+            state = queue.popleft()
+
+            for opt_pass, successor in self.successors(state, passes):
+
+                if successor not in graph:
+                    graph.add_node(successor)
+                    queue.append(successor)
+
+                if graph.has_edge(state, successor):
+                    graph[state][successor]['relationship'] += ',' + opt_pass
+                else:
+                    graph.add_edge(state, successor, relationship = opt_pass)
+
+        # Readable names, the function states are kept as an attribute
+        return Exploration.relabel_graph(graph, 'functions', lambda state: ','.join(os.path.basename(node) for node in state))
+
+
+def write_outputs(graphs, product_graph, output_directory, name):
+    """
+    Outputs the graph of every function and the module-level graph as GML, and their sizes as JSON.
+
+    Parameter:
+    graphs (list: tuple): (function name, graph) as returned by explore_functions()
+    product_graph (DiGraph): module-level graph returned by ProductGraph.to_graph()
+    output_directory (string): directory the files are written to
+    name (string): name the files start with
+
+    Return:
+    summary (dict): number of states of every function, of the module-level graph and their product
+    """
+
+    import networkx as nx
+
+    summary = {'functions': {}, 'module states': product_graph.number_of_nodes(), 'module edges': product_graph.number_of_edges(), 'state bound': 1}
+
+    for index, (function, graph) in enumerate(graphs):
+
+        Exploration.write_graph(graph, os.path.join(output_directory, '{}.{}.{}.gml'.format(name, index, re.sub(r'[^\w.-]', '_', function))))
+
+        summary['functions'][function] = graph.number_of_nodes()
+        summary['state bound'] *= graph.number_of_nodes()
+
+    nx.write_gml(product_graph, os.path.join(output_directory, name + '.gml'))
+
+    with open(os.path.join(output_directory, name + '.functions.json'), 'w') as file:
+        json.dump(summary, file, indent = 2)
+
+    return summary
+
+
+def parse_arguments():
+
+    parser = argparse.ArgumentParser(description = 'Explores every function of a module separately and recombines them into a module-level graph.')
+    parser.add_argument('program', help = 'LLVM IR file of the module')
+    parser.add_argument('output', help = 'directory the graphs, the units and their optimized states are written to')
+    parser.add_argument('--passes', nargs = '+', default = Pass_Registry.LOOP_PASSES, help = 'passes applied on every state, the loop passes by default')
+    parser.add_argument('--max-nodes', type = int, default = 10000, help = 'node budget of every function')
+    parser.add_argument('--time-limit', type = float, default = 10000, help = 'time budget of every function, in seconds')
+    parser.add_argument('--module-nodes', type = int, default = 10000, help = 'node budget of the module-level graph')
+    parser.add_argument('--tools', default = None, help = 'bin directory or install prefix of the LLVM toolchain, the tools on PATH by default')
+    parser.add_argument('--cache', default = None, help = 'path of the IR cache, in the user cache directory by default')
+
+    return parser.parse_args()
+
+
+def main():
+
+    arguments = parse_arguments()
+
+    toolchain = Toolchain.default_toolchain() if arguments.tools is None else Toolchain.toolchain(arguments.tools)
+    Pass_Registry.validate_passes(arguments.passes, toolchain.opt)
+
+    optimized_path = os.path.join(arguments.output, 'states')
+    os.makedirs(optimized_path, exist_ok = True)
+    cache = IR_Cache.IRCache(arguments.cache)
+
+    try:
+        graphs = explore_functions(arguments.program, arguments.passes, optimized_path, toolchain, cache, arguments.max_nodes, arguments.time_limit)
+    finally:
+        cache.close()
+
+    product_graph = ProductGraph(graphs).to_graph(arguments.passes, arguments.module_nodes)
+    summary = write_outputs(graphs, product_graph, arguments.output, os.path.basename(arguments.program))
+
+    for function, states in summary['functions'].items():
+        print('{}: {} states'.format(function, states))
+    print('Module: {} reachable states, at most {} combinations'.format(summary['module states'], summary['state bound']))
+
+
+if __name__ == '__main__':
+    main()
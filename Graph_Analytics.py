@@ -0,0 +1,356 @@
+# Analytics of a graph of program states, kept up to date while the exploration grows it. Every transition
+# (state, pass) -> state is recorded as it is inserted: the depth of every state (its distance in passes
+# from the root, known when a breadth first exploration first reaches it), the self-loops and state
+# changes of every pass and of every state, and the fixpoint states (expanded states no pass changes) are
+# counters updated in constant time. The strongly connected components are kept as labels and only
+# recomputed, with scipy.sparse.csgraph on the sparse adjacency, after an edge that may close a cycle was
+# added: one into a state that already leads to others, never one into the frontier. The
+# condensation DAG (its sink components and longest chain) is derived from the labels when asked for.
+# 100k-state graphs are analyzed in seconds. The results are written as node and edge attributes of the
+# graph and as a summary JSON.
+#
+# Usage: python Graph_Analytics.py <graph.gml> [--output <annotated.gml>] [--summary <summary.json>]
+
+import json
+import argparse
+from collections import deque
+
+
+class GraphAnalytics:
+    """
+    Incremental analytics of a growing graph of program states. Nodes are whatever the graph uses (program
+    paths, hashes), the first node added is the root.
+    """
+
+    def __init__(self):
+
+        # Node to index, and the per node counters by index
+        self.index = {}
+        self.nodes = []
+        self.depths = []
+        self.self_loops = []
+        self.changes = []
+
+        # Distinct edges between different nodes, by index, and the number of passes of every edge
+        self.sources = []
+        self.targets = []
+        self.edge_index = {}
+        self.edge_passes = []
+
+        # Pass to [applications, self-loops]
+        self.passes = {}
+        self.transitions = 0
+
+        # Strongly connected component of every node, stale once an edge may have merged components
+        self.labels = []
+        self.component_count = 0
+        self.stale = False
+
+    def add_node(self, node, parent = None, depth = None):
+        """
+        Records a new state.
+
+        Parameter:
+        node (object): the state
+        parent (object): state it was first reached from, None for the root
+        depth (int): distance from the root, the parent's depth plus one if None
+
+        Return:
+        index (int): index of the state
+        """
+
+        index = self.index.get(node)
+        if index is not None:
+            return index
+
+        if depth is None:
+            depth = 0 if parent is None else self.depths[self.index[parent]] + 1
+
+        index = len(self.nodes)
+        self.index[node] = index
+        self.nodes.append(node)
+        self.depths.append(depth)
+        self.self_loops.append(0)
+        self.changes.append(0)
+
+        # A new state is a component of its own until an edge closes a cycle through it
+        self.labels.append(self.component_count)
+        self.component_count += 1
+
+        return index
+
+    def add_transition(self, source, target, opt_pass):
+        """
+        Records that a pass turns a state into another, or leaves it unchanged if target is source.
+
+        Parameter:
+        source (object): state the pass is applied on
+        target (object): resulting state, added before with add_node()
+        opt_pass (string): pass applied
+
+        Return:
+        Nothing, updates the counters
+        """
+
+        source_index = self.index[source]
+        target_index = self.index[target]
+
+        counts = self.passes.get(opt_pass)
+        if counts is None:
+            counts = self.passes[opt_pass] = [0, 0]
+        counts[0] += 1
+        self.transitions += 1
+
+        if source_index == target_index:
+            counts[1] += 1
+            self.self_loops[source_index] += 1
+            return
+
+        self.changes[source_index] += 1
+
+        edge = self.edge_index.get((source_index, target_index))
+        if edge is not None:
+            self.edge_passes[edge] += 1
+            return
+
+        self.edge_index[(source_index, target_index)] = len(self.sources)
+        self.sources.append(source_index)
+        self.targets.append(target_index)
+        self.edge_passes.append(1)
+
+        # A cycle through the new edge needs a path back from its target, so the components can only merge if
+        # the target leads somewhere. Edges into the frontier of a breadth first exploration never do
+        if self.changes[target_index] > 0 and self.labels[source_index] != self.labels[target_index]:
+            self.stale = True
+
+    def expanded(self, index):
+        """
+        Whether passes were applied on a state.
+
+        Parameter:
+        index (int): index of the state
+
+        Return:
+        expanded (bool): True if at least one transition leaves the state
+        """
+
+        return self.self_loops[index] + self.changes[index] > 0
+
+    def components(self):
+        """
+        Strongly connected component of every state, recomputed only if an edge may have merged some.
+
+        Return:
+        labels (ndarray): component of every state, by index
+        """
+
+        import numpy as np
+
+        if self.stale:
+
+            from scipy.sparse import csr_matrix
+            from scipy.sparse.csgraph import connected_components
+
+            size = len(self.nodes)
+            adjacency = csr_matrix((np.ones(len(self.sources), dtype = np.int8), (self.sources, self.targets)), shape = (size, size))
+            self.component_count, labels = connected_components(adjacency, directed = True, connection = 'strong')
+            self.labels = labels.tolist()
+            self.stale = False
+
+        return np.asarray(self.labels, dtype = np.int64)
+
+    def condensation(self):
+        """
+        DAG of the strongly connected components.
+
+        Return:
+        labels (ndarray): component of every state
+        edges (ndarray): (source component, target component) rows, without duplicates
+        sinks (ndarray): components no edge leaves, the cycles or fixpoints every walk ends in
+        longest_chain (int): number of components on the longest path of the DAG
+        """
+
+        import numpy as np
+
+        labels = self.components()
+        count = self.component_count
+
+        sources = labels[np.asarray(self.sources, dtype = np.int64)]
+        targets = labels[np.asarray(self.targets, dtype = np.int64)]
+        crossing = sources != targets
+        keys = np.unique(sources[crossing] * count + targets[crossing])
+        edges = np.stack([keys // count, keys % count], axis = 1)
+
+        out_degree = np.bincount(edges[:, 0], minlength = count)
+        sinks = np.flatnonzero(out_degree == 0)
+
+        # Longest chain by Kahn's topological order over the condensation
+        in_degree = np.bincount(edges[:, 1], minlength = count)
+        order = np.argsort(edges[:, 0], kind = 'stable')
+        successors = edges[order, 1].tolist()
+        starts = np.concatenate([[0], np.cumsum(out_degree)]).tolist()
+        in_degree = in_degree.tolist()
+        chain = [1] * count
+        ready = deque(component for component in range(count) if in_degree[component] == 0)
+
+        while ready:
+            component = ready.popleft()
+            for successor in successors[starts[component]:starts[component + 1]]:
+                chain[successor] = max(chain[successor], chain[component] + 1)
+                in_degree[successor] -= 1
+                if in_degree[successor] == 0:
+                    ready.append(successor)
+
+        return labels, edges, sinks, max(chain, default = 0)
+
+    def summary(self):
+        """
+        Summary of the graph.
+
+        Return:
+        summary (dict): sizes, components, condensation, fixpoints, depths and the rates of every pass
+        """
+
+        import numpy as np
+
+        labels, edges, sinks, longest_chain = self.condensation()
+        sizes = np.bincount(labels, minlength = self.component_count) if len(labels) else np.zeros(0, dtype = np.int64)
+
+        expanded = [index for index in range(len(self.nodes)) if self.expanded(index)]
+        fixpoints = [index for index in expanded if self.changes[index] == 0]
+        depths = np.bincount(np.asarray(self.depths, dtype = np.int64)) if self.depths else np.zeros(0, dtype = np.int64)
+        self_loops = sum(counts[1] for counts in self.passes.values())
+
+        return {
+            'nodes': len(self.nodes),
+            'edges': len(self.sources),
+            'transitions': self.transitions,
+            'self loops': self_loops,
+            'self loop rate': self_loops / self.transitions if self.transitions else None,
+            'expanded nodes': len(expanded),
+            'fixpoint nodes': len(fixpoints),
+            'strongly connected components': self.component_count,
+            'nontrivial components': int(np.count_nonzero(sizes > 1)),
+            'largest component': int(sizes.max()) if len(sizes) else 0,
+            'condensation edges': len(edges),
+            'sink components': len(sinks),
+            'longest chain': longest_chain,
+            'max depth': len(depths) - 1,
+            'nodes per depth': depths.tolist(),
+            'passes': {opt_pass: {'applications': applications, 'self loops': loops, 'state changes': applications - loops,
+                                  'state change rate': (applications - loops) / applications}
+                       for opt_pass, (applications, loops) in sorted(self.passes.items())}
+        }
+
+    def annotate(self, graph):
+        """
+        Writes the analytics as node and edge attributes of the graph, under GML compatible names.
+
+        Parameter:
+        graph (DiGraph): the graph analyzed, with the same nodes
+
+        Return:
+        Nothing, sets 'depth', 'scc', 'expanded', 'fixpoint', 'self_loops' and 'changes' on the nodes, and
+        'passes' (number of passes) and 'condensation' (1 if it leaves its component) on the edges
+        """
+
+        labels = self.components().tolist()
+
+        for index, node in enumerate(self.nodes):
+            attributes = graph.nodes[node]
+            attributes['depth'] = self.depths[index]
+            attributes['scc'] = labels[index]
+            attributes['expanded'] = int(self.expanded(index))
+            attributes['fixpoint'] = int(self.expanded(index) and self.changes[index] == 0)
+            attributes['self_loops'] = self.self_loops[index]
+            attributes['changes'] = self.changes[index]
+
+        for (source, target), edge in self.edge_index.items():
+            attributes = graph[self.nodes[source]][self.nodes[target]]
+            attributes['passes'] = self.edge_passes[edge]
+            attributes['condensation'] = int(labels[source] != labels[target])
+
+    def write_summary(self, summary_path):
+        """
+        Outputs the summary as JSON.
+
+        Parameter:
+        summary_path (string): path of the JSON file
+
+        Return:
+        Nothing, generates the file
+        """
+
+        with open(summary_path, 'w') as file:
+            json.dump(self.summary(), file, indent = 2)
+
+
+def from_graph(graph, root = None):
+    """
+    Analytics of a finished graph, e.g. read from a GML file. Self-loops and edges holding several passes
+    in 'relationship' count one transition per pass.
+
+    Parameter:
+    graph (DiGraph): graph of program states
+    root (object): root state, the first node if None
+
+    Return:
+    analytics (GraphAnalytics): the analytics of the graph
+    """
+
+    import networkx as nx
+
+    analytics = GraphAnalytics()
+    if graph.number_of_nodes() == 0:
+        return analytics
+
+    if root is None:
+        root = next(iter(graph.nodes))
+
+    # States unreachable from the root (none in an explored graph) get depth -1
+    depths = nx.single_source_shortest_path_length(graph, root)
+    analytics.add_node(root, depth = 0)
+    for node in graph.nodes:
+        analytics.add_node(node, depth = depths.get(node, -1))
+
+    for source, target, data in graph.edges(data = True):
+        for opt_pass in str(data.get('relationship', '')).split(','):
+            analytics.add_transition(source, target, opt_pass)
+
+    # Edges were added out of discovery order, so the components are recomputed from scratch
+    analytics.stale = True
+
+    return analytics
+
+
+def parse_arguments():
+
+    parser = argparse.ArgumentParser(description = 'Components, condensation, fixpoints, depths and pass rates of a graph of program states.')
+    parser.add_argument('graph', help = 'GML file written by Pass_Relations_Graph.py, Exploration.py or Random_Walks.py')
+    parser.add_argument('--output', default = None, help = 'GML file the annotated graph is written to')
+    parser.add_argument('--summary', default = None, help = 'JSON file the summary is written to, printed if not given')
+
+    return parser.parse_args()
+
+
+def main():
+
+    import networkx as nx
+
+    arguments = parse_arguments()
+
+    graph = nx.read_gml(arguments.graph)
+    analytics = from_graph(graph)
+
+    if arguments.output is not None:
+        analytics.annotate(graph)
+        nx.write_gml(graph, arguments.output)
+
+    if arguments.summary is not None:
+        analytics.write_summary(arguments.summary)
+    else:
+        print(json.dumps(analytics.summary(), indent = 2))
+
+
+if __name__ == '__main__':
+    main()
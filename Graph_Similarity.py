@@ -0,0 +1,491 @@
+# Similarity of the transition graphs of a whole benchmark, without comparing every pair of graphs. Every
+# graph gets a fixed-width Weisfeiler-Lehman fingerprint: states start labelled by whether they are the root
+# and by the passes that leave them unchanged, each round relabels a state with the passes and labels of
+# its incoming and outgoing edges, and the labels of every round are feature hashed (signed) into a vector
+# of DIMENSIONS floats. Each round's vector is normalized and weighted by ROUND_DECAY to the power of the
+# round, so a small change, which alters the labels of a whole neighbourhood in the later rounds, only
+# lowers the similarity a little, and the sum is normalized so the dot product of two fingerprints is their
+# cosine similarity. GML files are read with a parser for the flat files the explorations write, networkx
+# is only used for other files. The fingerprints are indexed with SimHash (random hyperplane) signatures
+# split in LSH bands, so a query only compares the graphs sharing a band with it, and nearest neighbours or
+# groups over thousands of graphs take seconds.
+#
+# Usage: python Graph_Similarity.py <gml directory> [--fingerprints <fingerprints.npz>] [--neighbors 5]
+#                                   [--threshold 0.9] [--query <graph.gml>] [--output <neighbors.csv>]
+
+import os
+import csv
+import hashlib
+import argparse
+import numpy as np
+
+# Width of the fingerprints
+DIMENSIONS = 1024
+
+# Relabelling rounds, a state's label describes its neighbourhood up to this many passes away
+ITERATIONS = 3
+
+# Share of the similarity carried by every round relative to the previous one
+ROUND_DECAY = 0.5
+
+# Distinct fingerprints in a bucket up to which groups() compares all their pairs
+EXACT_BUCKET = 256
+
+
+def stable_hash(text):
+    """
+    Hash of a string that is the same in every process, unlike hash().
+
+    Parameter:
+    text (string): the string
+
+    Return:
+    value (int): unsigned 64 bit hash
+    """
+
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size = 8).digest(), 'little')
+
+
+def wl_labels(graph, iterations = ITERATIONS, root = None):
+    """
+    Weisfeiler-Lehman labels of the states of a graph, every edge counting once per pass in its 'relationship'.
+
+    Parameter:
+    graph (DiGraph): graph of program states
+    iterations (int): relabelling rounds
+    root (object): root state, the first node if None
+
+    Return:
+    rounds (list: list): labels of every state, one list per round including the initial one
+    """
+
+    nodes = list(graph.nodes)
+    if not nodes:
+        return []
+
+    if root is None:
+        root = nodes[0]
+
+    index = {node: position for position, node in enumerate(nodes)}
+    outgoing = [[] for node in nodes]
+    incoming = [[] for node in nodes]
+    unchanged = [[] for node in nodes]
+
+    for source, target, data in graph.edges(data = True):
+        for opt_pass in str(data.get('relationship', '')).split(','):
+            if source == target:
+                unchanged[index[source]].append(opt_pass)
+            else:
+                outgoing[index[source]].append((opt_pass, index[target]))
+                incoming[index[target]].append((opt_pass, index[source]))
+
+    labels = [stable_hash(('root|' if node == root else '|') + ','.join(sorted(unchanged[position]))) for position, node in enumerate(nodes)]
+    rounds = [labels]
+
+    for iteration in range(iterations):
+
+        labels = [stable_hash('{}|{}|{}'.format(labels[position],
+                                                ','.join(sorted('{}:{}'.format(opt_pass, labels[target]) for opt_pass, target in outgoing[position])),
+                                                ','.join(sorted('{}:{}'.format(opt_pass, labels[source]) for opt_pass, source in incoming[position]))))
+                  for position in range(len(nodes))]
+        rounds.append(labels)
+
+    return rounds
+
+
+def fingerprint(graph, iterations = ITERATIONS, dimensions = DIMENSIONS, root = None):
+    """
+    Fixed-width fingerprint of a graph: the signed feature hashing of its Weisfeiler-Lehman labels.
+
+    Parameter:
+    graph (DiGraph): graph of program states
+    iterations (int): relabelling rounds
+    dimensions (int): width of the fingerprint
+    root (object): root state, the first node if None
+
+    Return:
+    vector (ndarray): float32 vector of unit length, zero for an empty graph
+    """
+
+    vector = np.zeros(dimensions, dtype = np.float32)
+
+    for iteration, labels in enumerate(wl_labels(graph, iterations, root)):
+
+        # The round is part of the feature, so the same label in two rounds counts as two features
+        features = np.array([stable_hash('{}:{}'.format(iteration, label)) for label in labels], dtype = np.uint64)
+        signs = np.where(features & np.uint64(1), np.float32(1), np.float32(-1))
+        round_vector = np.zeros(dimensions, dtype = np.float32)
+        np.add.at(round_vector, ((features >> np.uint64(1)) % np.uint64(dimensions)).astype(np.int64), signs)
+
+        norm = np.linalg.norm(round_vector)
+        if norm > 0:
+            vector += round_vector * np.float32(ROUND_DECAY ** (iteration / 2) / norm)
+
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+
+    return vector
+
+
+def read_gml(gml_path):
+    """
+    Reads a GML file. The flat files written by the explorations (nodes and edges holding only numbers and
+    strings) are parsed directly, many times faster than networkx, anything else goes through networkx.
+
+    Parameter:
+    gml_path (string): path to the GML file
+
+    Return:
+    graph (DiGraph): the graph, nodes are named by their label and edges hold 'relationship'
+    """
+
+    import networkx as nx
+
+    graph = nx.DiGraph()
+    labels = {}
+    edges = []
+    block = None
+    attributes = {}
+
+    with open(gml_path, 'r') as file:
+        for line in file:
+
+            tokens = line.split(None, 1)
+            if not tokens:
+                continue
+
+            key = tokens[0]
+
+            if key in ('node', 'edge') and tokens[1].strip() == '[':
+                if block is not None:
+                    return nx.read_gml(gml_path)
+                block = key
+                attributes = {}
+            elif key == ']':
+                if block == 'node':
+                    labels[attributes['id']] = attributes.get('label', attributes['id'])
+                    graph.add_node(labels[attributes['id']])
+                elif block == 'edge':
+                    edges.append((attributes['source'], attributes['target'], attributes.get('relationship', '')))
+                block = None
+            elif block is not None:
+
+                # Nested lists and multi-line strings need the full parser
+                if len(tokens) < 2 or tokens[1].strip() == '[':
+                    return nx.read_gml(gml_path)
+                value = tokens[1].strip()
+                if value.startswith('"'):
+                    if not value.endswith('"') or len(value) < 2:
+                        return nx.read_gml(gml_path)
+                    value = value[1:-1]
+                attributes[key] = value
+
+    for source, target, relationship in edges:
+        graph.add_edge(labels[source], labels[target], relationship = relationship)
+
+    return graph
+
+
+def fingerprint_files(gml_paths, iterations = ITERATIONS, dimensions = DIMENSIONS):
+    """
+    Fingerprints of GML files written by Pass_Relations_Graph.py, Exploration.py or Random_Walks.py.
+
+    Parameter:
+    gml_paths (list: string): paths to the GML files
+    iterations (int): relabelling rounds
+    dimensions (int): width of the fingerprints
+
+    Return:
+    fingerprints (ndarray): float32 matrix of shape (graphs, dimensions)
+    """
+
+    fingerprints = np.zeros((len(gml_paths), dimensions), dtype = np.float32)
+
+    for row, gml_path in enumerate(gml_paths):
+        fingerprints[row] = fingerprint(read_gml(gml_path), iterations, dimensions)
+
+    return fingerprints
+
+
+def save_fingerprints(npz_path, graphs, fingerprints):
+    """
+    Saves the fingerprints along with the name of every graph.
+
+    Parameter:
+    npz_path (string): path of the .npz file to write
+    graphs (list: string): graph name of every row
+    fingerprints (ndarray): fingerprint matrix as returned by fingerprint_files()
+
+    Return:
+    Nothing, writes the .npz file
+    """
+
+    np.savez(npz_path, fingerprints = fingerprints, graphs = np.array(graphs))
+
+
+def load_fingerprints(npz_path):
+    """
+    Loads fingerprints saved by save_fingerprints().
+
+    Parameter:
+    npz_path (string): path of the .npz file
+
+    Return:
+    graphs (list: string): graph name of every row
+    fingerprints (ndarray): fingerprint matrix
+    """
+
+    with np.load(npz_path) as data:
+        return data['graphs'].tolist(), data['fingerprints']
+
+
+class SimilarityIndex:
+    """
+    SimHash LSH index of fingerprints. Two fingerprints at cosine similarity s agree on each signature bit
+    with probability 1 - arccos(s) / pi, and become candidates if they agree on all the bits of one band.
+    Identical fingerprints (the graphs of small loop-free programs are often the same) are indexed once.
+
+    Parameter:
+    graphs (list: string): graph name of every row
+    fingerprints (ndarray): fingerprint matrix of shape (graphs, dimensions)
+    bands (int): number of LSH bands
+    rows (int): signature bits per band, at most 64
+    seed (int): seed of the hyperplanes
+    """
+
+    def __init__(self, graphs, fingerprints, bands = 16, rows = 8, seed = 0):
+
+        self.graphs = graphs
+        self.fingerprints = fingerprints
+        self.bands = bands
+        self.rows = rows
+
+        self.planes = np.random.default_rng(seed).standard_normal((fingerprints.shape[1], bands * rows)).astype(np.float32)
+        self.weights = (np.uint64(1) << np.arange(rows, dtype = np.uint64))
+
+        # Distinct fingerprints in order of their first row, the distinct fingerprint of every row and the
+        # rows of every distinct fingerprint. Keyed by their bytes, many times faster than np.unique(axis = 0)
+        distinct = {}
+        self.members = []
+        for row, vector in enumerate(fingerprints):
+            unique = distinct.setdefault(vector.tobytes(), len(self.members))
+            if unique == len(self.members):
+                self.members.append([])
+            self.members[unique].append(row)
+
+        self.unique = fingerprints[np.array([rows[0] for rows in self.members], dtype = np.int64)]
+        self.unique_of = np.zeros(len(fingerprints), dtype = np.int64)
+        for unique, rows in enumerate(self.members):
+            self.unique_of[rows] = unique
+
+        # Bucket key of every distinct fingerprint in every band, and the distinct fingerprints of every bucket
+        self.keys = self.band_keys(self.unique)
+        self.buckets = []
+        for band in range(bands):
+            buckets = {}
+            for unique, key in enumerate(self.keys[:, band].tolist()):
+                buckets.setdefault(key, []).append(unique)
+            self.buckets.append(buckets)
+
+    def band_keys(self, fingerprints):
+        """
+        Bucket keys of fingerprints.
+
+        Parameter:
+        fingerprints (ndarray): fingerprint matrix of shape (n, dimensions)
+
+        Return:
+        keys (ndarray): uint64 matrix of shape (n, bands)
+        """
+
+        bits = (fingerprints @ self.planes > 0).astype(np.uint64).reshape(len(fingerprints), self.bands, self.rows)
+
+        return (bits * self.weights).sum(axis = 2, dtype = np.uint64)
+
+    def candidates(self, keys):
+        """
+        Distinct fingerprints sharing at least one band with a signature.
+
+        Parameter:
+        keys (ndarray): bucket keys of the signature, one per band
+
+        Return:
+        uniques (ndarray): candidate rows of the distinct fingerprints, sorted
+        """
+
+        uniques = set()
+        for band, key in enumerate(keys.tolist()):
+            uniques.update(self.buckets[band].get(key, ()))
+
+        return np.array(sorted(uniques), dtype = np.int64)
+
+    def query(self, vector, k = 5, exclude = None):
+        """
+        Approximate nearest neighbours of a fingerprint, ranked by their exact cosine similarity.
+
+        Parameter:
+        vector (ndarray): fingerprint of the query
+        k (int): number of neighbours
+        exclude (int): row left out of the results
+
+        Return:
+        neighbours (list: tuple): (graph name, similarity) of at most k graphs, most similar first
+        """
+
+        uniques = self.candidates(self.band_keys(vector[np.newaxis])[0])
+        if len(uniques) == 0:
+            return []
+
+        # Every distinct fingerprint is compared once, then stands for all its rows
+        similarities = self.unique[uniques] @ vector
+        first_rows = np.array([self.members[unique][0] for unique in uniques.tolist()], dtype = np.int64)
+
+        neighbours = []
+        for position in np.lexsort((first_rows, -similarities)).tolist():
+            for row in self.members[uniques[position]]:
+                if row == exclude:
+                    continue
+                neighbours.append((self.graphs[row], float(similarities[position])))
+                if len(neighbours) == k:
+                    return neighbours
+
+        return neighbours
+
+    def neighbors(self, k = 5):
+        """
+        Approximate nearest neighbours of every indexed graph.
+
+        Parameter:
+        k (int): number of neighbours per graph
+
+        Return:
+        neighbours (list: list): (graph name, similarity) of the neighbours of every row
+        """
+
+        return [self.query(self.fingerprints[row], k, exclude = row) for row in range(len(self.graphs))]
+
+    def groups(self, threshold = 0.9):
+        """
+        Groups of similar graphs: connected components, found with union-find, of the graphs at cosine
+        similarity at least threshold that share a bucket. Identical fingerprints are compared once. A bucket
+        of up to EXACT_BUCKET distinct fingerprints compares all their pairs. A larger one (near identical
+        graphs) compares every fingerprint with one representative of each group already met in the bucket,
+        joining (and merging) the groups it is similar enough to, so it never builds a members x members matrix.
+
+        Parameter:
+        threshold (float): minimum cosine similarity of two graphs in a group
+
+        Return:
+        groups (list: list): groups of at least 2 graph names, largest first
+        """
+
+        parents = list(range(len(self.unique)))
+
+        def find(unique):
+            while parents[unique] != unique:
+                parents[unique] = parents[parents[unique]]
+                unique = parents[unique]
+            return unique
+
+        def union(first, second):
+            parents[find(first)] = find(second)
+
+        for buckets in self.buckets:
+            for uniques in buckets.values():
+
+                if len(uniques) < 2:
+                    continue
+
+                if len(uniques) <= EXACT_BUCKET:
+                    vectors = self.unique[uniques]
+                    first, second = np.nonzero(np.triu(vectors @ vectors.T >= threshold, k = 1))
+                    for position, other in zip(first.tolist(), second.tolist()):
+                        union(uniques[position], uniques[other])
+                    continue
+
+                # Representatives of the groups met in this bucket
+                representatives = [uniques[0]]
+
+                for unique in uniques[1:]:
+
+                    similarities = self.unique[representatives] @ self.unique[unique]
+                    linked = np.flatnonzero(similarities >= threshold).tolist()
+
+                    if not linked:
+                        representatives.append(unique)
+                    for position in linked:
+                        union(representatives[position], unique)
+
+        groups = {}
+        for row, unique in enumerate(self.unique_of.tolist()):
+            groups.setdefault(find(unique), []).append(self.graphs[row])
+
+        return sorted((group for group in groups.values() if len(group) > 1), key = len, reverse = True)
+
+
+def write_neighbors(csv_path, graphs, neighbors):
+    """
+    Outputs the nearest neighbours of every graph to a csv file.
+
+    Parameter:
+    csv_path (string): path of the csv file
+    graphs (list: string): graph name of every row
+    neighbors (list: list): neighbours of every row as returned by SimilarityIndex.neighbors()
+
+    Return:
+    Nothing, generates the csv file
+    """
+
+    with open(csv_path, mode = 'w', newline = '') as file:
+
+        writer = csv.writer(file)
+        writer.writerow(['Graph Name', 'Neighbor', 'Similarity'])
+
+        for graph, graph_neighbors in zip(graphs, neighbors):
+            for neighbor, similarity in graph_neighbors:
+                writer.writerow([graph, neighbor, similarity])
+
+
+def parse_arguments():
+
+    parser = argparse.ArgumentParser(description = 'Fingerprints the transition graphs of a benchmark and finds similar graphs with LSH.')
+    parser.add_argument('directory', help = 'directory of GML files, e.g. gml_files')
+    parser.add_argument('--fingerprints', default = None, help = '.npz file caching the fingerprints, computed and written if missing')
+    parser.add_argument('--neighbors', type = int, default = 5, help = 'nearest neighbours listed for every graph')
+    parser.add_argument('--threshold', type = float, default = 0.9, help = 'minimum cosine similarity of two graphs in a group')
+    parser.add_argument('--query', default = None, help = 'GML file whose nearest neighbours are printed')
+    parser.add_argument('--output', default = None, help = 'csv file the neighbours of every graph are written to')
+
+    return parser.parse_args()
+
+
+def main():
+
+    arguments = parse_arguments()
+
+    if arguments.fingerprints is not None and os.path.exists(arguments.fingerprints):
+        graphs, fingerprints = load_fingerprints(arguments.fingerprints)
+    else:
+        graphs = sorted(name for name in os.listdir(arguments.directory) if name.endswith('.gml'))
+        fingerprints = fingerprint_files([os.path.join(arguments.directory, name) for name in graphs])
+        if arguments.fingerprints is not None:
+            save_fingerprints(arguments.fingerprints, graphs, fingerprints)
+
+    index = SimilarityIndex(graphs, fingerprints)
+
+    if arguments.query is not None:
+        for graph, similarity in index.query(fingerprint(read_gml(arguments.query)), arguments.neighbors):
+            print('{:.4f} {}'.format(similarity, graph))
+        return
+
+    if arguments.output is not None:
+        write_neighbors(arguments.output, graphs, index.neighbors(arguments.neighbors))
+
+    # Groups of graphs whose transition structure is near identical
+    for group in index.groups(arguments.threshold):
+        print(group)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+# Cache shared by every exploration and every toolchain. IR is canonicalized (comments and the source
+# file name dropped, whitespace normalized) and stored once under the SHA-256 of the canonical text, so
+# identical programs are recognized by hash without running llvm-diff. Transitions (program, pass) ->
+# program are keyed by toolchain, since each LLVM version transforms programs differently, while the
+# content-addressed IR and the llvm-diff verdicts between two programs are shared by every toolchain.
+# Everything lives in one SQLite file in WAL mode, so threads and processes can share it safely.
+
+import os
+import re
+import zlib
+import hashlib
+import sqlite3
+import threading
+
+# Trailing comment of a line of IR, e.g. '; preds = %entry'. Only stripped from lines without strings
+TRAILING_COMMENT = re.compile(r'\s*;.*$')
+
+
+def canonicalize_ir(ir):
+    """
+    Canonical form of an LLVM IR file: comments, the source file name, trailing whitespace and blank lines
+    are dropped, so two programs differing only in those get the same text.
+
+    Parameter:
+    ir (string): contents of the LLVM IR file
+
+    Return:
+    canonical_ir (string): canonical text, still valid LLVM IR
+    """
+
+    lines = []
+
+    for line in ir.splitlines():
+
+        # Module id and source file name depend on the file the program was read from
+        if line.startswith('source_filename'):
+            continue
+
+        if '"' not in line:
+            line = TRAILING_COMMENT.sub('', line)
+
+        line = line.rstrip()
+        if line == '':
+            continue
+
+        lines.append(line)
+
+    return '\n'.join(lines) + '\n'
+
+
+def ir_hash(canonical_ir):
+    """
+    Content address of a canonical IR text.
+
+    Parameter:
+    canonical_ir (string): canonical text as returned by canonicalize_ir()
+
+    Return:
+    digest (string): hex SHA-256 of the text
+    """
+
+    return hashlib.sha256(canonical_ir.encode()).hexdigest()
+
+
+def cache_directory():
+    """
+    Default directory of the shared cache.
+
+    Return:
+    path (string): path to the cache directory
+    """
+
+    return os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')), 'llvm-evolution')
+
+
+class IRCache:
+    """
+    Content-addressed IR, per-toolchain transitions and llvm-diff verdicts in a single SQLite file.
+    """
+
+    def __init__(self, cache_path = None):
+
+        if cache_path is None:
+            cache_path = os.path.join(cache_directory(), 'ir-cache.sqlite')
+
+        self.cache_path = cache_path
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok = True)
+
+        # One connection shared by the threads of this process, writes commit immediately
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(cache_path, timeout = 60, check_same_thread = False, isolation_level = None)
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.execute('PRAGMA synchronous = NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, ir BLOB)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS transitions (toolchain TEXT, source TEXT, pass TEXT, target TEXT, PRIMARY KEY (toolchain, source, pass))')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS diffs (first TEXT, second TEXT, additions INTEGER, deletions INTEGER, PRIMARY KEY (first, second))')
+
+    def execute(self, statement, parameters = ()):
+        """
+        Runs a statement under the lock.
+
+        Parameter:
+        statement (string): SQL statement
+        parameters (tuple): parameters of the statement
+
+        Return:
+        row (tuple): first row of the result, None if there is none
+        """
+
+        with self.lock:
+            return self.connection.execute(statement, parameters).fetchone()
+
+    def put_ir(self, ir):
+        """
+        Stores the canonical form of an IR text.
+
+        Parameter:
+        ir (string): contents of an LLVM IR file
+
+        Return:
+        digest (string): content address of the program
+        """
+
+        canonical_ir = canonicalize_ir(ir)
+        digest = ir_hash(canonical_ir)
+
+        self.execute('INSERT OR IGNORE INTO blobs VALUES (?, ?)', (digest, zlib.compress(canonical_ir.encode())))
+
+        return digest
+
+    def put_file(self, path):
+        """
+        Stores the canonical form of an LLVM IR file.
+
+        Parameter:
+        path (string): path to the LLVM IR file
+
+        Return:
+        digest (string): content address of the program
+        """
+
+        with open(path, 'r') as file:
+            return self.put_ir(file.read())
+
+    def has_ir(self, digest):
+        """
+        Whether a program is stored.
+
+        Parameter:
+        digest (string): content address of the program
+
+        Return:
+        stored (bool): True if the program is in the cache
+        """
+
+        return self.execute('SELECT 1 FROM blobs WHERE hash = ?', (digest,)) is not None
+
+    def get_ir(self, digest):
+        """
+        Canonical IR of a stored program.
+
+        Parameter:
+        digest (string): content address of the program
+
+        Return:
+        canonical_ir (string): canonical text of the program
+        """
+
+        row = self.execute('SELECT ir FROM blobs WHERE hash = ?', (digest,))
+        if row is None:
+            raise KeyError(digest)
+
+        return zlib.decompress(row[0]).decode()
+
+    def materialize(self, digest, path):
+        """
+        Writes a stored program to a file so opt and llvm-diff can read it.
+
+        Parameter:
+        digest (string): content address of the program
+        path (string): path of the file to write
+
+        Return:
+        path (string): the written path
+        """
+
+        with open(path, 'w') as file:
+            file.write(self.get_ir(digest))
+
+        return path
+
+    def transition(self, toolchain_key, source, opt_pass):
+        """
+        Program a pass turns a program into, if it was computed before with this toolchain.
+
+        Parameter:
+        toolchain_key (string): key of the toolchain
+        source (string): content address of the program the pass is applied on
+        opt_pass (string): pass applied
+
+        Return:
+        target (string): content address of the resulting program, None if unknown
+        """
+
+        row = self.execute('SELECT target FROM transitions WHERE toolchain = ? AND source = ? AND pass = ?', (toolchain_key, source, opt_pass))
+
+        return None if row is None else row[0]
+
+    def add_transition(self, toolchain_key, source, opt_pass, target):
+        """
+        Records the program a pass turns a program into with a toolchain.
+
+        Parameter:
+        toolchain_key (string): key of the toolchain
+        source (string): content address of the program the pass is applied on
+        opt_pass (string): pass applied
+        target (string): content address of the resulting program
+
+        Return:
+        Nothing, inserts the transition
+        """
+
+        self.execute('INSERT OR REPLACE INTO transitions VALUES (?, ?, ?, ?)', (toolchain_key, source, opt_pass, target))
+
+    def diff(self, first, second):
+        """
+        llvm-diff verdict between two programs, if it was computed before.
+
+        Parameter:
+        first (string): content address of the first program
+        second (string): content address of the second program
+
+        Return:
+        differences (dict: int): 'Num Additions' and 'Num Deletions', None if unknown
+        """
+
+        row = self.execute('SELECT additions, deletions FROM diffs WHERE first = ? AND second = ?', (first, second))
+        if row is None:
+            return None
+
+        return {'Num Additions': row[0], 'Num Deletions': row[1]}
+
+    def add_diff(self, first, second, differences):
+        """
+        Records the llvm-diff verdict between two programs.
+
+        Parameter:
+        first (string): content address of the first program
+        second (string): content address of the second program
+        differences (dict: int): 'Num Additions' and 'Num Deletions'
+
+        Return:
+        Nothing, inserts the verdict
+        """
+
+        self.execute('INSERT OR REPLACE INTO diffs VALUES (?, ?, ?, ?)', (first, second, differences['Num Additions'], differences['Num Deletions']))
+
+    def close(self):
+        """
+        Closes the cache.
+
+        Return:
+        Nothing, closes the SQLite connection
+        """
+
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,212 @@
+# Extracts a fixed-width numeric feature vector for every (original, optimized) pair of LLVM IR files.
+# Each file is scanned once, counting functions, basic blocks, instructions and a histogram of opcodes,
+# and the vector of a pair holds the change of every count plus the byte size of both files. Vectors are
+# written straight into a NumPy array so they can be used as clustering inputs.
+
+import numpy as np
+import re
+
+# Every LLVM IR instruction opcode, in histogram order
+OPCODES = ['ret', 'br', 'switch', 'indirectbr', 'invoke', 'resume', 'unreachable', 'callbr', 'fneg', 'add', 'fadd', 'sub',
+           'fsub', 'mul', 'fmul', 'udiv', 'sdiv', 'fdiv', 'urem', 'srem', 'frem', 'shl', 'lshr', 'ashr', 'and', 'or', 'xor',
+           'extractelement', 'insertelement', 'shufflevector', 'extractvalue', 'insertvalue', 'alloca', 'load', 'store', 'fence',
+           'cmpxchg', 'atomicrmw', 'getelementptr', 'trunc', 'zext', 'sext', 'fptrunc', 'fpext', 'fptoui', 'fptosi', 'uitofp',
+           'sitofp', 'ptrtoint', 'inttoptr', 'bitcast', 'addrspacecast', 'icmp', 'fcmp', 'phi', 'select', 'freeze', 'call',
+           'va_arg', 'landingpad', 'catchpad', 'cleanuppad', 'catchret', 'cleanupret', 'catchswitch']
+
+# Position of every opcode in the histogram
+OPCODE_INDEX = {opcode: index for index, opcode in enumerate(OPCODES)}
+
+# Structural counts kept before the opcode histogram
+STRUCTURE_COUNTS = ['functions', 'basic blocks', 'instructions']
+
+# Names of the columns of a pair's feature vector
+FEATURE_NAMES = (['Delta ' + name for name in STRUCTURE_COUNTS] + ['Original Bytes', 'Optimized Bytes', 'Delta Bytes'] +
+                 ['Delta ' + opcode for opcode in OPCODES])
+
+# Call markers that come before the opcode
+CALL_MARKERS = ('tail', 'musttail', 'notail')
+
+# Basic block label at the start of an unindented line, e.g. '5:' or 'for.body:'
+LABEL = re.compile(r'^([-\w.$]+|"[^"]*"):')
+
+
+def ir_counts(ir_path):
+    """
+    Scans an LLVM IR file once and counts its functions, basic blocks, instructions and opcodes.
+
+    Parameter:
+    ir_path (string): path to the LLVM IR file
+
+    Return:
+    counts (ndarray): the structure counts followed by the opcode histogram
+    size (int): size of the file in bytes
+    """
+
+    counts = np.zeros(len(STRUCTURE_COUNTS) + len(OPCODES), dtype = np.int64)
+    histogram = counts[len(STRUCTURE_COUNTS):]
+
+    with open(ir_path, 'r') as file:
+        text = file.read()
+
+    in_function = False
+
+    # Whether the entry block of the current function is still waiting for its first instruction
+    in_entry_block = False
+
+    for line in text.splitlines():
+
+        # Start of a function body, its entry block has no label
+        if line.startswith('define '):
+            in_function = True
+            in_entry_block = True
+            counts[0] += 1
+            counts[1] += 1
+            continue
+
+        if not in_function:
+            continue
+
+        # End of the function body
+        if line.startswith('}'):
+            in_function = False
+            continue
+
+        # Label of a new basic block, unless it names the entry block already counted
+        if LABEL.match(line):
+            if not in_entry_block:
+                counts[1] += 1
+            in_entry_block = False
+            continue
+
+        # Instruction, the opcode follows the assigned value if there is one
+        tokens = line.split()
+        if len(tokens) == 0:
+            continue
+        if len(tokens) > 2 and tokens[1] == '=':
+            tokens = tokens[2:]
+        if tokens[0] in CALL_MARKERS and len(tokens) > 1:
+            tokens = tokens[1:]
+
+        # Continuation lines such as switch cases don't start with an opcode
+        opcode_index = OPCODE_INDEX.get(tokens[0])
+        if opcode_index is not None:
+            histogram[opcode_index] += 1
+            counts[2] += 1
+            in_entry_block = False
+
+    return counts, len(text.encode())
+
+
+def original_counts(original_paths):
+    """
+    Scans every original file once into preallocated arrays, so the passes of a sweep sharing the same
+    originals don't scan them again.
+
+    Parameter:
+    original_paths (list: string): path to every LLVM IR file that wasn't optimized
+
+    Return:
+    counts (ndarray): array of shape (originals, counts), row i holds the counts of original_paths[i]
+    sizes (ndarray): size in bytes of every original
+    """
+
+    counts = np.zeros((len(original_paths), len(STRUCTURE_COUNTS) + len(OPCODES)), dtype = np.int64)
+    sizes = np.zeros(len(original_paths), dtype = np.int64)
+
+    for row, original_path in enumerate(original_paths):
+        counts[row], sizes[row] = ir_counts(original_path)
+
+    return counts, sizes
+
+
+def pair_features(original_path, optimized_path, out = None, original = None):
+    """
+    Computes the feature vector of one (original, optimized) pair.
+
+    Parameter:
+    original_path (string): path to the LLVM IR file that wasn't optimized
+    optimized_path (string): path to the LLVM IR file that was optimized
+    out (ndarray): row to write the vector into, a new array is allocated if None
+    original (tuple): counts and size of the original as returned by ir_counts(), the file is scanned if None
+
+    Return:
+    features (ndarray): vector laid out as FEATURE_NAMES
+    """
+
+    if out is None:
+        out = np.zeros(len(FEATURE_NAMES), dtype = np.float32)
+
+    if original is None:
+        original = ir_counts(original_path)
+
+    counts, original_size = original
+    optimized_counts, optimized_size = ir_counts(optimized_path)
+
+    delta = optimized_counts - counts
+
+    # Structure deltas, byte sizes, then opcode deltas
+    out[0:len(STRUCTURE_COUNTS)] = delta[0:len(STRUCTURE_COUNTS)]
+    out[len(STRUCTURE_COUNTS):len(STRUCTURE_COUNTS) + 3] = [original_size, optimized_size, optimized_size - original_size]
+    out[len(STRUCTURE_COUNTS) + 3:] = delta[len(STRUCTURE_COUNTS):]
+
+    return out
+
+
+def extract_features(pairs, originals = None):
+    """
+    Computes the feature vectors of many pairs straight into a (pairs x features) array.
+
+    Parameter:
+    pairs (list: tuple): (original path, optimized path) of every pair
+    originals (tuple): counts and sizes of the pairs' originals in the same order, as returned by original_counts(),
+                       the originals are scanned if None
+
+    Return:
+    features (ndarray): array of shape (pairs, len(FEATURE_NAMES)), one row per pair in order
+    """
+
+    features = np.zeros((len(pairs), len(FEATURE_NAMES)), dtype = np.float32)
+
+    if originals is None:
+        originals = original_counts([original_path for original_path, optimized_path in pairs])
+
+    counts, sizes = originals
+
+    for row, (original_path, optimized_path) in enumerate(pairs):
+        pair_features(original_path, optimized_path, out = features[row], original = (counts[row], sizes[row]))
+
+    return features
+
+
+def save_features(npz_path, programs, features):
+    """
+    Saves the feature matrix of a pass along with its row and column labels.
+
+    Parameter:
+    npz_path (string): path of the .npz file to write
+    programs (list: string): program name of every row
+    features (ndarray): feature matrix as returned by extract_features()
+
+    Return:
+    Nothing, writes the .npz file
+    """
+
+    np.savez(npz_path, features = features, programs = np.array(programs), feature_names = np.array(FEATURE_NAMES))
+
+
+def load_features(npz_path):
+    """
+    Loads a feature matrix saved by save_features().
+
+    Parameter:
+    npz_path (string): path of the .npz file
+
+    Return:
+    programs (list: string): program name of every row
+    features (ndarray): feature matrix
+    feature_names (list: string): name of every column
+    """
+
+    with np.load(npz_path) as data:
+        return data['programs'].tolist(), data['features'], data['feature_names'].tolist()
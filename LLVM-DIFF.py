@@ -3,26 +3,31 @@
 # output, then transfers it to a csv file for further analysis
 
 import os
-import subprocess
 import csv
-import pandas as pd
-import matplotlib.pyplot as plt
-import numpy as np
-from sklearn.cluster import KMeans
+import argparse
+import Diff_Engine
+import Pass_Registry
 from collections import Counter
 import time
 
+# pandas, IR_Features (numpy), Corpus_Clustering (scikit-learn), Results_Dataset (pyarrow) and
+# Plot_Rendering (matplotlib) are imported by the functions using them, so the llvm-diff sweep doesn't
+# pay for loading them
+
 # Start timer
 start_time = time.time()
 
 # dictionary to track all differences between files
 differences = []
 
+# Field names of the metrics csv columns
+CSV_FIELD_NAMES = ['Original File', 'Optimized File', 'Num Additions', 'Num Deletions']
+
 # Holds all passes in O1
-O1_Passes = ['forceattrs', 'inferattrs', 'ipsccp', 'called-value-propagation', 'globalopt', 'mem2reg', 'deadargelim', 'instcombine', 'simplifycfg', 'always-inline', 'sroa', 'speculative-execution', 'jump-threading', 'correlated-propagation', 'libcalls-shrinkwrap', 'pgo-memop-opt', 'tailcallelim', 'reassociate', 'loop-simplify', 'lcssa', 'loop-rotate', 'licm', 'indvars', 'loop-idiom', 'loop-deletion', 'loop-unroll', 'memcpyopt', 'sccp', 'bdce', 'dse', 'adce', 'globaldce', 'float2int', 'loop-distribute', 'loop-vectorize', 'loop-load-elim', 'alignment-from-assumptions', 'strip-dead-prototypes', 'loop-sink', 'instsimplify', 'div-rem-pairs', 'verify', 'ee-instrument', 'early-cse', 'lower-expect']
+O1_Passes = Pass_Registry.O1_PASSES
 
 
-def traverse_files(original_dir, optimized_dir):
+def traverse_files(original_dir, optimized_dir, writer = None, keep_diff_text = False, jobs = 1, use_async = False):
     """
     Traverses through the original directory (containing non optimized LLVM IR files) and
     optimized directory (containing optimized LLVM IR files) and runs the llvm-diff command
@@ -32,58 +37,36 @@ def traverse_files(original_dir, optimized_dir):
     Parameter:
     original_dir (string): Path to the directory of non optimized LLVM IR files
     optimized_dir (string): Path to the directory of optimized LLVM IR files
-    csv_output_dir (string): Path to the directory to store csv output
+    writer (DictWriter): In streaming mode, csv writer each row is written to as soon as it is analyzed
+    keep_diff_text (bool): Whether to keep the raw diff lines of every comparison
+    jobs (int): Number of llvm-diff processes run concurrently, results are still recorded in directory order
+    use_async (bool): Whether to run llvm-diff as asyncio subprocesses instead of on a thread pool
 
     Return:
-    Nothing, dicitionary containing differences is updated and csv file is outputted to output directory
+    Nothing, dicitionary containing differences is updated or rows are streamed to the csv writer
     """
 
     # Holds the names of the original and optimized files, sorted to ensure they match correctly
-    original_files = os.listdir(original_dir)
-
-    # Iterate over each original file and optimized file in respective directory simultaniously
-    for original_file in original_files:
-
-        if original_file.endswith('.ll'):
-
-            # Construct filepaths
-            original_path = os.path.join(original_dir, original_file)
-            optimized_path = os.path.join(optimized_dir, original_file)
-            
-            # Run llvm-diff command and store output as a string
-            llvm_diff_output = llvm_diff(original_path, optimized_path)
+    original_files = [original_file for original_file in os.listdir(original_dir) if original_file.endswith('.ll')]
 
-            # Analyze differences and record them
-            analyze_differences(original_file, original_file, llvm_diff_output)
+    # Corresponding pair of filepaths for every original file
+    pairs = ((os.path.join(original_dir, original_file), os.path.join(optimized_dir, original_file)) for original_file in original_files)
 
-        else:
-            
-            # Skip to next file
-            continue
+    # Run llvm-diff command on every pair concurrently, each output comes back in order
+    if use_async:
+        import Async_Tools
+        sweep = Async_Tools.diff_sweep(pairs, limit = jobs)
+    else:
+        sweep = Diff_Engine.diff_sweep(pairs, jobs)
 
+    for (original_path, optimized_path), llvm_diff_output in sweep:
 
-def llvm_diff(original_path, optimized_path):
-    """
-    Runs the llvm-diff command on 2 corresponding files
+        # Analyze differences and record them
+        original_file = original_path.split("/")[-1]
+        analyze_differences(original_file, original_file, llvm_diff_output, keep_diff_text, writer)
 
-    Parameter:
-    original_path (string): Path to the LLVM IR file that wasn't optimized
-    optimized_path (string): Path to the LLVM IR file that was optimized
 
-    Return:
-    diff_output_string (string): String representation of contents from command
-    """
-
-    # Run llvm-diff command
-    diff_output = subprocess.run(['llvm-diff', original_path, optimized_path], capture_output = True, text = True)
-
-    # Convert output to a string
-    diff_output = diff_output.stderr.splitlines()
-
-    return diff_output
-
-
-def analyze_differences(original_file, optimized_file, llvm_diff):
+def analyze_differences(original_file, optimized_file, llvm_diff, keep_diff_text = False, writer = None):
     """
     Analyzes the differences between a non optimized LLVM IR file and the optimized version.
 
@@ -91,6 +74,8 @@ def analyze_differences(original_file, optimized_file, llvm_diff):
     original_file (string): name of non optimized LLVM IR file
     optimized_file (string): name of optimized LLVM IR file
     llvm_diff_string (string): string output of llvm-diff command run on original and optimized file
+    keep_diff_text (bool): Whether to keep the raw addition and deletion lines, only the counts are kept otherwise
+    writer (DictWriter): In streaming mode, csv writer the row is written to instead of keeping the entry
 
     Return:
     Nothing, differences structure is updated with differences between corresponding files
@@ -113,16 +98,51 @@ def analyze_differences(original_file, optimized_file, llvm_diff):
 
         # Check if line is an addition or deletion or modification and append it
         if line.strip().startswith('>'):
-            differences_entry['Additions'].append(line)
+            if keep_diff_text:
+                differences_entry['Additions'].append(line)
             differences_entry['Num Additions'] += 1
         elif line.strip().startswith('<'):
-            differences_entry['Deletions'].append(line)
+            if keep_diff_text:
+                differences_entry['Deletions'].append(line)
             differences_entry['Num Deletions'] += 1
+
+    # In streaming mode write the row right away, the entry is only kept if its diff text was asked for
+    if writer is not None:
+        writer.writerow({field: differences_entry[field] for field in CSV_FIELD_NAMES})
+        if keep_diff_text:
+            differences.append(differences_entry)
+        return
     
     # Append the current comparison to main list/dictionary
     differences.append(differences_entry)
 
 
+def open_csv_stream(csv_output_dir, csv_name):
+    """
+    Opens the metrics csv file for streaming, rows are written to it as soon as each diff is analyzed.
+
+    Parameter:
+    csv_output_dir (string): path to which you want to store csv file
+    csv_name (string): name of csv file
+
+    Return:
+    file (file object): opened csv file, to be closed once the traversal is done
+    writer (DictWriter): csv writer with the header row already written
+    """
+
+    # Make a new subdirectory that will hold the csv containing the metrics and the csv containing the clustering of programs
+    if os.path.exists(csv_output_dir) == False:
+        os.mkdir(csv_output_dir)
+
+    file = open(os.path.join(csv_output_dir, csv_name), mode = 'w', newline = '')
+
+    # Create csv writer object and write the header row
+    writer = csv.DictWriter(file, fieldnames = CSV_FIELD_NAMES)
+    writer.writeheader()
+
+    return file, writer
+
+
 def to_csv(csv_output_dir, csv_name):
     """
     Takes the differences information and outputs it into a csv file.
@@ -142,13 +162,10 @@ def to_csv(csv_output_dir, csv_name):
     # Path to csv file containing metrics
     csv_file = os.path.join(csv_output_dir, csv_name)
 
-    # Define the field names for the csv columns
-    field_names = ['Original File', 'Optimized File', 'Num Additions', 'Num Deletions']
-
     with open(csv_file, mode = 'w', newline = '') as file:
         
         # Create csv writer object
-        writer = csv.DictWriter(file, fieldnames = field_names)
+        writer = csv.DictWriter(file, fieldnames = CSV_FIELD_NAMES)
 
         # Write the header row with field names
         writer.writeheader()
@@ -163,22 +180,80 @@ def to_csv(csv_output_dir, csv_name):
             })
 
 
-def visualize(csv_output_dir, csv_name, store_plots, csv_clusters_name):
+def original_features(original_dir):
+    """
+    Scans every non optimized file once, so the feature extraction of every pass reuses the same counts.
+
+    Parameter:
+    original_dir (string): Path to the directory of non optimized LLVM IR files
+
+    Return:
+    programs (list: string): name of every program, in the same order as the metrics csv
+    originals (tuple): counts and sizes of every program, as returned by IR_Features.original_counts()
+    """
+
+    import IR_Features
+
+    programs = [original_file for original_file in os.listdir(original_dir) if original_file.endswith('.ll')]
+
+    return programs, IR_Features.original_counts([os.path.join(original_dir, program) for program in programs])
+
+
+def features_to_npz(original_dir, optimized_dir, csv_output_dir, npz_name, originals = None):
     """
-    Plots every possible combination of the metrics stored in csv file passed in. Applies KMeans
-    clustering algorithm to group data into visible clusters.
+    Extracts the IR delta feature vector of every pair of corresponding files and saves them as one matrix.
+
+    Parameter:
+    original_dir (string): Path to the directory of non optimized LLVM IR files
+    optimized_dir (string): Path to the directory of optimized LLVM IR files
+    csv_output_dir (string): path to which you want to store the features
+    npz_name (string): name of the .npz file
+    originals (tuple): programs and their counts as returned by original_features(), the originals are scanned if None
+
+    Return:
+    Nothing, generates the .npz file in desired path
+    """
+
+    import IR_Features
+
+    # Programs in the same order as the metrics csv
+    if originals is None:
+        originals = original_features(original_dir)
+
+    programs, counts = originals
+    pairs = [(os.path.join(original_dir, program), os.path.join(optimized_dir, program)) for program in programs]
+
+    # One feature vector per program, each optimized file is read once
+    features = IR_Features.extract_features(pairs, counts)
+
+    IR_Features.save_features(os.path.join(csv_output_dir, npz_name), programs, features)
+
+
+def visualize(csv_output_dir, csv_name, store_plots, csv_clusters_name, k = None, seed = 0, dataset_root = None, write_csv = True, plot = True):
+    """
+    Clusters the programs on the metrics stored in csv file passed in with the corpus clustering engine,
+    then prepares the plot of every possible combination of the metrics. The plots themselves are drawn
+    by Plot_Rendering so every pass can be rendered in parallel, or not at all.
 
     Parameter:
     csv_output_dir (string): path to which you want to store csv file
     csv_name (string): name of csv file
+    store_plots (string): path to the directory the plots are stored in
+    csv_clusters_name (string): name of the csv file holding the clusters
+    k (int): number of clusters, chosen automatically if None
+    seed (int): seed of the clustering, the same data always gets the same clusters
+    dataset_root (string): path to the columnar results dataset the pass's partition is written to, skipped if None
+    write_csv (bool): whether to also output the clusters to a csv file
+    plot (bool): whether to prepare the plots, no plot job is built otherwise
 
     Return:
-    Nothing, generates the plots in desired directory
+    job (dict): plot job of the pass, to be given to a Plot_Rendering.Renderer, None if plot is False
     """
 
-    # Make a new subdirectory to store plots
-    if os.path.exists(store_plots) == False:
-        os.mkdir(store_plots)
+    import pandas as pd
+    import Corpus_Clustering
+    import Plot_Rendering
+    import Results_Dataset
 
     # Indicate path to csv containing metrics
     csv_path = os.path.join(csv_output_dir, csv_name)
@@ -195,56 +270,60 @@ def visualize(csv_output_dir, csv_name, store_plots, csv_clusters_name):
     # Convert the DataFrame to a numpy array
     data_array = data.to_numpy()
 
-    # Create an instance from the KMeans class and identify the number of clusters
-    kmeans = KMeans(n_clusters = 4) 
+    # Assigns a cluster to data points, picking the number of clusters with a silhouette score unless given
+    cluster_labels, k, scores = Corpus_Clustering.cluster_matrix(data_array, k = k, seed = seed)
 
-    # Assigns a cluster to data points
-    cluster_labels = kmeans.fit_predict(data_array)
+    # Output the metrics and clusters to the pass's partition of the results dataset
+    if dataset_root is not None:
+        Results_Dataset.write_pass_partition(dataset_root, os.path.basename(csv_output_dir), data.index.get_level_values('Original File'),
+                                             {metric_name: data[metric_name].to_numpy() for metric_name in metric_names}, cluster_labels)
 
     # Output the clusters to a csv file
-    output_clusters(data, cluster_labels, csv_output_dir, csv_clusters_name)
+    if write_csv:
+        output_clusters(data, cluster_labels, csv_output_dir, csv_clusters_name)
 
-    # Loop through each metric and ensure every possible combination of metrics is plotted
-    for i in range(len(metric_names)):
+    if not plot:
+        return None
 
-        for j in range(i + 1, len(metric_names)):
+    # Everything needed to render the plots of this pass, its data is written next to the plots
+    return Plot_Rendering.plot_job(store_plots, metric_names, data_array, cluster_labels)
 
-            # Create a figure and axes
-            figure, axes = plt.subplots()
 
-            # Get metric names
-            metric_1_name = metric_names[i]
-            metric_2_name = metric_names[j]
+def cluster_corpus(csv_root_dir, pass_names, use_features = False, k = None, seed = 0):
+    """
+    Clusters the whole corpus at once on the programs x (passes x metrics) matrix built from the results of
+    every pass. The matrix lives in a memory-mapped file so the corpus never has to fit in memory.
+
+    Parameter:
+    csv_root_dir (string): path to the directory holding the csv subdirectory of every pass
+    pass_names (list: string): passes whose results make up the matrix
+    use_features (bool): build the matrix from the IR delta features instead of the llvm-diff metrics
+    k (int): number of clusters, chosen automatically if None
+    seed (int): seed of the clustering
 
-            # Extract metrics data from DataFrame
-            metric_1_data = data[metric_1_name]
-            metric_2_data = data[metric_2_name]
+    Return:
+    Nothing, generates corpus-clusters.csv in csv_root_dir
+    """
 
-            # Loop through each cluster in set of clusters
-            for cluster_id in set(cluster_labels):
+    import Corpus_Clustering
 
-                # Get the indices of of all data points that fall in current cluster
-                cluster_indices = cluster_labels == cluster_id
- 
-                # Get the metrics for current cluster
-                cluster_data_x = metric_1_data[cluster_indices]
-                cluster_data_y = metric_2_data[cluster_indices]
+    matrix_path = os.path.join(csv_root_dir, 'corpus-matrix.npy')
 
-                # Plot the metrics for current cluster assigning a unqiue colour to current cluster
-                axes.scatter(cluster_data_x, cluster_data_y, color='C{}'.format(cluster_id), s=15)
+    if use_features:
+        pass_paths = [(pass_name, os.path.join(csv_root_dir, pass_name, "llvm-diff-" + pass_name + "-Features.npz")) for pass_name in pass_names]
+        programs, columns, matrix = Corpus_Clustering.build_feature_matrix(pass_paths, matrix_path)
+    else:
+        pass_paths = [(pass_name, os.path.join(csv_root_dir, pass_name, "llvm-diff-" + pass_name + "-Results.csv")) for pass_name in pass_names]
+        programs, columns, matrix = Corpus_Clustering.build_corpus_matrix(pass_paths, matrix_path)
 
-            # Style the graph
-            axes.set_xlabel(metric_1_name)
-            axes.set_ylabel(metric_2_name)
-            plot_title = (store_plots.split('/')[-1]) + " " + metric_1_name + ' vs ' + metric_2_name
-            axes.set_title(plot_title)
-            axes.grid(True)
+    cluster_labels, k, scores = Corpus_Clustering.cluster_matrix(matrix, k = k, seed = seed)
 
-            # Save the current plot to the directory
-            figure.savefig(os.path.join(store_plots, plot_title + '.png'), format='png')
+    # Report the silhouette score of every candidate number of clusters
+    for candidate_k, score in scores.items():
+        print("k =", candidate_k, "silhouette =", score)
+    print("Corpus clustered into", k, "clusters")
 
-            # Close the plot
-            plt.close(figure)
+    Corpus_Clustering.write_clusters(os.path.join(csv_root_dir, 'corpus-clusters.csv'), programs, cluster_labels)
 
 
 def output_clusters(data, cluster_labels, csv_output_dir, cluster_csv_name):
@@ -272,8 +351,8 @@ def output_clusters(data, cluster_labels, csv_output_dir, cluster_csv_name):
         # Write header to csv
         writer.writerow(['Program Name', 'Cluster'])
 
-        # Loop through each program and its clusterID
-        for file, cluster_id in zip(data.index, cluster_labels):
+        # Loop through each program and its clusterID, programs are named by their original file like in the results dataset
+        for file, cluster_id in zip(data.index.get_level_values('Original File'), cluster_labels):
 
             # Write program name and cluster ID to the csv
             writer.writerow([file, cluster_id])
@@ -288,8 +367,59 @@ def output_clusters(data, cluster_labels, csv_output_dir, cluster_csv_name):
             writer.writerow([cluster_id, count])
 
 
+def parse_arguments():
+    """
+    Parses the command line options.
+
+    Return:
+    arguments (Namespace): parsed options
+    """
+
+    parser = argparse.ArgumentParser(description = 'Runs llvm-diff between every program and its pass optimized version, then clusters the results.')
+    parser.add_argument('--stream', action = 'store_true',
+                        help = 'write each csv row as soon as its diff is analyzed, keeping memory flat regardless of corpus size')
+    parser.add_argument('--keep-diff-text', action = 'store_true',
+                        help = 'keep the raw addition and deletion lines of every diff in memory')
+    parser.add_argument('--jobs', type = int, default = Diff_Engine.default_jobs(),
+                        help = 'number of llvm-diff processes run concurrently (default: one per core)')
+    parser.add_argument('--async', dest = 'use_async', action = 'store_true',
+                        help = 'run llvm-diff as asyncio subprocesses instead of on a thread pool')
+    parser.add_argument('--features', action = 'store_true',
+                        help = 'also extract IR delta feature vectors (opcode histogram, blocks, functions, size) of every pair')
+    parser.add_argument('--clusters', type = int, default = None,
+                        help = 'number of clusters (default: chosen with a sampled silhouette score)')
+    parser.add_argument('--seed', type = int, default = 0,
+                        help = 'seed of the clustering')
+    parser.add_argument('--no-cluster-csv', action = 'store_true',
+                        help = 'only write the clusters to the columnar results dataset, not to one csv per pass')
+    parser.add_argument('--no-plots', action = 'store_true',
+                        help = 'skip rendering the plots entirely')
+    parser.add_argument('--plot-workers', type = int, default = Diff_Engine.default_jobs(),
+                        help = 'number of processes rendering plots in parallel (default: one per core)')
+    parser.add_argument('--summary-plots', action = 'store_true',
+                        help = 'also build one faceted image per metric pair with every pass side by side')
+
+    return parser.parse_args()
+
+
 def main():
 
+    arguments = parse_arguments()
+
+    # Plots of every pass are rendered as soon as the pass is clustered, in worker processes
+    renderer = None
+    if not arguments.no_plots:
+        import Plot_Rendering
+        renderer = Plot_Rendering.Renderer(arguments.plot_workers)
+
+    # Plot job of every pass for the summary, each only holds the path of the pass's data
+    plot_jobs = []
+
+    # Counts of the non optimized files, scanned once for the whole sweep
+    originals = None
+    if arguments.features:
+        originals = original_features("/Users/ahmedelzaria/Documents/LLVM/Ir_Files")
+
     for O1_Pass in O1_Passes:
 
         global differences
@@ -305,26 +435,57 @@ def main():
         csv_metrics_name = "llvm-diff-" + O1_Pass + "-Results.csv"
         csv_clusters_name = O1_Pass + "-clusters-data.csv"
         store_plots = os.path.join("/Users/ahmedelzaria/Documents/LLVM/Plots/llvm-diff_plots", O1_Pass)
+        dataset_root = "/Users/ahmedelzaria/Documents/LLVM/llvm-diff-dataset"
 
-        # Traverse all corresponding pair of files and analyze differences
-        traverse_files(original_dir, optimized_dir)
-        
-        # for entry in differences:
-        #     print(entry["Num Additions"], entry["Num Deletions"])
+        if arguments.stream:
+
+            # Traverse all corresponding pair of files, each row goes to the csv file as soon as it is analyzed
+            csv_file, writer = open_csv_stream(csv_output_dir, csv_metrics_name)
+            with csv_file:
+                traverse_files(original_dir, optimized_dir, writer, arguments.keep_diff_text, arguments.jobs, arguments.use_async)
+
+        else:
+
+            # Traverse all corresponding pair of files and analyze differences
+            traverse_files(original_dir, optimized_dir, keep_diff_text = arguments.keep_diff_text, jobs = arguments.jobs, use_async = arguments.use_async)
+            
+            # for entry in differences:
+            #     print(entry["Num Additions"], entry["Num Deletions"])
+
+            # Print differences to csv file
+            to_csv(csv_output_dir, csv_metrics_name)
+
+        # Extract the richer IR delta features next to the metrics
+        if arguments.features:
+            features_to_npz(original_dir, optimized_dir, csv_output_dir, "llvm-diff-" + O1_Pass + "-Features.npz", originals)
+
+        # Cluster differences and hand their plots to the renderer
+        plot_job = visualize(csv_output_dir, csv_metrics_name, store_plots, csv_clusters_name, arguments.clusters, arguments.seed,
+                             dataset_root, not arguments.no_cluster_csv, renderer is not None)
+        if renderer is not None:
+            renderer.submit(plot_job)
+            if arguments.summary_plots:
+                plot_jobs.append(plot_job)
+
+    # Cluster the whole corpus on the results of every pass at once
+    cluster_corpus("/Users/ahmedelzaria/Documents/LLVM/llvm-diff-csv", O1_Passes, arguments.features, arguments.clusters, arguments.seed)
+
+    # Wait for the plots of every pass
+    if renderer is not None:
+        renderer.close()
 
-        # Print differences to csv file
-        to_csv(csv_output_dir, csv_metrics_name)
+        if arguments.summary_plots:
+            Plot_Rendering.render_summary("/Users/ahmedelzaria/Documents/LLVM/Plots/llvm-diff_plots/Summary", plot_jobs)
 
-        # Visualize differences through plots
-        visualize(csv_output_dir, csv_metrics_name, store_plots, csv_clusters_name)
 
+if __name__ == '__main__':
 
-main()
+    main()
 
-# Stop the timer
-end_time = time.time()
+    # Stop the timer
+    end_time = time.time()
 
-# Calculate total time
-elapsed_time = end_time - start_time
+    # Calculate total time
+    elapsed_time = end_time - start_time
 
-print("Elapsed time:", elapsed_time)
\ No newline at end of file
+    print("Elapsed time:", elapsed_time)
\ No newline at end of file
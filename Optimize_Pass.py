@@ -6,12 +6,13 @@ import os
 import subprocess
 import time
 import csv
+import Pass_Registry
 
 # Start timer
 start_time = time.time()
 
 # Holds all passes in O1
-O1_Passes = ['forceattrs', 'inferattrs', 'ipsccp', 'called-value-propagation', 'globalopt', 'mem2reg', 'deadargelim', 'instcombine', 'simplifycfg', 'always-inline', 'sroa', 'speculative-execution', 'jump-threading', 'correlated-propagation', 'libcalls-shrinkwrap', 'pgo-memop-opt', 'tailcallelim', 'reassociate', 'loop-simplify', 'lcssa', 'loop-rotate', 'licm', 'indvars', 'loop-idiom', 'loop-deletion', 'loop-unroll', 'memcpyopt', 'sccp', 'bdce', 'dse', 'adce', 'globaldce', 'float2int', 'loop-distribute', 'loop-vectorize', 'loop-load-elim', 'alignment-from-assumptions', 'strip-dead-prototypes', 'loop-sink', 'instsimplify', 'div-rem-pairs', 'verify', 'ee-instrument', 'early-cse', 'lower-expect']
+O1_Passes = Pass_Registry.O1_PASSES
 
 def traverse_files(directory):
     """
@@ -117,6 +118,10 @@ def traverse_files(directory):
 
 # Path to directory containing LLVM IR files
 input_directory = "/Users/ahmedelzaria/Documents/LLVM/Ir_Files"
+
+# Fail fast if the installed opt doesn't know one of the passes
+Pass_Registry.validate_passes(O1_Passes)
+
 traverse_files(input_directory)
 
 # Stop the timer
@@ -1,13 +1,19 @@
 import os 
 import subprocess
 import csv
+import io
 import time
+import argparse
+import Diff_Engine
+import Pass_Matrices
+import Pass_Registry
+import Program_Archive
 # import pandas as pd
 # import matplotlib.pyplot as plt
 # import hdbscan
 
 # Holds the passes in opt O1, 45 passes
-o1_passes = ['forceattrs', 'inferattrs', 'ipsccp', 'called-value-propagation', 'globalopt', 'mem2reg', 'deadargelim', 'instcombine', 'simplifycfg', 'always-inline', 'sroa', 'speculative-execution', 'jump-threading', 'correlated-propagation', 'libcalls-shrinkwrap', 'pgo-memop-opt', 'tailcallelim', 'reassociate', 'loop-simplify', 'lcssa', 'loop-rotate', 'licm', 'indvars', 'loop-idiom', 'loop-deletion', 'loop-unroll', 'memcpyopt', 'sccp', 'bdce', 'dse', 'adce', 'globaldce', 'float2int', 'loop-distribute', 'loop-vectorize', 'loop-load-elim', 'alignment-from-assumptions', 'strip-dead-prototypes', 'loop-sink', 'instsimplify', 'div-rem-pairs', 'verify', 'ee-instrument', 'early-cse', 'lower-expect']
+o1_passes = Pass_Registry.O1_PASSES
 
 # Dictionary that holds differences between program from llvm-diff command
 differences = []
@@ -23,35 +29,37 @@ def create_directory(directory_path):
 
 
 
-def apply_passes(program_path, program_directory_path, round):
+def apply_passes(program_path, store, round, parent_pass_path = '', async_jobs = 0):
 
     """
-    Applies each pass on a program, generating 45 optimized versions of that program and storing each version in its own subdirectory named
-    after the pass that was applied on it. 
+    Applies each pass on a program, generating 45 optimized versions of that program and storing each version in the program's store
+    under a pass path named after the pass that was applied on it. With the loose backend every pass path is its own subdirectory.
 
     Parameter:
-    original_filepath (string): path to file which you would like to compare other files with
-    program_directory_path (string): path to directory holding the programs contents
+    program_path (string): path to file the passes are applied on
+    store (ArchiveStore or LooseFileStore): output store of the current program
     round (int): indicates which stage you are on
+    parent_pass_path (string): pass path of program_path within the store, '' for the unoptimized program
+    async_jobs (int): opt processes run at once as asyncio subprocesses, 0 to run them one at a time
 
     Return:
-    pass_subdirectory_paths (list: string): paths to all the subdirectories generated
+    pass_paths (list: string): pass paths of all the versions generated, a pass opt failed on has no version
     """
 
-    # List to hold all paths to pass subdirectories of current program
-    pass_subdirectory_paths = []
-
-    # Apply the passes on program, result is n (number of O1 passes in o1_passes) versions of program
-    for o1_pass in o1_passes:
+    # List to hold all pass paths of current program
+    pass_paths = []
 
-        # Path to subdirectory within that programs directory, this will hold the pass optimized file version of that program. Name the file the pass name
-        pass_directory_path = os.path.join(program_directory_path, o1_pass)
+    # Run every opt command at once, the versions are stored in pass order below
+    outcomes = None
+    if async_jobs > 0:
+        import Async_Tools
+        outcomes = Async_Tools.opt_outputs([(program_path, o1_pass) for o1_pass in o1_passes], limit = async_jobs)
 
-        # Create a subdirectory within the program's directory to store that pass's optimized file
-        create_directory(pass_directory_path)
+    # Apply the passes on program, result is n (number of O1 passes in o1_passes) versions of program
+    for pass_index, o1_pass in enumerate(o1_passes):
 
-        # Append subdirectory path to list
-        pass_subdirectory_paths.append(pass_directory_path)
+        # Pass path of the version, nested under the parent version for round 2
+        pass_path = o1_pass if parent_pass_path == '' else parent_pass_path + '/' + o1_pass
 
         if round == 1:
             # Optimized file name 
@@ -59,84 +67,71 @@ def apply_passes(program_path, program_directory_path, round):
         else:
             optimized_filename = program_path.split('/')[-1] + o1_pass + ".ll"
 
-        # Run opt command to apply current pass on the current program
-        subprocess.run(['opt', '-S', '-passes=' + o1_pass, '-o', os.path.join(pass_directory_path, optimized_filename), program_path])
+        # Run opt command to apply current pass on the current program and capture the optimized file
+        if outcomes is not None:
+            returncode, optimized_ir, errors = outcomes[pass_index]
+        else:
+            outcome = subprocess.run(['opt', '-S', '-passes=' + o1_pass, '-o', '-', program_path], capture_output = True)
+            returncode, optimized_ir, errors = outcome.returncode, outcome.stdout, outcome.stderr
+
+        # A failed pass has no version, its metrics stay missing instead of describing an empty module
+        if returncode != 0:
+            print('opt failed on', pass_path, 'of', program_path + ':', errors.decode(errors = 'replace').strip())
+            continue
+
+        # Store the version and append pass path to list
+        store.write(pass_path, optimized_filename, optimized_ir)
+        pass_paths.append(pass_path)
 
     
-    return pass_subdirectory_paths
+    return pass_paths
     
 
-def traverse_files(original_filepath, program_subdirectory_path, pass_subdirectory_paths):
+def traverse_files(original_filepath, store, pass_paths, report_pass_path = '', jobs = 1):
     """
-    Traverses through subdirectories and applies the llvm-diff command on the files of interest. Then analyzes those differences 
-    outputting them to a csv file in the subdirectory.
+    Runs the llvm-diff command between the original file and every version of interest in the store. Then analyzes those differences 
+    outputting them to a csv report stored next to the versions.
 
     Parameter:
     original_filepath (string): path to file which you would like to compare other files with
-    program_subdirectory_path (string): path to directory holding the programs contents
-    pass_subdirectory_paths (list: string): all paths to the subdirectories that hold the pass optimized versions of the program
+    store (ArchiveStore or LooseFileStore): output store of the current program
+    pass_paths (list: string): pass paths of the versions to compare with the original file
+    report_pass_path (string): pass path the csv report is stored under, '' for the program itself
+    jobs (int): number of llvm-diff processes run concurrently, results are still recorded in pass order
 
     Return:
-    Nothing, generates the csv file and places it in desired path
+    entries (list: dict): differences entries recorded by this traversal, also stores the csv report
     """
 
-    # Loop through each subdirectory under the program
-    for pass_subdirectory in pass_subdirectory_paths:
-
-        # Loop through subdirectory contents, should just be one file
-        for item in os.listdir(pass_subdirectory):
-
-            # Construct itempath
-            itempath = os.path.join(pass_subdirectory, item)
-
-            # Make sure the file is a path to a .ll file
-            if item.endswith('.ll'):
+    # Remember where this traversal's entries start in the differences list
+    first_entry = len(differences)
 
-                # Run llvm-diff command and store output as a string
-                llvm_diff_output = llvm_diff(original_filepath, itempath)
+    # Pair the original file with every version, versions are put on disk as the sweep reaches them
+    pairs = ((original_filepath, store.path(pass_path)) for pass_path in pass_paths)
 
-                # Analyze differences and record them
-                analyze_differences(pass_subdirectory, llvm_diff_output)
+    # Run llvm-diff command on every version concurrently, each output comes back in pass order
+    for pass_path, (pair, llvm_diff_output) in zip(pass_paths, Diff_Engine.diff_sweep(pairs, jobs)):
 
-        # If not skip to next pass subdirectory
-        else:
+        # Analyze differences and record them
+        analyze_differences(pass_path, llvm_diff_output)
 
-            continue
+        # Round 2 versions are not needed on disk anymore
+        if report_pass_path != '':
+            store.release(pass_path)
     
     # Output differences to a csv
     llvm_diff_csv_name = original_filepath.split("/")[-1] + '-llvm-diff-Results.csv'
-    to_csv(program_subdirectory_path, llvm_diff_csv_name)
-
+    to_csv(store, report_pass_path, llvm_diff_csv_name)
 
+    return differences[first_entry:]
 
 
-def llvm_diff(original_path, optimized_path):
-    """
-    Runs the llvm-diff command on 2 corresponding files
-
-    Parameter:
-    original_path (string): Path to the LLVM IR file that wasn't optimized
-    optimized_path (string): Path to the LLVM IR file that was optimized
-
-    Return:
-    diff_output (string): String representation of contents from command
-    """
-
-    # Run llvm-diff command
-    diff_output = subprocess.run(['llvm-diff', original_path, optimized_path], capture_output = True, text = True)
-
-    # Convert output to a string
-    diff_output = diff_output.stderr.splitlines()
-
-    return diff_output
-
-
-def analyze_differences(pass_subdirectory, llvm_diff):
+def analyze_differences(pass_path, llvm_diff):
     """
     Analyzes the differences between a non optimized LLVM IR file and the optimized version.
 
     Parameter:
-    pass_subdirectory (string): Path to subdirectory holding the desired file
+    pass_path (string): Pass path of the optimized version
     llvm_diff (string): string output of llvm-diff command run on original and optimized file
 
     Return:
@@ -145,7 +140,7 @@ def analyze_differences(pass_subdirectory, llvm_diff):
 
     # differences entry
     differences_entry = {
-        'Pass': pass_subdirectory.split("/")[-1],
+        'Pass': pass_path.split("/")[-1],
         'Additions': [],
         'Num Additions': 0,
         'Deletions': [],
@@ -169,45 +164,70 @@ def analyze_differences(pass_subdirectory, llvm_diff):
     differences.append(differences_entry)
 
 
-def to_csv(csv_output_dir, csv_name):
+def to_csv(store, pass_path, csv_name):
     """
-    Takes the differences information and outputs it into a csv file.
+    Takes the differences information and outputs it into a csv report in the program's store.
 
     Parameter:
-    csv_output_dir (string): path to which you want to store csv file
+    store (ArchiveStore or LooseFileStore): output store of the current program
+    pass_path (string): pass path the report is stored under, '' for the program itself
     csv_name (string): name of csv file
 
     Return:
-    Nothing, generates the csv file and places it in desired path
+    Nothing, generates the csv report and places it in the store
     """
 
-    # Path to csv file containing metrics
-    csv_file = os.path.join(csv_output_dir, csv_name)
+    # Buffer holding the csv contents
+    csv_buffer = io.StringIO()
 
     # Define the field names for the csv columns
     field_names = ['Pass', 'Num Additions', 'Num Deletions']
 
-    with open(csv_file, mode = 'w', newline = '') as file:
-        
-        # Create csv writer object
-        writer = csv.DictWriter(file, fieldnames = field_names)
+    # Create csv writer object
+    writer = csv.DictWriter(csv_buffer, fieldnames = field_names)
+
+    # Write the header row with field names
+    writer.writeheader()
+
+    # Iterate all file comparison differences and print metrics to csv
+    for entry in differences:
+        writer.writerow({
+            'Pass': entry['Pass'],
+            'Num Additions': entry['Num Additions'],
+            'Num Deletions': entry['Num Deletions']
+        })
 
-        # Write the header row with field names
-        writer.writeheader()
+    store.write_report(pass_path, csv_name, csv_buffer.getvalue())
 
-        # Iterate all file comparison differences and print metrics to csv
-        for entry in differences:
-            writer.writerow({
-                'Pass': entry['Pass'],
-                'Num Additions': entry['Num Additions'],
-                'Num Deletions': entry['Num Deletions']
-            })
+
+def parse_arguments():
+    """
+    Parses the command line options.
+
+    Return:
+    arguments (Namespace): parsed options
+    """
+
+    parser = argparse.ArgumentParser(description = 'Applies every pair of O1 passes on each program and records the llvm-diff metrics.')
+    parser.add_argument('--backend', choices = Program_Archive.BACKENDS, default = 'archive',
+                        help = "'archive' packs each program into one SQLite file, 'loose' keeps one subdirectory per pass")
+    parser.add_argument('--jobs', type = int, default = Diff_Engine.default_jobs(),
+                        help = 'number of llvm-diff processes run concurrently (default: one per core)')
+    parser.add_argument('--async-jobs', type = int, default = 0,
+                        help = 'run opt as asyncio subprocesses, this many at once (default: 0, one at a time)')
+
+    return parser.parse_args()
 
 
 def main():
 
     global differences
 
+    arguments = parse_arguments()
+
+    # Fail fast if the installed opt doesn't know one of the passes
+    Pass_Registry.validate_passes(o1_passes)
+
     # Path to the directory containing the unoptimized files
     directory_path = '/Users/ahmedelzaria/Documents/LLVM/Test_Programs'
 
@@ -216,59 +236,66 @@ def main():
 
     create_directory(optimized_directory_path)
 
+    # Programs to optimize, each one is a row of the pass matrices
+    programs = [item for item in os.listdir(directory_path) if os.path.isfile(os.path.join(directory_path, item)) and item.endswith('.ll')]
+
+    # Memory-mapped round 1 and round 2 tensors for the whole corpus
+    corpus_path = os.path.join(optimized_directory_path, 'Pass_Matrices')
+    round1, round2 = Pass_Matrices.create_corpus(corpus_path, programs, o1_passes)
+
     # Iterate over the programs in directory containing the unoptimized files
-    for item in os.listdir(directory_path):
+    for program_index, item in enumerate(programs):
         
         # Construct item path
         itempath = os.path.join(directory_path, item)
 
-        # Check if item is a file and a .ll file, if not skip to next item in directory
-        if os.path.isfile(itempath) and item.endswith('.ll'):
+        # Store holding the optimized versions of the current program, named after the program
+        store = Program_Archive.open_program_store(optimized_directory_path, item, arguments.backend)
 
-            # Path to subdirectory within optimized_directory_path holding the optimized versions of the current program. Name it after the program
-            program_subdirectory_path = os.path.join(optimized_directory_path, item)
+        # First set of passes, result is 45 versions of current item each optimized with a different pass. Also holds the pass paths of those versions
+        pass_paths = apply_passes(itempath, store, round = 1, async_jobs = arguments.async_jobs)
+        
+        # Compare the optimized versions with the unoptimized versions, output the llvm-diff result of all passes on this program in a csv report
+        # which will be stored with the program
+        round1_entries = traverse_files(itempath, store, pass_paths, jobs = arguments.jobs)
 
-            # Create directory if it doesn't exist
-            create_directory(program_subdirectory_path)
+        # Record the round 1 metrics of current program
+        round1[program_index] = Pass_Matrices.differences_to_matrix(round1_entries, o1_passes)
 
-            # First set of passes, result is 45 versions of current item each optimized with a different pass. Also holds the paths to all pass subdirectories of current program
-            pass_subdirectories = apply_passes(itempath, program_subdirectory_path, round = 1)
-            
-            # Traverse the subdirectories and compare the optimized versions with the unoptimized versions, output the llvm-diff result of all passes on this program in a csv file
-            # which will be stored in the program's subdirectory
-            traverse_files(itempath, program_subdirectory_path, pass_subdirectories)
+        # Reset differences list
+        differences = []
 
-            # Reset differences list
-            differences = []
+        # Loop through each round 1 version and apply 45 pass version on it
+        for pass_path in pass_paths:
 
-            # Loop through each subdirectory and apply 45 pass version on the 1 optimized file in there
-            for pass_subdirectory in pass_subdirectories:
-                
-                for file in os.listdir(pass_subdirectory):
+            # Row of the round 1 pass, versions of failed passes are missing from pass_paths
+            first_pass_index = o1_passes.index(pass_path)
 
-                    # Construct filepath
-                    filepath = os.path.join(pass_subdirectory, file)
+            # Path to the round 1 version on disk
+            filepath = store.path(pass_path)
 
-                    # Check if file is correct one
-                    if os.path.isfile(filepath) and filepath.endswith('.ll'):
-                        
-                        # apply passes
-                        round2_pass_subdirectories = apply_passes(filepath, pass_subdirectory, round = 2)
+            # apply passes
+            round2_pass_paths = apply_passes(filepath, store, round = 2, parent_pass_path = pass_path, async_jobs = arguments.async_jobs)
 
-                        # traverse the subdirectories and compare as before
-                        traverse_files(filepath, pass_subdirectory, round2_pass_subdirectories)
+            # compare as before, the csv report is stored under the round 1 version
+            round2_entries = traverse_files(filepath, store, round2_pass_paths, report_pass_path = pass_path, jobs = arguments.jobs)
 
-                    else:
+            # Record the round 2 metrics of current program with the round 1 pass as the first axis
+            round2[program_index, first_pass_index] = Pass_Matrices.differences_to_matrix(round2_entries, o1_passes)
 
-                        continue
-            
-            # Reset differences list
-            differences = []
+            # Round 1 version is not needed on disk anymore
+            store.release(pass_path)
+        
+        # Reset differences list
+        differences = []
 
-        else:
+        # Commit the program's output
+        store.close()
 
-            # Skip to next item in directory
-            continue
+    # Flush the tensors and pack the corpus into a single file
+    round1.flush()
+    round2.flush()
+    Pass_Matrices.export_npz(corpus_path, os.path.join(optimized_directory_path, 'Pass_Matrices.npz'))
 
 
 main()
@@ -0,0 +1,204 @@
+# Stores the round 1 and round 2 llvm-diff metrics of Optimize_Pass2.py as dense NumPy tensors.
+# Round 1 of a program is a (passes x metrics) matrix, round 2 is a (passes x passes x metrics)
+# tensor where entry [i][j] holds the metrics of applying pass j on the output of pass i. The
+# tensors of every program are stacked into one memory-mapped corpus so the whole study loads at once.
+
+import os
+import json
+import numpy as np
+
+# Metrics recorded for every pass application, last axis of every tensor
+METRICS = ['Num Additions', 'Num Deletions']
+
+# Names of the files making up a corpus directory
+ROUND1_FILE = 'round1.npy'
+ROUND2_FILE = 'round2.npy'
+INDEX_FILE = 'index.json'
+
+
+def create_corpus(corpus_path, programs, passes, metrics = METRICS):
+    """
+    Creates an empty memory-mapped corpus on disk, sized for the given programs and passes. Every entry
+    starts as NaN so programs or passes that were never recorded are distinguishable from a zero diff.
+
+    Parameter:
+    corpus_path (string): path to the directory that will hold the corpus
+    programs (list: string): names of all programs in the corpus, in row order
+    passes (list: string): names of the passes, in axis order
+    metrics (list: string): names of the metrics stored on the last axis
+
+    Return:
+    round1 (memmap): array of shape (programs, passes, metrics)
+    round2 (memmap): array of shape (programs, passes, passes, metrics)
+    """
+
+    # Create the corpus directory if it doesn't exist
+    os.makedirs(corpus_path, exist_ok = True)
+
+    # Allocate both tensors directly on disk so memory stays flat while the corpus is filled
+    round1 = np.lib.format.open_memmap(os.path.join(corpus_path, ROUND1_FILE), mode = 'w+', dtype = np.float32,
+                                       shape = (len(programs), len(passes), len(metrics)))
+    round2 = np.lib.format.open_memmap(os.path.join(corpus_path, ROUND2_FILE), mode = 'w+', dtype = np.float32,
+                                       shape = (len(programs), len(passes), len(passes), len(metrics)))
+    round1[:] = np.nan
+    round2[:] = np.nan
+
+    # Record the axis labels next to the tensors
+    with open(os.path.join(corpus_path, INDEX_FILE), 'w') as file:
+        json.dump({'programs': list(programs), 'passes': list(passes), 'metrics': list(metrics)}, file)
+
+    return round1, round2
+
+
+def differences_to_matrix(entries, passes, metrics = METRICS):
+    """
+    Converts the differences entries recorded for one llvm-diff sweep into a (passes x metrics) matrix.
+
+    Parameter:
+    entries (list: dict): differences entries, each holding a 'Pass' key and the metric keys
+    passes (list: string): names of the passes, in axis order
+    metrics (list: string): names of the metrics stored on the last axis
+
+    Return:
+    matrix (ndarray): array of shape (passes, metrics), NaN where a pass has no entry
+    """
+
+    # Map each pass to its row
+    pass_index = {name: index for index, name in enumerate(passes)}
+
+    matrix = np.full((len(passes), len(metrics)), np.nan, dtype = np.float32)
+
+    # Fill the row of every pass that was recorded
+    for entry in entries:
+        row = pass_index.get(entry['Pass'])
+        if row is not None:
+            matrix[row] = [entry[metric] for metric in metrics]
+
+    return matrix
+
+
+def export_npz(corpus_path, npz_path):
+    """
+    Packs a corpus directory into a single uncompressed .npz file.
+
+    Parameter:
+    corpus_path (string): path to the corpus directory
+    npz_path (string): path of the .npz file to write
+
+    Return:
+    Nothing, writes the .npz file
+    """
+
+    corpus = load_corpus(corpus_path)
+    np.savez(npz_path, round1 = corpus['round1'], round2 = corpus['round2'], programs = np.array(corpus['programs']),
+             passes = np.array(corpus['passes']), metrics = np.array(corpus['metrics']))
+
+
+def load_corpus(path):
+    """
+    Loads a corpus from either a corpus directory (memory-mapped, nothing is read until used) or a .npz file.
+
+    Parameter:
+    path (string): path to a corpus directory or .npz file
+
+    Return:
+    corpus (dict): 'round1' and 'round2' tensors and the 'programs', 'passes' and 'metrics' axis labels
+    """
+
+    # Single file corpus
+    if os.path.isfile(path):
+        with np.load(path) as data:
+            return {
+                'round1': data['round1'],
+                'round2': data['round2'],
+                'programs': data['programs'].tolist(),
+                'passes': data['passes'].tolist(),
+                'metrics': data['metrics'].tolist()
+            }
+
+    # Directory corpus, map the tensors read-only
+    with open(os.path.join(path, INDEX_FILE), 'r') as file:
+        corpus = json.load(file)
+
+    corpus['round1'] = np.load(os.path.join(path, ROUND1_FILE), mmap_mode = 'r')
+    corpus['round2'] = np.load(os.path.join(path, ROUND2_FILE), mmap_mode = 'r')
+
+    return corpus
+
+
+def corpus_mean(tensor):
+    """
+    Corpus-wide mean of a round 1 or round 2 tensor, ignoring programs that were not recorded.
+
+    Parameter:
+    tensor (ndarray): round 1 or round 2 tensor with programs on the first axis
+
+    Return:
+    mean (ndarray): tensor without the program axis
+    """
+
+    return np.nanmean(tensor, axis = 0)
+
+
+def corpus_variance(tensor):
+    """
+    Corpus-wide variance of a round 1 or round 2 tensor, ignoring programs that were not recorded.
+
+    Parameter:
+    tensor (ndarray): round 1 or round 2 tensor with programs on the first axis
+
+    Return:
+    variance (ndarray): tensor without the program axis
+    """
+
+    return np.nanvar(tensor, axis = 0)
+
+
+def interaction_scores(round1, round2):
+    """
+    Measures how much each pass pair interacts. If pass j were independent of pass i, applying j on the output
+    of i would change the program the same way as applying j on the original program, so round2[i][j] would
+    equal round1[j]. The score is the mean absolute deviation from that over the corpus.
+
+    Parameter:
+    round1 (ndarray): tensor of shape (programs, passes, metrics)
+    round2 (ndarray): tensor of shape (programs, passes, passes, metrics)
+
+    Return:
+    scores (ndarray): array of shape (passes, passes, metrics)
+    """
+
+    # Broadcast round 1 of the second pass against every first pass
+    deviation = np.abs(np.asarray(round2) - np.asarray(round1)[:, np.newaxis, :, :])
+
+    return np.nanmean(deviation, axis = 0)
+
+
+def interacting_pairs(corpus, threshold = 1.0, metric = None):
+    """
+    Flags the pass pairs whose interaction score is above the given threshold.
+
+    Parameter:
+    corpus (dict): corpus as returned by load_corpus()
+    threshold (float): minimum mean absolute deviation for a pair to be flagged
+    metric (string): metric to score on, all metrics are summed if None
+
+    Return:
+    pairs (list: tuple): (first pass, second pass, score) for every flagged pair, highest score first
+    """
+
+    scores = interaction_scores(corpus['round1'], corpus['round2'])
+
+    # Reduce to one score per pair
+    if metric is None:
+        scores = scores.sum(axis = -1)
+    else:
+        scores = scores[..., corpus['metrics'].index(metric)]
+
+    # Indices of every flagged pair, sorted by decreasing score
+    first, second = np.nonzero(scores > threshold)
+    order = np.argsort(-scores[first, second], kind = 'stable')
+
+    passes = corpus['passes']
+
+    return [(passes[first[i]], passes[second[i]], float(scores[first[i], second[i]])) for i in order]
@@ -0,0 +1,280 @@
+# Registry of the passes known to an opt binary. Runs 'opt --print-passes' once, parses it into module,
+# cgscc, function, loop nest and loop passes (analyses are kept apart, they can't be used with -passes=)
+# and caches the result on disk keyed by the hash of the opt binary, so validating a pass list afterwards
+# is instant. Also holds the pass lists shared by every script.
+
+import os
+import re
+import json
+import shutil
+import hashlib
+import subprocess
+
+# Passes in opt O1, 45 passes valid as of 2023
+O1_PASSES = ['forceattrs', 'inferattrs', 'ipsccp', 'called-value-propagation', 'globalopt', 'mem2reg', 'deadargelim', 'instcombine', 'simplifycfg', 'always-inline', 'sroa', 'speculative-execution', 'jump-threading', 'correlated-propagation', 'libcalls-shrinkwrap', 'pgo-memop-opt', 'tailcallelim', 'reassociate', 'loop-simplify', 'lcssa', 'loop-rotate', 'licm', 'indvars', 'loop-idiom', 'loop-deletion', 'loop-unroll', 'memcpyopt', 'sccp', 'bdce', 'dse', 'adce', 'globaldce', 'float2int', 'loop-distribute', 'loop-vectorize', 'loop-load-elim', 'alignment-from-assumptions', 'strip-dead-prototypes', 'loop-sink', 'instsimplify', 'div-rem-pairs', 'verify', 'ee-instrument', 'early-cse', 'lower-expect']
+
+# List of O1 passes (from 2013), including the analyses and legacy passes that no longer exist
+LEGACY_O1_PASSES = ['targetlibinfo', 'tti', 'tbaa', 'scoped-noalias', 'assumption-cache-tracker', 'profile-summary-info', 'forceattrs', 'inferattrs', 'ipsccp', 'called-value-propagation', 'globalopt', 'domtree', 'mem2reg', 'deadargelim', 'basic-aa', 'aa', 'loops', 'lazy-branch-prob', 'lazy-block-freq', 'opt-remark-emitter', 'instcombine', 'simplifycfg', 'basiccg', 'globals-aa', 'prune-eh', 'always-inline', 'functionattrs', 'sroa', 'memoryssa', 'early-cse-memssa', 'speculative-execution', 'lazy-value-info', 'jump-threading', 'correlated-propagation', 'libcalls-shrinkwrap', 'branch-prob', 'block-freq', 'pgo-memop-opt', 'tailcallelim', 'reassociate', 'loop-simplify', 'lcssa-verification', 'lcssa', 'scalar-evolution', 'loop-rotate', 'licm', 'loop-unswitch', 'indvars', 'loop-idiom', 'loop-deletion', 'loop-unroll', 'memdep', 'memcpyopt', 'sccp', 'demanded-bits', 'bdce', 'dse', 'postdomtree', 'adce', 'barrier', 'rpo-functionattrs', 'globaldce', 'float2int', 'loop-accesses', 'loop-distribute', 'loop-vectorize', 'loop-load-elim', 'alignment-from-assumptions', 'strip-dead-prototypes', 'loop-sink', 'instsimplify', 'div-rem-pairs', 'verify', 'ee-instrument', 'early-cse', 'lower-expect']
+
+# Loop passes explored by Pass_Relations_Graph.py
+LOOP_PASSES = ['loop-simplify', 'loop-rotate', 'loop-idiom', 'loop-deletion', 'loop-unroll', 'loop-distribute', 'loop-vectorize', 'loop-load-elim', 'loop-sink']
+
+# Kinds of passes, in the order opt lists them. A pass listed under several kinds is classified by the first
+PASS_KINDS = ['module', 'cgscc', 'function', 'loopnest', 'loop']
+
+# Section header of 'opt --print-passes', e.g. 'Function passes with params:' or 'Loop analyses:'
+SECTION = re.compile(r'^(Module|CGSCC|Function|LoopNest|Loop) (passes|passes with params|analyses|alias analyses):$')
+
+# Version of parse_print_passes(), registries cached by an older parser are parsed again
+PARSER_VERSION = 2
+
+# Registries already loaded by this process, keyed by opt path
+loaded_registries = {}
+
+
+def cache_path():
+    """
+    Path of the file caching the registry of every opt binary seen so far.
+
+    Return:
+    path (string): path to the cache file
+    """
+
+    cache_directory = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+
+    return os.path.join(cache_directory, 'llvm-evolution', 'pass-registry.json')
+
+
+def read_cache():
+    """
+    Reads the registry cache, empty if it doesn't exist yet.
+
+    Return:
+    cache (dict): 'binaries' maps an opt path to its size, mtime and hash, 'registries' maps a hash and parser version to its registry
+    """
+
+    try:
+        with open(cache_path(), 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {'binaries': {}, 'registries': {}}
+
+
+def write_cache(cache):
+    """
+    Writes the registry cache atomically, so concurrent scripts never read a partial file.
+
+    Parameter:
+    cache (dict): cache as returned by read_cache()
+
+    Return:
+    Nothing, writes the cache file
+    """
+
+    path = cache_path()
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+
+    temporary_path = path + '.' + str(os.getpid())
+    with open(temporary_path, 'w') as file:
+        json.dump(cache, file)
+    os.replace(temporary_path, path)
+
+
+def resolve_opt(opt = 'opt'):
+    """
+    Resolves an opt command or path to the real path of the binary.
+
+    Parameter:
+    opt (string): opt command name or path
+
+    Return:
+    path (string): real path of the opt binary
+    """
+
+    path = shutil.which(opt)
+    if path is None:
+        raise FileNotFoundError("opt binary '" + opt + "' not found")
+
+    return os.path.realpath(path)
+
+
+def opt_hash(opt_path, cache):
+    """
+    SHA-256 of an opt binary. The binary is only hashed again if its size or modification time changed.
+
+    Parameter:
+    opt_path (string): real path of the opt binary
+    cache (dict): cache as returned by read_cache(), updated with the hash
+
+    Return:
+    digest (string): hex digest of the binary
+    """
+
+    status = os.stat(opt_path)
+    known = cache['binaries'].get(opt_path)
+    if known is not None and known['size'] == status.st_size and known['mtime'] == status.st_mtime:
+        return known['hash']
+
+    digest = hashlib.sha256()
+    with open(opt_path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+
+    cache['binaries'][opt_path] = {'size': status.st_size, 'mtime': status.st_mtime, 'hash': digest.hexdigest()}
+
+    return digest.hexdigest()
+
+
+def opt_fingerprint(opt = 'opt'):
+    """
+    SHA-256 of an opt binary, remembered in the cache so it's only computed again when the binary changes.
+
+    Parameter:
+    opt (string): opt command name or path
+
+    Return:
+    digest (string): hex digest of the binary
+    """
+
+    opt_path = resolve_opt(opt)
+
+    cache = read_cache()
+    known = cache['binaries'].get(opt_path)
+    digest = opt_hash(opt_path, cache)
+
+    if cache['binaries'][opt_path] != known:
+        write_cache(cache)
+
+    return digest
+
+
+def parse_print_passes(output):
+    """
+    Parses the output of 'opt --print-passes'.
+
+    Parameter:
+    output (string): output of the command
+
+    Return:
+    registry (dict): 'passes' maps every pass name to its kinds, 'analyses' maps every analysis name to its kinds
+    """
+
+    registry = {'passes': {}, 'analyses': {}}
+    section = None
+
+    for line in output.splitlines():
+
+        # Every unindented line ending in ':' is a header, the names under one of an unknown kind are skipped
+        if not line[:1].isspace() and line.rstrip().endswith(':'):
+            header = SECTION.match(line.rstrip())
+            section = None
+            if header:
+                kind = header.group(1).lower()
+                section = (kind, 'passes' if header.group(2).startswith('passes') else 'analyses')
+            continue
+
+        # Names are indented under their header
+        if section is None or not line[:1].isspace() or line.strip() == '':
+            continue
+
+        # Drop the parameters, e.g. 'loop-unroll<O0;O1;O2;O3;...>'
+        name = line.strip().split('<')[0]
+
+        kinds = registry[section[1]].setdefault(name, [])
+        if section[0] not in kinds:
+            kinds.append(section[0])
+
+    return registry
+
+
+def load_registry(opt = 'opt'):
+    """
+    Registry of the passes known to an opt binary. 'opt --print-passes' only runs the first time a binary is seen.
+
+    Parameter:
+    opt (string): opt command name or path
+
+    Return:
+    registry (dict): 'passes' maps every pass name to its kinds, 'analyses' maps every analysis name to its kinds
+    """
+
+    opt_path = resolve_opt(opt)
+
+    # Already loaded by this process
+    if opt_path in loaded_registries:
+        return loaded_registries[opt_path]
+
+    key = opt_fingerprint(opt_path) + '/' + str(PARSER_VERSION)
+    cache = read_cache()
+
+    if key not in cache['registries']:
+        output = subprocess.run([opt_path, '--print-passes'], capture_output = True, text = True, check = True).stdout
+        cache['registries'][key] = parse_print_passes(output)
+        write_cache(cache)
+
+    loaded_registries[opt_path] = cache['registries'][key]
+
+    return loaded_registries[opt_path]
+
+
+def pass_kind(pass_name, registry):
+    """
+    Kind of a pass: 'module', 'cgscc', 'function', 'loopnest' or 'loop'.
+
+    Parameter:
+    pass_name (string): name of the pass, parameters are ignored
+    registry (dict): registry as returned by load_registry()
+
+    Return:
+    kind (string): kind of the pass, None if opt doesn't know it
+    """
+
+    kinds = registry['passes'].get(pass_name.split('<')[0])
+    if not kinds:
+        return None
+
+    return min(kinds, key = PASS_KINDS.index)
+
+
+def available_passes(passes, opt = 'opt'):
+    """
+    Keeps the passes that exist in the given opt binary.
+
+    Parameter:
+    passes (list: string): candidate pass names
+    opt (string): opt command name or path
+
+    Return:
+    valid_passes (list: string): the candidates opt knows, in order
+    """
+
+    registry = load_registry(opt)
+
+    return [opt_pass for opt_pass in passes if pass_kind(opt_pass, registry) is not None]
+
+
+def validate_passes(passes, opt = 'opt'):
+    """
+    Checks that every pass of a list exists in the given opt binary.
+
+    Parameter:
+    passes (list: string): pass names
+    opt (string): opt command name or path
+
+    Return:
+    kinds (dict: string): kind of every pass, raises ValueError naming every unknown pass
+    """
+
+    registry = load_registry(opt)
+
+    kinds = {opt_pass: pass_kind(opt_pass, registry) for opt_pass in passes}
+
+    unknown = [opt_pass for opt_pass, kind in kinds.items() if kind is None]
+    if unknown:
+        analyses = [opt_pass for opt_pass in unknown if opt_pass in registry['analyses']]
+        message = 'Unknown passes for ' + resolve_opt(opt) + ': ' + ', '.join(unknown)
+        if analyses:
+            message += ' (' + ', '.join(analyses) + ' are analyses, not passes)'
+        raise ValueError(message)
+
+    return kinds
@@ -1,219 +1,18 @@
-# All necessary imports for code to run
+# All necessary imports for code to run. The visualization libraries (pyvis, bs4) are imported by
+# output_graph() when a graph is drawn, the exploration itself lives in Exploration.py and never loads them
 import networkx as nx
-from networkx.drawing.nx_pydot import graphviz_layout
-from pyvis.network import Network
-import pygraphviz as pgv
-import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
-import matplotlib.patches as patches
 import os
-import subprocess
-import time
+import json
 import colorsys
 import sys
-from bs4 import BeautifulSoup
+import argparse
+import Pass_Registry
+import Exploration
+import Graph_Analytics
+import Profiling
+import Progress_Metrics
 
 
-def generate_ir(directory, output_directory):
-    """
-    Traverses a directory with an arbitrary number of subdirectories. Extracts all .c clang compilable files and generates 
-    the IR files and places them in desired output directory.
-
-    Parameter:
-    directory (string): Path to the root directory of interest
-    output_directory (string): Path to the directory to store IR
-
-    Return:
-    Nothing, IR(s) is/are appended to output_directory.
-    """
-	
-    # Iterate over each item in directory
-    for item in os.listdir(directory):
-
-        # Construct current item path 
-        itempath = os.path.join(directory, item)
-	
-        # Check if current item is a .c file
-        if os.path.isfile(itempath) and itempath.endswith(".c"):
-
-			# Check if file is compilable with clang
-            if is_compilable_clang(itempath) == True:
-
-                # Generate the IR of .c file and store in output directory
-                subprocess.run(["clang", "-S", "-emit-llvm", itempath, '-o', os.path.join(output_directory, item + ".ll"), '-O0', "-Xclang", "-disable-O0-optnone"])
-                
-            # Skip to next item
-            else:
-                continue
-
-        # Check if current item is a sub-directory
-        elif os.path.isdir(itempath):
-
-            # Traverse subdirectory
-            generate_ir(itempath, output_directory)
-        
-        # Skip to next item
-        else:
-             continue
-        
-        
-def is_compilable_clang(filepath):
-	"""
-	Checks if .c file is compilable with clang
-
-	Parameters:
-	filepath (string): complete filepath to your .c file of interest
-
-	Returns:
-	True: if .c file passed through is compilable with clang
-	False: if .c file passed through is not compilable with clang
-	"""
-
-	# Run command to check if file is compilable with clang
-	outcome = subprocess.run(["clang", "-fsyntax-only", filepath], capture_output = True, text = True)
-
-	# Check return code of the process
-	if outcome.returncode == 0:
-		return True # file is compilable with clang
-	else:
-		return False # file is not compilable with clang
-
-
-def add_graph_node(program_path, queue, graph, parent_node = None, pass_applied = None):
-    """
-    Adds nodes to the given graph. Adds the program_path as a node and appeneds the node to the queue.
-    For all nodes besides the root, it will add an edge with the new node and parent node.
-
-    Arguments:
-    program_path (string): Path to program to be added as a node
-    queue (list: string): List that holds the programs to be visited
-    graph (Graph): Graph to which nodes will be added to
-    optional argument, parent_node (string): Path to the parent node program
-    optional argument, pass_applied (string): Pass applied to make new program
-
-    Returns:
-    Nothing, adds nodes and/or edges.
-    """
-
-    # Add the node to the graph and enqueue
-    graph.add_node(program_path)
-    queue.append(program_path)
-
-    # For all nodes besides root, add an edge with the parent node
-    if parent_node:
-        graph.add_edge(parent_node, program_path, relationship = pass_applied)
-
-
-def apply_pass(program, optimized_path, opt_pass):
-    """
-    Applies the given pass on the given program and stores it in the given path.
-
-    Arguments:
-    program (string): Path to program to apply pass on
-    optimized_path (string): Path to which optimized program will be stored
-    opt_pass (string): Pass to apply on given program
-
-    Returns:
-    optimized_program_path (string): Path to optimized file
-    """
-
-    # Optimized program path
-    optimized_program_path = os.path.join(optimized_path, program.split('/')[-1] + '_' + opt_pass + '.ll')
-
-    # Apply pass via opt
-    subprocess.run(['opt', '-S', '-passes=' + opt_pass, '-o', optimized_program_path, program])
-
-    return optimized_program_path
-
-
-def is_existing(optimized_program_path, graph, parent_node, pass_appled, queue):
-    """
-    Checks whether the optimized file already exists on the graph. If it does, then connects the 
-    parent node to the existing node. If it doesn't, it will create a new node and connect it 
-    accordingly.
-
-    Arguments:
-    optimized_program_path (string): Path to optimized file'
-    graph (Graph): Graph you're working with
-    parent_node (string): Path to the parent node program
-    pass_applied (string): Pass applied to make new program
-    queue (list: string): List that holds the programs to be visited
-
-    Returns:
-    graph.add_edge(): Adds an edge with existing node
-    graph.add_node(): Adds a new node to the graph and connects it accordingly
-    """
-
-    for node in graph.nodes:
-
-        # Run llvm-diff command and capture output
-        llvm_diff_output = llvm_diff(optimized_program_path, node)
-
-        # Analyze the llvm-diff output and record number of additions and deletions
-        differences = analyze_differences(llvm_diff_output)
-
-        # If there is an equivalent node in the graph, add an edge from parent node to equivalent node
-        if differences['Num Additions'] == 0 and differences['Num Deletions'] == 0:
-            if(graph.has_edge(parent_node, node)) :
-                graph[parent_node][node]['relationship'] = graph[parent_node][node]['relationship'] + ',' + pass_appled
-                return
-            return graph.add_edge(parent_node, node, relationship = pass_appled)
-        
-    # If non of the nodes in the graph are equivalent to the new program, add new node
-    return add_graph_node(optimized_program_path, queue, graph, parent_node = parent_node, pass_applied = pass_appled)
-
-
-def llvm_diff(optimized_program_path, node_program):
-    """
-    Runs the llvm-diff command on two passed in programs.
-
-    Arguments:
-    optimized_program_path (string): Path to optimized file
-    node_program (string): Program path of a node on the graph
-
-    Returns:
-    diff_output (list: string): llvm-diff command captured and split into lines
-    """
-
-    # Run llvm-diff command
-    diff_output = subprocess.run(['llvm-diff', optimized_program_path, node_program], capture_output = True, text = True)
-
-    # Convert output to a string
-    diff_output = diff_output.stderr.splitlines()
-
-    return diff_output
-
-
-def analyze_differences(llvm_diff):
-    """
-    Analyzes the llvm-diff output captured and records the number of additions and deletions that were
-    made.
-
-    Arguments:
-    llvm-diff (list: string): llvm-diff output captured and split into lines
-
-    Returns:
-    differences (dict: int): Holds the number of additions and deletions from llvm-diff command
-    """
-
-    # Holds the number of additions and deletions from llvm-diff output
-    differences = {
-        'Num Additions': 0,
-        'Num Deletions': 0,
-    }
-
-    # Iterate over all lines in output and note the additions, deletions, and modifications
-    for line in llvm_diff:
-
-        # Check if line is an addition or deletion or modification and append it
-        if line.strip().startswith('>'):
-            differences['Num Additions'] += 1
-        elif line.strip().startswith('<'):
-            differences['Num Deletions'] += 1
-
-    return differences
-    
-
 def output_graph(graph, html_path, gml_path, graph_count):
     """
     Outputs the completed graph in two ways, as a pop up window during execution and as a html graph.
@@ -236,8 +35,14 @@ def output_graph(graph, html_path, gml_path, graph_count):
     # Write the gml representation of graph
     nx.write_gml(graph, gml_path)
 
-    # Detect strongly connected components
-    strongly_connected = [comp for comp in nx.strongly_connected_components(graph) if len(comp) > 1]
+    # Detect strongly connected components, already labelled in 'scc' when the graph was analyzed (see Graph_Analytics.py)
+    if all('scc' in data for node, data in graph.nodes(data = True)):
+        labelled = {}
+        for node, data in graph.nodes(data = True):
+            labelled.setdefault(data['scc'], set()).add(node)
+        strongly_connected = [comp for comp in labelled.values() if len(comp) > 1]
+    else:
+        strongly_connected = [comp for comp in nx.strongly_connected_components(graph) if len(comp) > 1]
     print(strongly_connected)
 
     # Detect strongly connected components
@@ -247,6 +52,10 @@ def output_graph(graph, html_path, gml_path, graph_count):
     strong_connected_highlighted = True
     components = strongly_connected if strong_connected_highlighted else weakly_connected
 
+    # Visualization libraries, only loaded once there is something to draw
+    from pyvis.network import Network
+    from bs4 import BeautifulSoup
+
     # Create a Network object with desired properties
     net = Network(notebook=True, directed=True, height="750px")
 
@@ -256,24 +65,14 @@ def output_graph(graph, html_path, gml_path, graph_count):
     # Convert the generated RGB colors to hexadecimal format
     component_colors_hex = ['#%02x%02x%02x' % tuple(int(c * 255) for c in color) for color in component_colors]
 
-    # Create a dictionary to map component IDs to colors
-    node_colors = {f'component_{i}': color for i, color in enumerate(component_colors_hex)}
+    # Create a dictionary to map every node of a component to the component's color
+    node_colors = {node: color for component, color in zip(components, component_colors_hex) for node in component}
 
     # Add nodes and edges to the Network object
     for node in graph.nodes():
-        # Get the connected component to which the node belongs
-        connected_component = None
-        for component in components:
-            if node in component:
-                connected_component = component
-                break
-        
-        # Determine the color of the node based on its connected component
-        if connected_component is not None:
-            component_id = "component_" + str(components.index(connected_component))
-            node_color = node_colors.get(component_id, 'gray')  # Default to gray if not found
-        else:
-            node_color = 'gray'  # Default color for nodes not in any connected component
+
+        # Determine the color of the node based on its connected component, gray for nodes not in any
+        node_color = node_colors.get(node, 'gray')
         
         # Add the node with specified color
         net.add_node(node, color=node_color)
@@ -340,7 +139,22 @@ def output_graph(graph, html_path, gml_path, graph_count):
         modified_html_file.write(soup.prettify())
 
 
-def main():
+def explore_benchmark(profiler = None, profile_directory = None, coordinator = None, async_jobs = 0, walks = 0, cache = None, functions = False):
+    """
+    Asks for a directory of .c files, then builds, exports and visualizes the graph of every program.
+
+    Arguments:
+    optional argument, profiler (Profiler): Profiler recording every stage of the run
+    optional argument, profile_directory (string): Directory the profile summaries are written to after every graph
+    optional argument, coordinator (Coordinator): Coordinator running opt on remote workers, explores locally if None
+    optional argument, async_jobs (int): Tools run at once as asyncio subprocesses, 0 to run them one at a time
+    optional argument, walks (int): Random walks sampling the O1 passes instead of exploring every state, 0 to explore
+    optional argument, cache (IRCache): IR cache memoizing the transitions of the walks and the function graphs
+    optional argument, functions (bool): Explore every function separately and combine them into the module-level graph
+
+    Returns:
+    Nothing, outputs the graphs.
+    """
 
     input("") # Ignore
 
@@ -374,13 +188,23 @@ def main():
         os.mkdir(gml_dir_path)
 
     # Generate the IR files and store them in the correct directory
-    generate_ir(benchmark_path, ir_benchmark_path)
+    with Profiling.active(profiler).stage('generate_ir'):
+        if async_jobs > 0:
+            import Async_Tools
+            Async_Tools.generate_ir(benchmark_path, ir_benchmark_path, limit = async_jobs, profiler = profiler)
+        else:
+            Exploration.generate_ir(benchmark_path, ir_benchmark_path)
 
     # Keep track of how many graphs generated
     graph_count = 1
 
-    # List of passes
-    passes = ['loop-simplify', 'loop-rotate', 'loop-idiom', 'loop-deletion', 'loop-unroll', 'loop-distribute', 'loop-vectorize', 'loop-load-elim', 'loop-sink', ]
+    # List of passes. Sampling is for large pass sets, so the walks use every O1 pass this opt knows
+    if walks > 0:
+        import Random_Walks
+        passes = Pass_Registry.available_passes(Pass_Registry.O1_PASSES)
+    else:
+        passes = Pass_Registry.LOOP_PASSES
+        Pass_Registry.validate_passes(passes)
 	
     # Loop through each program in benchmark
     for program in os.listdir(ir_benchmark_path):
@@ -395,57 +219,164 @@ def main():
             html_path = os.path.join(graphs_dir_path, "graph" + str(graph_count) + ".html")
             gml_path = os.path.join(gml_dir_path, "graph" + str(graph_count) + ".gml")
 
-            # Create an empty graph
-            G = nx.DiGraph()
+            # Analytics of the graph, kept up to date while it is explored
+            analytics = Graph_Analytics.GraphAnalytics()
+
+            # Explore the program states reachable with the passes, for at most 10000 seconds or 10000 nodes
+            if walks > 0:
+                G, summary = Random_Walks.sample(root_program_path, passes, optimized_path, cache, walks = walks, profiler = profiler)
+                with open(os.path.join(gml_dir_path, "graph" + str(graph_count) + ".walks.json"), 'w') as file:
+                    json.dump(summary, file, indent = 2)
+                print(Random_Walks.report(summary))
+                analytics = Graph_Analytics.from_graph(G)
+            elif functions:
+                import Function_Decomposition
+                function_graphs = Function_Decomposition.explore_functions(root_program_path, passes, optimized_path, cache = cache, max_nodes = 10000, time_limit = 10000, profiler = profiler)
+                G = Function_Decomposition.ProductGraph(function_graphs).to_graph(passes, max_nodes = 10000)
+                analytics = Graph_Analytics.from_graph(G)
+            elif coordinator is not None:
+                G = coordinator.explore(root_program_path, passes, optimized_path, max_nodes = 10000, time_limit = 10000, analytics = analytics)
+            elif async_jobs > 0:
+                G = Async_Tools.explore(root_program_path, passes, optimized_path, max_nodes = 10000, time_limit = 10000, profiler = profiler, limit = async_jobs, analytics = analytics)
+            else:
+                G = Exploration.explore(root_program_path, passes, optimized_path, max_nodes = 10000, time_limit = 10000, profiler = profiler, analytics = analytics)
+
+            # Write the analytics on the graph and next to the gml file
+            with Profiling.active(profiler).stage('analytics'):
+                analytics.annotate(G)
+                analytics.write_summary(os.path.join(gml_dir_path, "graph" + str(graph_count) + ".analytics.json"))
+
+            # Rename the nodes 
+            renamed_graph = Exploration.relabel_graph(G)
+
+            # Output the graph visualization
+            with Profiling.active(profiler).stage('export'):
+                output_graph(renamed_graph, html_path, gml_path, graph_count)
 
-            # Declare and initialize an empty queue
-            queue = []
+            # Keep the profile up to date, so an interrupted run still has one
+            if profiler is not None and profile_directory is not None:
+                write_profile(profiler, profile_directory)
 
-            # Add current program as root node
-            add_graph_node(root_program_path, queue, G)
+            graph_count += 1
 
-            # Start timer
-            start_time = time.time()
 
-            # Loop through the queue
-            while queue:
+def write_profile(profiler, profile_directory):
+    """
+    Outputs the profile summaries, and the Chrome trace if it was recorded.
 
-                # Get the front element from the queue
-                node = queue.pop(0)
+    Arguments:
+    profiler (Profiler): Profiler of the run
+    profile_directory (string): Directory the summaries are written to
 
-                # Loop through each pass
-                for opt_pass in passes:
+    Returns:
+    Nothing, generates profile.json, profile.csv and possibly trace.json.
+    """
 
-                    # Apply pass using opt and hold temporary program
-                    optimized_program_path = apply_pass(node, optimized_path, opt_pass)
+    os.makedirs(profile_directory, exist_ok = True)
 
-                    # Check if post-pass-applied program is the same as any other nodes on graph
-                    is_existing(optimized_program_path, G, node, opt_pass, queue)
+    profiler.write_json(os.path.join(profile_directory, 'profile.json'))
+    profiler.write_csv(os.path.join(profile_directory, 'profile.csv'))
 
-                # Check if time exceeds 25 seconds or if there are more than 100 nodes, break out of loop if any are met
-                current_time = time.time()
-                elapsed_time = current_time - start_time
-                num_nodes = G.number_of_nodes()
-                if elapsed_time > 10000 or num_nodes > 10000:
-                    break
+    if profiler.trace:
+        profiler.write_trace(os.path.join(profile_directory, 'trace.json'))
 
-            # Rename the nodes 
-            program_node_count = 0
-            old_new_names = {}
-            
-            for node in G.nodes:
-                old_new_names[node] = 'P' + str(program_node_count)
-                program_node_count += 1
 
-            renamed_graph = nx.relabel_nodes(G, old_new_names)
+def parse_arguments():
 
-            # Output the graph visualization
-            output_graph(renamed_graph, html_path, gml_path, graph_count)
+    parser = argparse.ArgumentParser(description = 'Builds the graph of the program states reachable with the passes, for every program of a benchmark.')
+    parser.add_argument('--profile', default = None, help = 'directory the per-stage profile (profile.json, profile.csv) is written to')
+    parser.add_argument('--trace', action = 'store_true', help = 'also write a Chrome trace of every stage (trace.json) to the profile directory')
+    parser.add_argument('--cprofile', action = 'store_true', help = 'also profile every call with cProfile (cprofile.pstats) in the profile directory')
+    parser.add_argument('--sample', action = 'store_true', help = 'also run the sampling profiler (samples.collapsed) in the profile directory')
+    parser.add_argument('--progress', type = float, default = 60, help = 'seconds between progress reports on stderr, 0 to disable')
+    parser.add_argument('--metrics-file', default = None, help = 'Prometheus text file (ending in .prom) the progress metrics are written to')
+    parser.add_argument('--serve', default = None, help = 'host:port to coordinate a distributed exploration on, workers run opt (see Distributed_Exploration.py)')
+    parser.add_argument('--authkey', default = None, help = 'key the workers of a distributed exploration must present, LLVM_EVOLUTION_AUTHKEY or a random key printed on stderr by default')
+    parser.add_argument('--workers', type = int, default = 0, help = 'worker processes started on this machine for a distributed exploration')
+    parser.add_argument('--async-jobs', type = int, default = 0, help = 'run clang, opt and llvm-diff as asyncio subprocesses, this many at once (0 runs them one at a time)')
+    parser.add_argument('--walks', type = int, default = 0, help = 'estimate the state space of the O1 passes with this many random walks instead of exploring every state (see Random_Walks.py)')
+    parser.add_argument('--functions', action = 'store_true', help = 'explore every function of a program separately and combine them into the program graph (see Function_Decomposition.py)')
+    parser.add_argument('--lease-seconds', type = float, default = 300, help = 'seconds a worker has to complete a batch before its jobs go to another worker')
 
-            graph_count += 1
+    return parser.parse_args()
+
+
+def main():
+
+    arguments = parse_arguments()
+
+    profiler = None
+    cprofile_path = None
+    sample_path = None
+
+    if arguments.profile is not None:
+
+        os.makedirs(arguments.profile, exist_ok = True)
+        profiler = Profiling.Profiler(trace = arguments.trace)
+
+        if arguments.cprofile:
+            cprofile_path = os.path.join(arguments.profile, 'cprofile.pstats')
+        if arguments.sample:
+            sample_path = os.path.join(arguments.profile, 'samples.collapsed')
+
+    # Progress reports read the counters of the profiler
+    emitter = None
+    if arguments.progress > 0 or arguments.metrics_file is not None:
+
+        if profiler is None:
+            profiler = Profiling.Profiler()
+
+        emitter = Progress_Metrics.ProgressEmitter(profiler, arguments.progress if arguments.progress > 0 else 60, arguments.metrics_file, sys.stderr if arguments.progress > 0 else None)
+        emitter.start()
+
+    # Distributed exploration, this process coordinates and the workers run opt
+    coordinator = None
+    cache = None
+    if arguments.serve is not None:
+
+        import Distributed_Exploration
+        import IR_Cache
+        import Toolchain
+
+        cache = IR_Cache.IRCache()
+        toolchain = Toolchain.default_toolchain()
+        coordinator = Distributed_Exploration.Coordinator(cache, toolchain, profiler, arguments.lease_seconds)
+
+        authkey, generated = Distributed_Exploration.coordinator_authkey(arguments.authkey)
+        server = Distributed_Exploration.serve(coordinator, arguments.serve, authkey.encode())
+        print('Coordinating workers on {}:{}'.format(*server.address), file = sys.stderr)
+
+        # Remote workers need the generated key in their environment
+        if generated:
+            print('Workers must set {}={}'.format(Distributed_Exploration.AUTHKEY_VARIABLE, authkey), file = sys.stderr)
+
+        if arguments.workers > 0:
+            Distributed_Exploration.spawn_workers('{}:{}'.format(*server.address), authkey.encode(), arguments.workers)
+
+    # The walks and the function graphs memoize their transitions in the shared IR cache
+    elif arguments.walks > 0 or arguments.functions:
+
+        import IR_Cache
+
+        cache = IR_Cache.IRCache()
+
+    try:
+        with Profiling.profile_calls(cprofile_path, sample_path):
+            explore_benchmark(profiler, arguments.profile, coordinator, arguments.async_jobs, arguments.walks, cache, arguments.functions)
+    finally:
+        if emitter is not None:
+            emitter.stop()
+        if coordinator is not None:
+            coordinator.close()
+        if cache is not None:
+            cache.close()
+
+    if arguments.profile is not None:
+        write_profile(profiler, arguments.profile)
 
  
-main()
+if __name__ == '__main__':
+    main()
 
 
 
@@ -456,6 +387,11 @@ main()
 
 
 # MATPLOTLIB VISUALIZATION CODE, UNCOMMENT EVERYTHING BELOW TO USE, PLACE IN OUTPUT_GRAPH() FUNCTION TO USE. MAY HAVE TO ADJUST SOME STUFF.
+# # Imports needed by the code below
+#     from networkx.drawing.nx_pydot import graphviz_layout
+#     import matplotlib.pyplot as plt
+#     import matplotlib.colors as mcolors
+#     import matplotlib.patches as patches
 # # Generate the layout
 #     pos = graphviz_layout(graph, prog='dot')
 
@@ -0,0 +1,399 @@
+# Search for the pass sequence that makes a program smallest, without building its whole graph. Each
+# program state is scored by a metric of its IR (instruction count, basic blocks, functions or bytes, read
+# with IR_Features.ir_counts()) and the search expands only the promising states: beam search keeps the
+# best states of every depth, A* finds the shortest sequence reaching a target metric. Transitions are
+# memoized in the IR cache (through Random_Walks.Walker), so repeated searches and states already seen by
+# an exploration or by the walks don't run opt. The report gives the sequence, the metric it reaches and
+# the opt calls used, next to those a breadth first exploration to the same depth would need.
+#
+# Usage: python Pass_Sequence_Search.py <program.ll> <output directory> [--strategy beam|astar] [--metric instructions]
+#                                       [--beam-width 8] [--max-depth 10] [--target N] [--passes ...] [--jobs N]
+#                                       [--bfs] [--tools <LLVM bin directory>] [--cache <path>]
+
+import os
+import json
+import heapq
+import argparse
+
+import Diff_Engine
+import IR_Cache
+import IR_Features
+import Pass_Registry
+import Profiling
+import Random_Walks
+import Toolchain
+
+# Metrics a state can be scored by, and their position in IR_Features.ir_counts(). 'bytes' is the file size
+METRICS = {'functions': 0, 'basic blocks': 1, 'instructions': 2, 'bytes': None}
+
+
+class Search:
+    """
+    Scores and expands program states, memoizing both.
+
+    Parameter:
+    root_program_path (string): path to the LLVM IR file of the program
+    passes (list: string): passes the sequences are made of
+    work_directory (string): directory the states are written to for opt to read
+    cache (IRCache): cache memoizing the states and transitions
+    toolchain (Toolchain): toolchain whose opt is used, the tools on PATH if None
+    metric (string): metric minimized, one of METRICS
+    jobs (int): passes applied at once when a state is expanded, one per core if None
+    profiler (Profiler): profiler counting the opt runs and transition hits, None to only count them for the report
+    """
+
+    def __init__(self, root_program_path, passes, work_directory, cache, toolchain = None, metric = 'instructions', jobs = None, profiler = None):
+
+        if metric not in METRICS:
+            raise ValueError('Unknown metric ' + metric + ', expected one of ' + ', '.join(METRICS))
+
+        if toolchain is None:
+            toolchain = Toolchain.default_toolchain()
+
+        # The report needs the opt runs even when the caller doesn't profile
+        self.profiler = Profiling.Profiler() if profiler is None else profiler
+
+        self.passes = passes
+        self.metric = metric
+        self.jobs = Diff_Engine.default_jobs() if jobs is None else jobs
+        self.walker = Random_Walks.Walker(cache, toolchain, work_directory, self.profiler)
+        self.root = cache.put_file(root_program_path)
+
+        self.metrics = {}
+        self.successors = {}
+        self.initial_opt_runs = self.profiler.counters.get('opt runs', 0)
+
+    def score(self, state):
+        """
+        Metric of a state.
+
+        Parameter:
+        state (string): content address of the state
+
+        Return:
+        value (int): the metric of its IR
+        """
+
+        value = self.metrics.get(state)
+
+        if value is None:
+            counts, size = IR_Features.ir_counts(self.walker.state_path(state))
+            index = METRICS[self.metric]
+            value = size if index is None else int(counts[index])
+            self.metrics[state] = value
+
+        return value
+
+    def expand(self, state):
+        """
+        States every pass turns a state into, the passes are applied in parallel.
+
+        Parameter:
+        state (string): content address of the state
+
+        Return:
+        successors (list: tuple): (pass, target) in pass order, passes that failed or left the state unchanged are left out
+        """
+
+        successors = self.successors.get(state)
+
+        if successors is None:
+            targets = Diff_Engine.ordered_map(lambda opt_pass: self.walker.step(state, opt_pass), self.passes, self.jobs)
+            successors = [(opt_pass, target) for opt_pass, target in zip(self.passes, targets) if target is not None and target != state]
+            self.successors[state] = successors
+
+        return successors
+
+    def opt_runs(self):
+        """
+        opt calls made since the search started.
+
+        Return:
+        runs (int): the number of opt runs
+        """
+
+        return self.profiler.counters.get('opt runs', 0) - self.initial_opt_runs
+
+    def beam(self, beam_width = 8, max_depth = 10, target = None):
+        """
+        Beam search: expands the beam_width best new states of every depth, up to max_depth passes.
+
+        Parameter:
+        beam_width (int): states kept at every depth
+        max_depth (int): maximum length of a sequence
+        target (int): stops as soon as a state's metric is at most this, None to search to max_depth
+
+        Return:
+        best (tuple): (metric, sequence, state) of the best state found
+        expanded (int): number of states expanded
+        """
+
+        best = (self.score(self.root), [], self.root)
+        beam = [best]
+        seen = {self.root}
+        expanded = 0
+
+        for depth in range(max_depth):
+
+            if target is not None and best[0] <= target:
+                break
+
+            candidates = []
+
+            for value, sequence, state in beam:
+
+                expanded += 1
+
+                for opt_pass, successor in self.expand(state):
+
+                    if successor in seen:
+                        continue
+                    seen.add(successor)
+
+                    candidates.append((self.score(successor), sequence + [opt_pass], successor))
+
+            if not candidates:
+                break
+
+            # Lowest metric first, then the shortest and alphabetically first sequence so the result is deterministic
+            candidates.sort(key = lambda candidate: (candidate[0], len(candidate[1]), candidate[1]))
+            beam = candidates[:beam_width]
+
+            if beam[0][0] < best[0]:
+                best = beam[0]
+
+        return best, expanded
+
+    def astar(self, target, max_depth = 10):
+        """
+        A* search for the shortest sequence reaching a metric of at most target. Every pass costs 1 and the
+        heuristic is 1 for states above the target, 0 otherwise, so it is admissible and the sequence found
+        is a shortest one. Among states at the same cost, the one with the lowest metric is expanded first.
+
+        Parameter:
+        target (int): metric to reach
+        max_depth (int): maximum length of a sequence
+
+        Return:
+        best (tuple): (metric, sequence, state) of the goal reached, or of the best state found if the target is out of reach
+        expanded (int): number of states expanded
+        """
+
+        root_value = self.score(self.root)
+        best = (root_value, [], self.root)
+        frontier = [(0 if root_value <= target else 1, root_value, [], self.root)]
+        depths = {self.root: 0}
+        expanded = 0
+
+        while frontier:
+
+            estimate, value, sequence, state = heapq.heappop(frontier)
+
+            if value <= target:
+                return (value, sequence, state), expanded
+
+            if value < best[0]:
+                best = (value, sequence, state)
+
+            if len(sequence) >= max_depth or depths.get(state, len(sequence)) < len(sequence):
+                continue
+
+            expanded += 1
+
+            for opt_pass, successor in self.expand(state):
+
+                depth = len(sequence) + 1
+                if depths.get(successor, max_depth + 1) <= depth:
+                    continue
+                depths[successor] = depth
+
+                successor_value = self.score(successor)
+                heapq.heappush(frontier, (depth + (0 if successor_value <= target else 1), successor_value, sequence + [opt_pass], successor))
+
+        return best, expanded
+
+    def bfs_applications(self, max_depth):
+        """
+        Pass applications a breadth first exploration (deduplicating states by hash) needs to cover every
+        state up to max_depth passes from the root. Runs opt for the transitions not memoized yet.
+
+        Parameter:
+        max_depth (int): depth covered
+
+        Return:
+        applications (int): states expanded times the number of passes
+        states (int): distinct states within max_depth passes
+        """
+
+        level = [self.root]
+        seen = {self.root}
+        expanded = 0
+
+        for depth in range(max_depth):
+
+            next_level = []
+
+            for state in level:
+                expanded += 1
+                for opt_pass, successor in self.expand(state):
+                    if successor not in seen:
+                        seen.add(successor)
+                        next_level.append(successor)
+
+            if not next_level:
+                break
+            level = next_level
+
+        return expanded * len(self.passes), len(seen)
+
+
+def tree_bound(passes, depth):
+    """
+    Pass applications of a breadth first exploration to a depth if no two sequences reached the same state.
+
+    Parameter:
+    passes (int): number of passes
+    depth (int): depth covered
+
+    Return:
+    applications (int): passes times the number of sequences shorter than depth
+    """
+
+    return passes * sum(passes ** level for level in range(depth))
+
+
+def search(root_program_path, passes, work_directory, cache, toolchain = None, strategy = 'beam', metric = 'instructions', beam_width = 8,
+           max_depth = 10, target = None, jobs = None, bfs = False, profiler = None):
+    """
+    Searches the pass sequence minimizing a metric of a program.
+
+    Parameter:
+    root_program_path (string): path to the LLVM IR file of the program
+    passes (list: string): passes the sequences are made of
+    work_directory (string): directory the states are written to for opt to read
+    cache (IRCache): cache memoizing the states and transitions
+    toolchain (Toolchain): toolchain whose opt is used, the tools on PATH if None
+    strategy (string): 'beam' or 'astar', A* needs a target
+    metric (string): metric minimized, one of METRICS
+    beam_width (int): states kept at every depth of the beam search
+    max_depth (int): maximum length of a sequence
+    target (int): metric to reach, the beam search stops once it is reached
+    jobs (int): passes applied at once when a state is expanded, one per core if None
+    bfs (bool): also count the pass applications of a breadth first exploration to the depth of the sequence found
+    profiler (Profiler): profiler counting the opt runs and transition hits, None to not profile
+
+    Return:
+    result (dict): the sequence, the metric of the root and of the state reached, and the opt calls of the search and of BFS
+    """
+
+    if strategy not in ('beam', 'astar'):
+        raise ValueError('Unknown strategy ' + strategy + ', expected beam or astar')
+    if strategy == 'astar' and target is None:
+        raise ValueError('A* needs a target metric')
+
+    engine = Search(root_program_path, passes, work_directory, cache, toolchain, metric, jobs, profiler)
+
+    if strategy == 'beam':
+        (value, sequence, state), expanded = engine.beam(beam_width, max_depth, target)
+    else:
+        (value, sequence, state), expanded = engine.astar(target, max_depth)
+
+    result = {
+        'strategy': strategy,
+        'metric': metric,
+        'root metric': engine.score(engine.root),
+        'metric reached': value,
+        'target reached': None if target is None else value <= target,
+        'sequence': sequence,
+        'state': state,
+        'states expanded': expanded,
+        'pass applications': expanded * len(passes),
+        'opt calls': engine.opt_runs(),
+        'bfs bound': tree_bound(len(passes), len(sequence))
+    }
+
+    # Only the states strictly above the depth of the sequence have to be expanded to reach it
+    if bfs:
+        applications, states = engine.bfs_applications(len(sequence))
+        result['bfs pass applications'] = applications
+        result['bfs states'] = states
+
+    return result
+
+
+def report(result):
+    """
+    Human readable summary.
+
+    Parameter:
+    result (dict): result returned by search()
+
+    Return:
+    text (string): the report
+    """
+
+    lines = [
+        'Sequence: ' + (' '.join(result['sequence']) if result['sequence'] else '(none, the program is already the best found)'),
+        '{}: {} -> {}'.format(result['metric'].capitalize(), result['root metric'], result['metric reached']),
+        'opt calls: {} for {} pass applications over {} states, the others were memoized'.format(result['opt calls'], result['pass applications'], result['states expanded']),
+        'BFS to depth {}: at most {} pass applications'.format(len(result['sequence']), result['bfs bound'])
+    ]
+
+    if 'bfs pass applications' in result:
+        lines[-1] += ', {} with deduplication ({} states)'.format(result['bfs pass applications'], result['bfs states'])
+
+    return '\n'.join(lines)
+
+
+def parse_arguments():
+
+    parser = argparse.ArgumentParser(description = 'Searches the pass sequence that minimizes a metric of a program, expanding only the promising states.')
+    parser.add_argument('program', help = 'LLVM IR file to optimize')
+    parser.add_argument('output', help = 'directory the result, the best program and the states are written to')
+    parser.add_argument('--strategy', choices = ['beam', 'astar'], default = 'beam', help = 'beam search, or A* for the shortest sequence reaching --target')
+    parser.add_argument('--metric', choices = list(METRICS), default = 'instructions', help = 'metric of the IR minimized')
+    parser.add_argument('--beam-width', type = int, default = 8, help = 'states kept at every depth of the beam search')
+    parser.add_argument('--max-depth', type = int, default = 10, help = 'maximum length of a sequence')
+    parser.add_argument('--target', type = int, default = None, help = 'metric to reach, required by A*')
+    parser.add_argument('--passes', nargs = '+', default = None, help = 'passes the sequences are made of, the O1 passes known to opt by default')
+    parser.add_argument('--jobs', type = int, default = None, help = 'passes applied at once, one per core by default')
+    parser.add_argument('--bfs', action = 'store_true', help = 'also count the pass applications of a breadth first exploration to the same depth')
+    parser.add_argument('--tools', default = None, help = 'bin directory or install prefix of the LLVM toolchain, the tools on PATH by default')
+    parser.add_argument('--cache', default = None, help = 'path of the IR cache, in the user cache directory by default')
+
+    return parser.parse_args()
+
+
+def main():
+
+    arguments = parse_arguments()
+
+    toolchain = Toolchain.default_toolchain() if arguments.tools is None else Toolchain.toolchain(arguments.tools)
+
+    # The O1 list is from 2023, an older opt lacks a few of its passes
+    if arguments.passes is None:
+        passes = Pass_Registry.available_passes(Pass_Registry.O1_PASSES, toolchain.opt)
+    else:
+        passes = arguments.passes
+        Pass_Registry.validate_passes(passes, toolchain.opt)
+
+    os.makedirs(arguments.output, exist_ok = True)
+    cache = IR_Cache.IRCache(arguments.cache)
+
+    try:
+        result = search(arguments.program, passes, os.path.join(arguments.output, 'states'), cache, toolchain, arguments.strategy, arguments.metric,
+                        arguments.beam_width, arguments.max_depth, arguments.target, arguments.jobs, arguments.bfs)
+
+        name = os.path.basename(arguments.program)
+        cache.materialize(result['state'], os.path.join(arguments.output, name + '.best.ll'))
+    finally:
+        cache.close()
+
+    with open(os.path.join(arguments.output, name + '.search.json'), 'w') as file:
+        json.dump(result, file, indent = 2)
+
+    print(report(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+# Headless plot rendering for LLVM-DIFF.py. Forces the Agg backend, reuses one figure per process and
+# draws every scatter in a single call with a colour array instead of one call per cluster. The data of a
+# pass is written next to its plots as soon as the pass is clustered and the job only holds its path, so
+# each pass can be handed to a pool of worker processes right away without the caller keeping the data of
+# every pass. A faceted summary image with every pass side by side can be built for each metric pair.
+# matplotlib is only imported once something is drawn, so building plot jobs never loads it.
+
+import os
+import math
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+# Colour of every cluster id, wrapping around the default colour cycle
+PALETTE = np.array(['C{}'.format(i) for i in range(10)])
+
+# Name of the file holding the data of a pass, next to its plots
+DATA_NAME = 'plot-data.npz'
+
+# Figure reused by every plot drawn in this process
+figure = None
+
+
+def pyplot():
+    """
+    matplotlib's pyplot with the Agg backend, imported on first use.
+
+    Return:
+    plt (module): matplotlib.pyplot
+    """
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    return plt
+
+
+def plot_job(store_plots, metric_names, data_array, cluster_labels):
+    """
+    Writes the data of one pass next to its plots and packs the job rendering them, so the job stays small
+    enough to be sent to a worker process or kept for the summary.
+
+    Parameter:
+    store_plots (string): path to the directory the plots of the pass are stored in
+    metric_names (list: string): name of every metric column
+    data_array (ndarray): programs x metrics array
+    cluster_labels (ndarray): cluster of every program
+
+    Return:
+    job (dict): plot job of the pass
+    """
+
+    os.makedirs(store_plots, exist_ok = True)
+
+    data_path = os.path.join(store_plots, DATA_NAME)
+    np.savez(data_path, data = np.asarray(data_array), labels = np.asarray(cluster_labels))
+
+    return {
+        'store_plots': store_plots,
+        'metric_names': list(metric_names),
+        'data_path': data_path
+    }
+
+
+def load_job(job):
+    """
+    Reads back the data written by plot_job().
+
+    Parameter:
+    job (dict): plot job as returned by plot_job()
+
+    Return:
+    data (ndarray): programs x metrics array
+    labels (ndarray): cluster of every program
+    """
+
+    with np.load(job['data_path']) as arrays:
+        return arrays['data'], arrays['labels']
+
+
+def reusable_axes():
+    """
+    Clears and returns the axes of the figure reused by this process.
+
+    Return:
+    figure (Figure): the reused figure
+    axes (Axes): its cleared axes
+    """
+
+    global figure
+
+    if figure is None:
+        figure = pyplot().figure()
+
+    figure.clear()
+
+    return figure, figure.add_subplot()
+
+
+def render_pass(job):
+    """
+    Plots every possible combination of the metrics of one pass, coloured by cluster.
+
+    Parameter:
+    job (dict): plot job as returned by plot_job()
+
+    Return:
+    Nothing, generates the plots in the job's directory
+    """
+
+    store_plots = job['store_plots']
+    metric_names = job['metric_names']
+    data, labels = load_job(job)
+
+    # Make a new subdirectory to store plots
+    os.makedirs(store_plots, exist_ok = True)
+
+    # Colour of every point, computed once for all metric pairs
+    colors = PALETTE[labels % len(PALETTE)]
+
+    # Loop through each metric and ensure every possible combination of metrics is plotted
+    for i in range(len(metric_names)):
+
+        for j in range(i + 1, len(metric_names)):
+
+            figure, axes = reusable_axes()
+
+            # Plot every cluster at once
+            axes.scatter(data[:, i], data[:, j], c = colors, s = 15)
+
+            # Style the graph
+            axes.set_xlabel(metric_names[i])
+            axes.set_ylabel(metric_names[j])
+            plot_title = (store_plots.split('/')[-1]) + " " + metric_names[i] + ' vs ' + metric_names[j]
+            axes.set_title(plot_title)
+            axes.grid(True)
+
+            # Save the current plot to the directory
+            figure.savefig(os.path.join(store_plots, plot_title + '.png'), format = 'png')
+
+
+class Renderer:
+    """
+    Renders passes as soon as their jobs are submitted, in a pool of worker processes when more than one
+    worker is asked for, so the caller never has to hold the jobs of every pass.
+    """
+
+    def __init__(self, workers = 1):
+
+        # Passes are rendered in the calling process with a single worker
+        self.executor = ProcessPoolExecutor(max_workers = workers) if workers > 1 else None
+        self.futures = []
+
+    def submit(self, job):
+        """
+        Renders the plots of one pass, or queues them on the pool.
+
+        Parameter:
+        job (dict): plot job as returned by plot_job()
+
+        Return:
+        Nothing, generates the plots of the pass
+        """
+
+        if self.executor is None:
+            render_pass(job)
+            return
+
+        self.futures.append(self.executor.submit(render_pass, job))
+
+    def close(self):
+        """
+        Waits for every submitted pass, raising the error of the first one that failed.
+
+        Return:
+        Nothing
+        """
+
+        if self.executor is None:
+            return
+
+        with self.executor:
+            for future in self.futures:
+                future.result()
+
+        self.futures = []
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *exception):
+
+        self.close()
+
+
+def render_passes(jobs, workers = 1):
+    """
+    Renders the plots of many passes, in parallel worker processes when more than one worker is asked for.
+
+    Parameter:
+    jobs (iterable: dict): plot job of every pass, each is submitted as soon as it is produced
+    workers (int): number of worker processes
+
+    Return:
+    Nothing, generates the plots of every pass
+    """
+
+    with Renderer(workers) as renderer:
+        for job in jobs:
+            renderer.submit(job)
+
+
+def render_summary(summary_dir, jobs):
+    """
+    Builds one faceted image per metric pair with the scatter of every pass side by side.
+
+    Parameter:
+    summary_dir (string): path to the directory the summary images are stored in
+    jobs (list: dict): plot job of every pass, all with the same metrics
+
+    Return:
+    Nothing, generates one summary image per metric pair
+    """
+
+    os.makedirs(summary_dir, exist_ok = True)
+
+    plt = pyplot()
+    metric_names = jobs[0]['metric_names']
+
+    # Grid as close to square as possible
+    columns = math.ceil(math.sqrt(len(jobs)))
+    rows = math.ceil(len(jobs) / columns)
+
+    # One figure per metric pair, filled one pass at a time so only the data of one pass is loaded at once
+    pairs = [(i, j) for i in range(len(metric_names)) for j in range(i + 1, len(metric_names))]
+    figures = {pair: plt.subplots(rows, columns, figsize = (3 * columns, 3 * rows), squeeze = False) for pair in pairs}
+
+    for index, job in enumerate(jobs):
+
+        data, labels = load_job(job)
+        colors = PALETTE[labels % len(PALETTE)]
+
+        for (i, j), (figure, grid) in figures.items():
+            facet = grid.flat[index]
+            facet.scatter(data[:, i], data[:, j], c = colors, s = 4)
+            facet.set_title(job['store_plots'].split('/')[-1], fontsize = 8)
+            facet.tick_params(labelsize = 6)
+
+    for (i, j), (figure, grid) in figures.items():
+
+        # Hide the unused facets
+        for facet in grid.flat[len(jobs):]:
+            facet.set_visible(False)
+
+        plot_title = metric_names[i] + ' vs ' + metric_names[j]
+        figure.suptitle(plot_title)
+        figure.supxlabel(metric_names[i])
+        figure.supylabel(metric_names[j])
+        figure.tight_layout()
+
+        figure.savefig(os.path.join(summary_dir, plot_title + '.png'), format = 'png')
+        plt.close(figure)
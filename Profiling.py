@@ -0,0 +1,362 @@
+# Built-in instrumentation of the exploration loop. A Profiler keeps a timer per stage (apply_pass, dedup
+# compare, node insert, export, generate_ir, ...), counters (opt runs, cache hits, ...) and gauges such as
+# the queue depth, and writes them as JSON or CSV summaries. Stages can also be recorded as a Chrome trace
+# (chrome://tracing or https://ui.perfetto.dev). For finer detail, cProfile or a dependency-free sampling
+# profiler can wrap a whole run.
+
+import csv
+import sys
+import json
+import time
+import cProfile
+import threading
+from contextlib import contextmanager, nullcontext
+
+# Counters whose hit rate is reported, as (hits, counters adding up to the lookups)
+HIT_RATES = {
+    'transition cache': ('transition hits', ['transition hits', 'opt runs']),
+    'diff cache': ('diff hits', ['diff hits', 'diff runs']),
+    'dedup': ('dedup hits', ['dedup lookups']),
+    'dedup by hash': ('hash hits', ['dedup lookups']),
+    'candidates eliminated by stats': ('stats eliminated', ['dedup candidates']),
+    'candidates reaching llvm-diff': ('diff candidates', ['dedup candidates'])
+}
+
+
+class Profiler:
+    """
+    Stage timers, counters and gauges of a run. Safe to share between threads.
+
+    Parameter:
+    trace (bool): also record every stage as a Chrome trace event
+    max_trace_events (int): trace events kept, later ones are counted in 'trace events dropped'
+    """
+
+    def __init__(self, trace = False, max_trace_events = 1000000):
+
+        self.enabled = True
+        self.lock = threading.Lock()
+        self.start_time = time.perf_counter()
+
+        # Stage name to [calls, total seconds, min seconds, max seconds]
+        self.stages = {}
+        self.counters = {}
+
+        # Gauge name to [samples, total, max, last]
+        self.gauges = {}
+
+        self.trace = trace
+        self.max_trace_events = max_trace_events
+        self.trace_events = []
+
+    def record(self, name, start, end):
+        """
+        Records one run of a stage.
+
+        Parameter:
+        name (string): name of the stage
+        start (float): perf_counter() when the stage started
+        end (float): perf_counter() when the stage ended
+
+        Return:
+        Nothing, updates the stage timer and the trace
+        """
+
+        seconds = end - start
+
+        with self.lock:
+
+            timer = self.stages.get(name)
+            if timer is None:
+                self.stages[name] = [1, seconds, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = min(timer[2], seconds)
+                timer[3] = max(timer[3], seconds)
+
+            if self.trace:
+                if len(self.trace_events) < self.max_trace_events:
+                    self.trace_events.append({'name': name, 'ph': 'X', 'ts': (start - self.start_time) * 1e6, 'dur': seconds * 1e6, 'pid': 0, 'tid': threading.get_ident()})
+                else:
+                    self.counters['trace events dropped'] = self.counters.get('trace events dropped', 0) + 1
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times the code run inside the with block as one run of a stage.
+
+        Parameter:
+        name (string): name of the stage
+
+        Return:
+        Nothing, records the stage when the block exits
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter())
+
+    def count(self, name, amount = 1):
+        """
+        Increments a counter.
+
+        Parameter:
+        name (string): name of the counter
+        amount (int): amount to add
+
+        Return:
+        Nothing, updates the counter
+        """
+
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def gauge(self, name, value):
+        """
+        Samples a gauge, e.g. the queue depth.
+
+        Parameter:
+        name (string): name of the gauge
+        value (float): current value
+
+        Return:
+        Nothing, updates the gauge
+        """
+
+        with self.lock:
+            samples = self.gauges.get(name)
+            if samples is None:
+                self.gauges[name] = [1, value, value, value]
+            else:
+                samples[0] += 1
+                samples[1] += value
+                samples[2] = max(samples[2], value)
+                samples[3] = value
+
+    def summary(self):
+        """
+        Summary of everything recorded so far.
+
+        Return:
+        summary (dict): wall seconds, stage timers, counters, gauges and cache hit rates
+        """
+
+        with self.lock:
+
+            stages = {name: {'calls': calls, 'seconds': total, 'mean seconds': total / calls, 'min seconds': low, 'max seconds': high} for name, (calls, total, low, high) in self.stages.items()}
+            gauges = {name: {'samples': samples, 'mean': total / samples, 'max': high, 'last': last} for name, (samples, total, high, last) in self.gauges.items()}
+            counters = dict(self.counters)
+
+        hit_rates = {}
+        for name, (hits, lookup_counters) in HIT_RATES.items():
+            lookups = sum(counters.get(counter, 0) for counter in lookup_counters)
+            if lookups > 0:
+                hit_rates[name] = counters.get(hits, 0) / lookups
+
+        return {'wall seconds': time.perf_counter() - self.start_time, 'stages': stages, 'counters': counters, 'gauges': gauges, 'hit rates': hit_rates}
+
+    def write_json(self, json_path):
+        """
+        Outputs the summary to a JSON file.
+
+        Parameter:
+        json_path (string): path of the JSON file
+
+        Return:
+        Nothing, generates the JSON file
+        """
+
+        with open(json_path, 'w') as file:
+            json.dump(self.summary(), file, indent = 2)
+
+    def write_csv(self, csv_path):
+        """
+        Outputs the stage timers, then the counters, gauges and hit rates, to a csv file.
+
+        Parameter:
+        csv_path (string): path of the csv file
+
+        Return:
+        Nothing, generates the csv file
+        """
+
+        summary = self.summary()
+
+        with open(csv_path, mode = 'w', newline = '') as file:
+
+            writer = csv.writer(file)
+            writer.writerow(['Kind', 'Name', 'Calls', 'Seconds', 'Mean Seconds', 'Min Seconds', 'Max Seconds', 'Value'])
+
+            for name, timer in sorted(summary['stages'].items(), key = lambda item: -item[1]['seconds']):
+                writer.writerow(['stage', name, timer['calls'], timer['seconds'], timer['mean seconds'], timer['min seconds'], timer['max seconds'], ''])
+
+            for name, value in sorted(summary['counters'].items()):
+                writer.writerow(['counter', name, '', '', '', '', '', value])
+
+            for name, gauge in sorted(summary['gauges'].items()):
+                writer.writerow(['gauge mean', name, gauge['samples'], '', '', '', '', gauge['mean']])
+                writer.writerow(['gauge max', name, gauge['samples'], '', '', '', '', gauge['max']])
+
+            for name, rate in sorted(summary['hit rates'].items()):
+                writer.writerow(['hit rate', name, '', '', '', '', '', rate])
+
+            writer.writerow(['wall', 'total', '', summary['wall seconds'], '', '', '', ''])
+
+    def write_trace(self, trace_path):
+        """
+        Outputs the recorded stages as a Chrome trace file.
+
+        Parameter:
+        trace_path (string): path of the trace file
+
+        Return:
+        Nothing, generates the trace file
+        """
+
+        with self.lock:
+            events = list(self.trace_events)
+
+        with open(trace_path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+
+
+class DisabledProfiler:
+    """
+    Profiler that records nothing, used when no profiler is given so the instrumented code has no branches.
+    """
+
+    enabled = False
+
+    def stage(self, name):
+        return nullcontext()
+
+    def count(self, name, amount = 1):
+        pass
+
+    def gauge(self, name, value):
+        pass
+
+
+# Shared by every caller that doesn't profile
+DISABLED = DisabledProfiler()
+
+
+def active(profiler):
+    """
+    Profiler to record to.
+
+    Parameter:
+    profiler (Profiler): the caller's profiler, None if not profiling
+
+    Return:
+    profiler (Profiler): the given profiler, or the disabled one
+    """
+
+    return DISABLED if profiler is None else profiler
+
+
+class Sampler:
+    """
+    Sampling profiler. A background thread looks at the stack of every other thread at a fixed interval,
+    so the overhead doesn't grow with the number of calls. Writes collapsed stacks for flame graph tools
+    (flamegraph.pl, speedscope).
+
+    Parameter:
+    interval (float): seconds between samples
+    """
+
+    def __init__(self, interval = 0.01):
+
+        self.interval = interval
+        self.samples = {}
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target = self.run, daemon = True)
+
+    def run(self):
+        """
+        Body of the sampling thread, samples until stop() is called.
+        """
+
+        own_id = threading.get_ident()
+
+        while not self.stopped.wait(self.interval):
+
+            for thread_id, frame in sys._current_frames().items():
+
+                if thread_id == own_id:
+                    continue
+
+                # Outermost call first
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code.co_filename.split('/')[-1] + ':' + frame.f_code.co_name)
+                    frame = frame.f_back
+
+                key = ';'.join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+
+    def start(self):
+        """
+        Starts sampling in the background.
+        """
+
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops sampling and waits for the sampling thread to exit.
+        """
+
+        self.stopped.set()
+        self.thread.join()
+
+    def write_collapsed(self, path):
+        """
+        Outputs the samples as collapsed stacks, one 'frame;frame;frame count' line per stack.
+
+        Parameter:
+        path (string): path of the output file
+
+        Return:
+        Nothing, generates the file
+        """
+
+        with open(path, 'w') as file:
+            for stack, samples in sorted(self.samples.items(), key = lambda item: -item[1]):
+                file.write(stack + ' ' + str(samples) + '\n')
+
+
+@contextmanager
+def profile_calls(cprofile_path = None, sample_path = None, interval = 0.01):
+    """
+    Profiles the code run inside the with block with cProfile, the sampler, both or neither.
+
+    Parameter:
+    cprofile_path (string): path of the cProfile stats file (readable with pstats or snakeviz), None to skip
+    sample_path (string): path of the collapsed stacks file of the sampler, None to skip
+    interval (float): seconds between samples
+
+    Return:
+    Nothing, writes the profiles when the block exits
+    """
+
+    profile = cProfile.Profile() if cprofile_path else None
+    sampler = Sampler(interval) if sample_path else None
+
+    if sampler is not None:
+        sampler.start()
+    if profile is not None:
+        profile.enable()
+
+    try:
+        yield
+    finally:
+        if profile is not None:
+            profile.disable()
+            profile.dump_stats(cprofile_path)
+        if sampler is not None:
+            sampler.stop()
+            sampler.write_collapsed(sample_path)
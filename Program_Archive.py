@@ -0,0 +1,316 @@
+# Output backends for Optimize_Pass2.py. Every optimized version of a program is addressed by its pass
+# path, e.g. 'sroa' for round 1 and 'sroa/licm' for licm applied after sroa. The loose backend keeps the
+# original layout of one subdirectory per pass, the archive backend packs all versions and csv reports of
+# a program into one indexed SQLite file with random access by pass path.
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import zlib
+
+# Backends that can be selected for the output
+BACKENDS = ['archive', 'loose']
+
+
+class LooseFileStore:
+    """
+    Stores each optimized version of a program as a loose file in <program directory>/<pass path>/<filename>.
+    """
+
+    def __init__(self, program_directory_path):
+
+        self.program_directory_path = program_directory_path
+
+        # Filenames of the versions written so far, keyed by pass path
+        self.filenames = {}
+
+        os.makedirs(program_directory_path, exist_ok = True)
+
+    def write(self, pass_path, filename, ir):
+        """
+        Stores an optimized version of the program.
+
+        Parameter:
+        pass_path (string): pass path of the version, passes separated by '/'
+        filename (string): name of the optimized file
+        ir (bytes): contents of the optimized file
+
+        Return:
+        Nothing, writes the file
+        """
+
+        pass_directory_path = os.path.join(self.program_directory_path, pass_path)
+        os.makedirs(pass_directory_path, exist_ok = True)
+
+        with open(os.path.join(pass_directory_path, filename), 'wb') as file:
+            file.write(ir)
+
+        self.filenames[pass_path] = filename
+
+    def path(self, pass_path):
+        """
+        Path on disk of an optimized version, usable by opt and llvm-diff.
+
+        Parameter:
+        pass_path (string): pass path of the version
+
+        Return:
+        path (string): path to the optimized file
+        """
+
+        pass_directory_path = os.path.join(self.program_directory_path, pass_path)
+
+        # Versions from a previous run are found by their .ll extension
+        if pass_path not in self.filenames:
+            self.filenames[pass_path] = [item for item in os.listdir(pass_directory_path) if item.endswith('.ll')][0]
+
+        return os.path.join(pass_directory_path, self.filenames[pass_path])
+
+    def release(self, pass_path):
+        """
+        Loose files already live on disk, nothing to release.
+        """
+
+    def read(self, pass_path):
+        """
+        Contents of an optimized version.
+
+        Parameter:
+        pass_path (string): pass path of the version
+
+        Return:
+        ir (bytes): contents of the optimized file
+        """
+
+        with open(self.path(pass_path), 'rb') as file:
+            return file.read()
+
+    def write_report(self, pass_path, name, text):
+        """
+        Stores a report (such as an llvm-diff csv) in the directory of the given pass path.
+
+        Parameter:
+        pass_path (string): pass path the report belongs to, '' for the program itself
+        name (string): name of the report file
+        text (string): contents of the report
+
+        Return:
+        Nothing, writes the report file
+        """
+
+        report_directory_path = os.path.join(self.program_directory_path, pass_path)
+        os.makedirs(report_directory_path, exist_ok = True)
+
+        with open(os.path.join(report_directory_path, name), 'w', newline = '') as file:
+            file.write(text)
+
+    def pass_paths(self, prefix = ''):
+        """
+        Pass paths of all stored versions, optionally only those under a given pass path.
+
+        Parameter:
+        prefix (string): only list versions under this pass path, all versions if ''
+
+        Return:
+        pass_paths (list: string): stored pass paths, sorted
+        """
+
+        pass_paths = []
+
+        # Every directory holding a .ll file is a version
+        for directory, subdirectories, files in os.walk(os.path.join(self.program_directory_path, prefix)):
+            pass_path = os.path.relpath(directory, self.program_directory_path).replace(os.sep, '/')
+            if pass_path != prefix and pass_path != '.' and any(file.endswith('.ll') for file in files):
+                pass_paths.append(pass_path)
+
+        return sorted(pass_paths)
+
+    def close(self):
+        """
+        Nothing to close for loose files.
+        """
+
+
+class ArchiveStore:
+    """
+    Stores every optimized version and report of a program in a single SQLite file, compressed with zlib and
+    indexed by pass path. Versions needed on disk by opt or llvm-diff are materialized in a local temporary
+    directory that is removed on close().
+    """
+
+    def __init__(self, archive_path):
+
+        self.archive_path = archive_path
+        os.makedirs(os.path.dirname(os.path.abspath(archive_path)), exist_ok = True)
+        self.connection = sqlite3.connect(archive_path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS versions (pass_path TEXT PRIMARY KEY, filename TEXT, ir BLOB)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS reports (pass_path TEXT, name TEXT, text TEXT, PRIMARY KEY (pass_path, name))')
+
+        # Local directory for materialized versions and the paths materialized so far
+        self.temporary_directory = None
+        self.materialized = {}
+
+    def write(self, pass_path, filename, ir):
+        """
+        Stores an optimized version of the program.
+
+        Parameter:
+        pass_path (string): pass path of the version, passes separated by '/'
+        filename (string): name of the optimized file
+        ir (bytes): contents of the optimized file
+
+        Return:
+        Nothing, inserts the version into the archive
+        """
+
+        self.connection.execute('INSERT OR REPLACE INTO versions VALUES (?, ?, ?)', (pass_path, filename, zlib.compress(ir)))
+
+    def read(self, pass_path):
+        """
+        Contents of an optimized version.
+
+        Parameter:
+        pass_path (string): pass path of the version
+
+        Return:
+        ir (bytes): contents of the optimized file
+        """
+
+        row = self.connection.execute('SELECT ir FROM versions WHERE pass_path = ?', (pass_path,)).fetchone()
+        if row is None:
+            raise KeyError(pass_path)
+
+        return zlib.decompress(row[0])
+
+    def path(self, pass_path):
+        """
+        Materializes an optimized version in the temporary directory so opt and llvm-diff can read it.
+
+        Parameter:
+        pass_path (string): pass path of the version
+
+        Return:
+        path (string): path to the materialized file
+        """
+
+        if pass_path not in self.materialized:
+
+            if self.temporary_directory is None:
+                self.temporary_directory = tempfile.mkdtemp(prefix = 'program-archive-')
+
+            row = self.connection.execute('SELECT filename, ir FROM versions WHERE pass_path = ?', (pass_path,)).fetchone()
+            if row is None:
+                raise KeyError(pass_path)
+
+            # Mirror the loose layout so the materialized file keeps its original name
+            pass_directory_path = os.path.join(self.temporary_directory, pass_path)
+            os.makedirs(pass_directory_path, exist_ok = True)
+
+            path = os.path.join(pass_directory_path, row[0])
+            with open(path, 'wb') as file:
+                file.write(zlib.decompress(row[1]))
+
+            self.materialized[pass_path] = path
+
+        return self.materialized[pass_path]
+
+    def release(self, pass_path):
+        """
+        Removes the materialized file of a version once it is no longer needed.
+
+        Parameter:
+        pass_path (string): pass path of the version
+
+        Return:
+        Nothing, deletes the temporary file
+        """
+
+        path = self.materialized.pop(pass_path, None)
+        if path is not None:
+            os.remove(path)
+
+    def write_report(self, pass_path, name, text):
+        """
+        Stores a report (such as an llvm-diff csv) under the given pass path.
+
+        Parameter:
+        pass_path (string): pass path the report belongs to, '' for the program itself
+        name (string): name of the report
+        text (string): contents of the report
+
+        Return:
+        Nothing, inserts the report into the archive
+        """
+
+        self.connection.execute('INSERT OR REPLACE INTO reports VALUES (?, ?, ?)', (pass_path, name, text))
+
+    def read_report(self, pass_path, name):
+        """
+        Contents of a stored report.
+
+        Parameter:
+        pass_path (string): pass path the report belongs to
+        name (string): name of the report
+
+        Return:
+        text (string): contents of the report
+        """
+
+        row = self.connection.execute('SELECT text FROM reports WHERE pass_path = ? AND name = ?', (pass_path, name)).fetchone()
+        if row is None:
+            raise KeyError((pass_path, name))
+
+        return row[0]
+
+    def pass_paths(self, prefix = ''):
+        """
+        Pass paths of all stored versions, optionally only those under a given pass path.
+
+        Parameter:
+        prefix (string): only list versions under this pass path, all versions if ''
+
+        Return:
+        pass_paths (list: string): stored pass paths, sorted
+        """
+
+        if prefix == '':
+            rows = self.connection.execute('SELECT pass_path FROM versions ORDER BY pass_path')
+        else:
+            rows = self.connection.execute('SELECT pass_path FROM versions WHERE pass_path LIKE ? ORDER BY pass_path', (prefix + '/%',))
+
+        return [row[0] for row in rows]
+
+    def close(self):
+        """
+        Commits the archive and removes the materialized versions.
+        """
+
+        self.connection.commit()
+        self.connection.close()
+
+        if self.temporary_directory is not None:
+            shutil.rmtree(self.temporary_directory, ignore_errors = True)
+            self.temporary_directory = None
+            self.materialized = {}
+
+
+def open_program_store(optimized_directory_path, program_name, backend = 'archive'):
+    """
+    Opens the output store of a program.
+
+    Parameter:
+    optimized_directory_path (string): root directory holding the output of every program
+    program_name (string): name of the program's .ll file
+    backend (string): 'archive' for one SQLite file per program, 'loose' for nested pass subdirectories
+
+    Return:
+    store (ArchiveStore or LooseFileStore): store for the program's optimized versions and reports
+    """
+
+    if backend == 'archive':
+        return ArchiveStore(os.path.join(optimized_directory_path, program_name + '.sqlite'))
+    elif backend == 'loose':
+        return LooseFileStore(os.path.join(optimized_directory_path, program_name))
+    else:
+        raise ValueError("Unknown output backend '" + backend + "', expected one of " + ', '.join(BACKENDS))
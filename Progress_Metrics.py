@@ -0,0 +1,240 @@
+# Live progress of long explorations. A background thread reads the counters and gauges the exploration
+# records in its Profiler at a fixed interval and reports the throughput (nodes, edges and opt runs per
+# second), the frontier size, the dedup hit rate, the bytes written to disk and the time left relative to
+# the exploration's node and time budget. Reports go to stderr and to a Prometheus text file, so a node
+# exporter's textfile collector can scrape them and stalled or exploding runs are spotted early.
+
+import os
+import sys
+import time
+import threading
+
+# Prefix of every Prometheus metric name
+PREFIX = 'llvm_evolution_'
+
+
+def format_seconds(seconds):
+    """
+    Formats a duration for humans, e.g. 3725 becomes '1h02m05s'.
+
+    Parameter:
+    seconds (float): duration in seconds, None if unknown
+
+    Return:
+    text (string): formatted duration, '?' if unknown
+    """
+
+    if seconds is None:
+        return '?'
+
+    seconds = int(seconds)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+
+    if hours > 0:
+        return '{}h{:02d}m{:02d}s'.format(hours, minutes, seconds)
+    if minutes > 0:
+        return '{}m{:02d}s'.format(minutes, seconds)
+    return '{}s'.format(seconds)
+
+
+def format_bytes(amount):
+    """
+    Formats a number of bytes for humans, e.g. 1536 becomes '1.5 KB'.
+
+    Parameter:
+    amount (float): number of bytes
+
+    Return:
+    text (string): formatted size
+    """
+
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if amount < 1024:
+            return '{:.1f} {}'.format(amount, unit)
+        amount /= 1024
+
+    return '{:.1f} TB'.format(amount)
+
+
+class ProgressEmitter:
+    """
+    Reports the progress recorded by a Profiler every interval seconds, until stopped.
+
+    Parameter:
+    profiler (Profiler): profiler the exploration records to
+    interval (float): seconds between reports
+    textfile_path (string): path of the Prometheus text file, None to only report to stderr
+    stream (file): stream the human readable reports go to, None to only write the text file
+    labels (dict: string): labels added to every Prometheus metric, e.g. {'run': 'loop-passes'}
+    """
+
+    def __init__(self, profiler, interval = 30, textfile_path = None, stream = sys.stderr, labels = None):
+
+        self.profiler = profiler
+        self.interval = interval
+        self.textfile_path = textfile_path
+        self.stream = stream
+        self.labels = labels or {}
+
+        # Counters at the previous report, to compute rates
+        self.previous_time = time.time()
+        self.previous_counters = {}
+
+        # Last time the graph grew, to spot stalled runs
+        self.last_growth_time = self.previous_time
+
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target = self.run, daemon = True)
+
+    def metrics(self):
+        """
+        Computes the current metrics from the profiler.
+
+        Return:
+        metrics (dict: float): value of every metric, None where it can't be known yet
+        """
+
+        now = time.time()
+        summary = self.profiler.summary()
+        counters = summary['counters']
+        gauges = {name: gauge['last'] for name, gauge in summary['gauges'].items()}
+
+        seconds = max(now - self.previous_time, 1e-9)
+
+        def rate(name):
+            return (counters.get(name, 0) - self.previous_counters.get(name, 0)) / seconds
+
+        if counters.get('new nodes', 0) > self.previous_counters.get('new nodes', 0):
+            self.last_growth_time = now
+
+        metrics = {
+            'nodes_total': counters.get('new nodes', 0),
+            'edges_total': counters.get('new edges', 0),
+            'opt_runs_total': counters.get('opt runs', 0),
+            'nodes_per_second': rate('new nodes'),
+            'edges_per_second': rate('new edges'),
+            'opt_runs_per_second': rate('opt runs'),
+            'graph_nodes': gauges.get('graph nodes', 0),
+            'graph_edges': gauges.get('graph edges', 0),
+            'frontier': gauges.get('frontier', 0),
+            'dedup_hit_rate': None,
+            'disk_bytes': counters.get('bytes written', 0),
+            'seconds_since_growth': now - self.last_growth_time,
+            'eta_seconds': None
+        }
+
+        # Fraction of the programs produced that were already on the graph
+        lookups = counters.get('dedup lookups', 0)
+        if lookups > 0:
+            metrics['dedup_hit_rate'] = counters.get('dedup hits', 0) / lookups
+
+        # Time left before the current exploration hits its time budget or, at the current rate, its node budget
+        if 'exploration start' in gauges:
+            time_left = max(gauges.get('time budget', 0) - (now - gauges['exploration start']), 0)
+            eta = time_left
+            if metrics['nodes_per_second'] > 0:
+                eta = min(eta, max(gauges.get('node budget', 0) - metrics['graph_nodes'], 0) / metrics['nodes_per_second'])
+            metrics['eta_seconds'] = eta
+
+        self.previous_time = now
+        self.previous_counters = counters
+
+        return metrics
+
+    def report(self, metrics):
+        """
+        Human readable one line report.
+
+        Parameter:
+        metrics (dict: float): metrics as returned by metrics()
+
+        Return:
+        line (string): the report
+        """
+
+        dedup = '?' if metrics['dedup_hit_rate'] is None else '{:.0%}'.format(metrics['dedup_hit_rate'])
+
+        return '[progress] nodes {} ({:.2f}/s) edges {} ({:.2f}/s) opt {:.2f}/s frontier {} dedup hits {} disk {} no growth for {} eta {}'.format(
+            int(metrics['graph_nodes']), metrics['nodes_per_second'],
+            int(metrics['graph_edges']), metrics['edges_per_second'],
+            metrics['opt_runs_per_second'], int(metrics['frontier']), dedup,
+            format_bytes(metrics['disk_bytes']), format_seconds(metrics['seconds_since_growth']), format_seconds(metrics['eta_seconds']))
+
+    def write_textfile(self, metrics):
+        """
+        Writes the metrics in the Prometheus text format. The file is replaced atomically so the collector
+        never reads a partial file.
+
+        Parameter:
+        metrics (dict: float): metrics as returned by metrics()
+
+        Return:
+        Nothing, replaces the text file
+        """
+
+        labels = ','.join('{}="{}"'.format(name, value) for name, value in sorted(self.labels.items()))
+        labels = '{' + labels + '}' if labels else ''
+
+        lines = []
+        for name, value in metrics.items():
+            if value is None:
+                continue
+            lines.append('# TYPE ' + PREFIX + name + (' counter' if name.endswith('_total') else ' gauge'))
+            lines.append(PREFIX + name + labels + ' ' + repr(float(value)))
+
+        temporary_path = self.textfile_path + '.' + str(os.getpid())
+        with open(temporary_path, 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+        os.replace(temporary_path, self.textfile_path)
+
+    def emit(self):
+        """
+        Reports the current metrics once.
+
+        Return:
+        metrics (dict: float): the reported metrics
+        """
+
+        metrics = self.metrics()
+
+        if self.stream is not None:
+            print(self.report(metrics), file = self.stream, flush = True)
+
+        if self.textfile_path is not None:
+            self.write_textfile(metrics)
+
+        return metrics
+
+    def run(self):
+        """
+        Body of the reporting thread, reports until stop() is called.
+        """
+
+        while not self.stopped.wait(self.interval):
+            self.emit()
+
+    def start(self):
+        """
+        Starts reporting in the background.
+        """
+
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops reporting, with one last report.
+        """
+
+        self.stopped.set()
+        self.thread.join()
+        self.emit()
+
+    def __enter__(self):
+
+        self.start()
+        return self
+
+    def __exit__(self, *exception):
+
+        self.stop()
@@ -0,0 +1,428 @@
+# Monte Carlo estimation of the state space of large pass sets. With all 45 O1 passes the breadth first
+# exploration branches 45 ways at every state and only covers a few levels before its limits, so instead
+# many seeded random walks apply random passes from the root IR, in parallel, until the program stops
+# changing. From the walks it estimates the number of reachable states (Chao1 estimator on how often each
+# state was seen), the depth at which programs reach a fixpoint and how likely every pass is to change a
+# program, all with 95% confidence intervals, and writes the sampled subgraph in the same GML format as
+# Pass_Relations_Graph.py. States are identified by the hash of their canonical IR (see IR_Cache.py), and
+# every transition is memoized in the IR cache so walks crossing known ground don't run opt.
+#
+# Usage: python Random_Walks.py <program.ll> <output directory> [--walks 1000] [--max-steps 100] [--patience 10]
+#                               [--passes ...] [--jobs N] [--seed 0] [--tools <LLVM bin directory>] [--cache <path>]
+
+import os
+import math
+import json
+import random
+import argparse
+import subprocess
+import threading
+
+import Diff_Engine
+import Exploration
+import IR_Cache
+import Pass_Registry
+import Profiling
+import Toolchain
+
+# z score of the 95% confidence intervals
+Z = 1.96
+
+
+def wilson_interval(successes, trials, z = Z):
+    """
+    Wilson score interval of a proportion, well behaved for small counts and proportions near 0 or 1.
+
+    Parameter:
+    successes (int): number of successes
+    trials (int): number of trials
+    z (float): z score of the confidence level
+
+    Return:
+    interval (tuple: float): (low, high), (0, 1) without trials
+    """
+
+    if trials == 0:
+        return 0.0, 1.0
+
+    proportion = successes / trials
+    denominator = 1 + z * z / trials
+    center = (proportion + z * z / (2 * trials)) / denominator
+    margin = z * math.sqrt(proportion * (1 - proportion) / trials + z * z / (4 * trials * trials)) / denominator
+
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def mean_interval(values, z = Z):
+    """
+    Mean of a sample and its normal approximation confidence interval.
+
+    Parameter:
+    values (list: float): the sample
+    z (float): z score of the confidence level
+
+    Return:
+    mean (float): mean of the sample, None if empty
+    interval (tuple: float): (low, high), None if empty
+    """
+
+    if not values:
+        return None, None
+
+    mean = sum(values) / len(values)
+    if len(values) == 1:
+        return mean, (mean, mean)
+
+    variance = sum((value - mean) ** 2 for value in values) / (len(values) - 1)
+    margin = z * math.sqrt(variance / len(values))
+
+    return mean, (mean - margin, mean + margin)
+
+
+def chao1(frequencies, z = Z):
+    """
+    Chao1 estimate of the number of distinct states, seen or not, from how many times each seen state was
+    visited. States seen once (f1) and twice (f2) tell how much of the space is still unseen.
+
+    Parameter:
+    frequencies (list: int): visits of every distinct state seen
+    z (float): z score of the confidence level
+
+    Return:
+    estimate (float): estimated number of reachable states
+    interval (tuple: float): (low, high) log-normal confidence interval, the low end is never below the states seen
+    """
+
+    observed = len(frequencies)
+    f1 = sum(1 for frequency in frequencies if frequency == 1)
+    f2 = sum(1 for frequency in frequencies if frequency == 2)
+
+    # Bias corrected form, defined when no state was seen twice
+    estimate = observed + f1 * (f1 - 1) / (2 * (f2 + 1))
+
+    if f2 > 0:
+        ratio = f1 / f2
+        variance = f2 * (ratio ** 4 / 4 + ratio ** 3 + ratio ** 2 / 2)
+    else:
+        variance = f1 * (f1 - 1) / 2 + f1 * (2 * f1 - 1) ** 2 / 4 - f1 ** 4 / (4 * estimate) if estimate > 0 else 0
+
+    unseen = estimate - observed
+    if unseen <= 0 or variance <= 0:
+        return estimate, (float(observed), estimate)
+
+    factor = math.exp(z * math.sqrt(math.log(1 + variance / unseen ** 2)))
+
+    return estimate, (observed + unseen / factor, observed + unseen * factor)
+
+
+class Walker:
+    """
+    Applies passes on program states through the IR cache. Shared by the threads running the walks.
+
+    Parameter:
+    cache (IRCache): cache memoizing the states and transitions
+    toolchain (Toolchain): toolchain whose opt is used
+    work_directory (string): directory the states are written to for opt to read
+    profiler (Profiler): profiler counting the opt runs and transition hits, None to not profile
+    """
+
+    def __init__(self, cache, toolchain, work_directory, profiler = None):
+
+        self.cache = cache
+        self.toolchain = toolchain
+        self.work_directory = work_directory
+        self.profiler = Profiling.active(profiler)
+
+        os.makedirs(work_directory, exist_ok = True)
+
+    def state_path(self, state):
+        """
+        File of a state, written from the cache the first time it is needed.
+
+        Parameter:
+        state (string): content address of the state
+
+        Return:
+        path (string): path to the LLVM IR file of the state
+        """
+
+        path = os.path.join(self.work_directory, state + '.ll')
+
+        if not os.path.exists(path):
+
+            # Another thread may write the same state, each writes its own file and renames it in place
+            temporary_path = path + '.' + str(threading.get_ident())
+            self.cache.materialize(state, temporary_path)
+            os.replace(temporary_path, path)
+
+        return path
+
+    def step(self, state, opt_pass):
+        """
+        State a pass turns a state into.
+
+        Parameter:
+        state (string): content address of the state
+        opt_pass (string): pass applied
+
+        Return:
+        target (string): content address of the resulting state, None if opt failed
+        """
+
+        target = self.cache.transition(self.toolchain.key, state, opt_pass)
+        if target is not None:
+            self.profiler.count('transition hits')
+            return target
+
+        with self.profiler.stage('opt'):
+            outcome = subprocess.run([self.toolchain.opt, '-S', '-passes=' + opt_pass, '-o', '-', self.state_path(state)], capture_output = True, text = True)
+        self.profiler.count('opt runs')
+
+        if outcome.returncode != 0:
+            self.profiler.count('opt failures')
+            return None
+
+        target = self.cache.put_ir(outcome.stdout)
+        self.cache.add_transition(self.toolchain.key, state, opt_pass, target)
+
+        return target
+
+    def walk(self, root, passes, rng, max_steps, patience):
+        """
+        One random walk: applies uniformly random passes until patience passes in a row leave the program
+        unchanged (a fixpoint) or max_steps passes were applied.
+
+        Parameter:
+        root (string): content address of the root state
+        passes (list: string): passes to pick from
+        rng (Random): random generator of the walk
+        max_steps (int): maximum number of passes applied
+        patience (int): unchanged steps in a row after which the program is considered at a fixpoint
+
+        Return:
+        walk (dict): 'steps' as (source, pass, target) with target None if opt failed, 'fixpoint depth'
+                     (number of steps up to the last change) and 'fixpoint' (whether it was reached)
+        """
+
+        state = root
+        steps = []
+        unchanged = 0
+        depth = 0
+
+        for step in range(max_steps):
+
+            opt_pass = rng.choice(passes)
+            target = self.step(state, opt_pass)
+            steps.append((state, opt_pass, target))
+
+            if target is None or target == state:
+                unchanged += 1
+                if unchanged >= patience:
+                    return {'steps': steps, 'fixpoint depth': depth, 'fixpoint': True}
+                continue
+
+            unchanged = 0
+            depth = step + 1
+            state = target
+
+        return {'steps': steps, 'fixpoint depth': depth, 'fixpoint': False}
+
+
+def sample(root_program_path, passes, work_directory, cache, toolchain = None, walks = 1000, max_steps = 100, patience = 10, jobs = None, seed = 0, profiler = None):
+    """
+    Runs the random walks from a program and estimates the shape of its state space.
+
+    Parameter:
+    root_program_path (string): path to the LLVM IR file of the program
+    passes (list: string): passes the walks pick from
+    work_directory (string): directory the states are written to for opt to read
+    cache (IRCache): cache memoizing the states and transitions
+    toolchain (Toolchain): toolchain whose opt is used, the tools on PATH if None
+    walks (int): number of walks
+    max_steps (int): maximum number of passes applied by a walk
+    patience (int): unchanged steps in a row after which a walk is at a fixpoint
+    jobs (int): walks run at once, one per core if None
+    seed (int): seed of the walks, walk i always applies the same passes
+    profiler (Profiler): profiler counting the opt runs and transition hits, None to not profile
+
+    Return:
+    graph (DiGraph): sampled subgraph, nodes are state hashes with their 'visits', edges hold the passes in 'relationship'
+    summary (dict): estimates of the reachable states, the fixpoint depth and every pass's change probability
+    """
+
+    import networkx as nx
+
+    if toolchain is None:
+        toolchain = Toolchain.default_toolchain()
+    if jobs is None:
+        jobs = Diff_Engine.default_jobs()
+
+    walker = Walker(cache, toolchain, work_directory, profiler)
+    root = cache.put_file(root_program_path)
+
+    # Each walk has its own generator, so the walks don't depend on the scheduling of the threads
+    def run_walk(index):
+        return walker.walk(root, passes, random.Random(seed * 1000003 + index), max_steps, patience)
+
+    graph = nx.DiGraph()
+    graph.add_node(root, visits = 1)
+
+    visits = {root: walks}
+    applications = {opt_pass: 0 for opt_pass in passes}
+    changes = {opt_pass: 0 for opt_pass in passes}
+    failures = 0
+    depths = []
+    fixpoints = 0
+
+    # Merged in walk order, so the graph is the same whatever the number of jobs
+    for walk in Diff_Engine.ordered_map(run_walk, range(walks), jobs):
+
+        depths.append(walk['fixpoint depth'])
+        fixpoints += walk['fixpoint']
+
+        for source, opt_pass, target in walk['steps']:
+
+            if target is None:
+                failures += 1
+                continue
+
+            applications[opt_pass] += 1
+
+            if target == source:
+                continue
+
+            changes[opt_pass] += 1
+            visits[target] = visits.get(target, 0) + 1
+
+            if target not in graph:
+                graph.add_node(target)
+
+            if graph.has_edge(source, target):
+                relationship = graph[source][target]['relationship']
+                if opt_pass not in relationship.split(','):
+                    graph[source][target]['relationship'] = relationship + ',' + opt_pass
+            else:
+                graph.add_edge(source, target, relationship = opt_pass)
+
+    for node in graph.nodes:
+        graph.nodes[node]['visits'] = visits.get(node, 0)
+
+    # The root is where every walk starts, not a sample of the space
+    estimate, interval = chao1([count for node, count in visits.items() if node != root])
+    depth_mean, depth_interval = mean_interval(depths)
+
+    summary = {
+        'walks': walks,
+        'passes': len(passes),
+        'max steps': max_steps,
+        'patience': patience,
+        'seed': seed,
+        'states seen': graph.number_of_nodes(),
+        'transitions seen': graph.number_of_edges(),
+        'reachable states': {'estimate': estimate + 1, 'interval': [interval[0] + 1, interval[1] + 1]},
+        'fixpoint depth': {'mean': depth_mean, 'interval': None if depth_interval is None else list(depth_interval), 'max': max(depths, default = None)},
+        'walks reaching a fixpoint': fixpoints,
+        'opt failures': failures,
+        'pass change probability': {opt_pass: {'applications': applications[opt_pass], 'changes': changes[opt_pass],
+                                               'probability': changes[opt_pass] / applications[opt_pass] if applications[opt_pass] else None,
+                                               'interval': list(wilson_interval(changes[opt_pass], applications[opt_pass]))} for opt_pass in passes}
+    }
+
+    return graph, summary
+
+
+def write_outputs(graph, summary, gml_path, summary_path):
+    """
+    Outputs the sampled subgraph as GML, with the node names of Pass_Relations_Graph.py (P0 is the root), and
+    the summary as JSON.
+
+    Parameter:
+    graph (DiGraph): sampled subgraph returned by sample()
+    summary (dict): summary returned by sample()
+    gml_path (string): path of the GML file
+    summary_path (string): path of the JSON file
+
+    Return:
+    Nothing, generates both files
+    """
+
+    Exploration.write_graph(graph, gml_path, 'hash')
+
+    with open(summary_path, 'w') as file:
+        json.dump(summary, file, indent = 2)
+
+
+def report(summary):
+    """
+    Human readable summary.
+
+    Parameter:
+    summary (dict): summary returned by sample()
+
+    Return:
+    text (string): the report
+    """
+
+    states = summary['reachable states']
+    depth = summary['fixpoint depth']
+
+    lines = [
+        'States seen: {} in {} walks'.format(summary['states seen'], summary['walks']),
+        'Reachable states: {:.0f} (95% CI {:.0f} to {:.0f})'.format(states['estimate'], *states['interval']),
+        'Fixpoint depth: {:.2f} (95% CI {:.2f} to {:.2f}), max {}, {} of {} walks reached a fixpoint'.format(depth['mean'], *depth['interval'], depth['max'], summary['walks reaching a fixpoint'], summary['walks']),
+        'Pass change probability:'
+    ]
+
+    for opt_pass, change in sorted(summary['pass change probability'].items(), key = lambda item: -(item[1]['probability'] or 0)):
+        if change['applications']:
+            lines.append('  {:<28} {:.3f} (95% CI {:.3f} to {:.3f}, {} applications)'.format(opt_pass, change['probability'], *change['interval'], change['applications']))
+
+    return '\n'.join(lines)
+
+
+def parse_arguments():
+
+    parser = argparse.ArgumentParser(description = 'Estimates the state space of a program under a large pass set with random pass-sequence walks.')
+    parser.add_argument('program', help = 'LLVM IR file the walks start from')
+    parser.add_argument('output', help = 'directory the sampled graph, the summary and the states are written to')
+    parser.add_argument('--walks', type = int, default = 1000, help = 'number of walks')
+    parser.add_argument('--max-steps', type = int, default = 100, help = 'maximum number of passes applied by a walk')
+    parser.add_argument('--patience', type = int, default = 10, help = 'unchanged steps in a row after which a walk is at a fixpoint')
+    parser.add_argument('--passes', nargs = '+', default = None, help = 'passes the walks pick from, the O1 passes known to opt by default')
+    parser.add_argument('--jobs', type = int, default = None, help = 'walks run at once, one per core by default')
+    parser.add_argument('--seed', type = int, default = 0, help = 'seed of the walks')
+    parser.add_argument('--tools', default = None, help = 'bin directory or install prefix of the LLVM toolchain, the tools on PATH by default')
+    parser.add_argument('--cache', default = None, help = 'path of the IR cache, in the user cache directory by default')
+
+    return parser.parse_args()
+
+
+def main():
+
+    arguments = parse_arguments()
+
+    toolchain = Toolchain.default_toolchain() if arguments.tools is None else Toolchain.toolchain(arguments.tools)
+    # The O1 list is from 2023, an older opt lacks a few of its passes
+    if arguments.passes is None:
+        passes = Pass_Registry.available_passes(Pass_Registry.O1_PASSES, toolchain.opt)
+    else:
+        passes = arguments.passes
+        Pass_Registry.validate_passes(passes, toolchain.opt)
+
+    os.makedirs(arguments.output, exist_ok = True)
+    cache = IR_Cache.IRCache(arguments.cache)
+
+    try:
+        graph, summary = sample(arguments.program, passes, os.path.join(arguments.output, 'states'), cache, toolchain,
+                                arguments.walks, arguments.max_steps, arguments.patience, arguments.jobs, arguments.seed)
+    finally:
+        cache.close()
+
+    name = os.path.basename(arguments.program)
+    write_outputs(graph, summary, os.path.join(arguments.output, name + '.walks.gml'), os.path.join(arguments.output, name + '.walks.json'))
+
+    print(report(summary))
+
+
+if __name__ == '__main__':
+    main()
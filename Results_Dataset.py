@@ -0,0 +1,146 @@
+# Columnar results dataset of LLVM-DIFF.py. The metrics and cluster of every program for every pass are
+# stored as Parquet files partitioned by pass (<root>/pass=<name>/part-0.parquet), with one row per
+# program. Readers only load the columns they ask for, and filters on the pass or any other column are
+# pushed down so whole partitions and row groups are skipped.
+
+import os
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Column holding the program name
+PROGRAM = 'program'
+
+# Partition column holding the pass name
+PASS = 'pass'
+
+# Column holding the program's cluster for the pass
+CLUSTER = 'cluster'
+
+
+def column_name(metric_name):
+    """
+    Column name of a metric, e.g. 'Num Additions' becomes 'num_additions'.
+
+    Parameter:
+    metric_name (string): metric name as used in the csv files
+
+    Return:
+    column (string): column name in the dataset
+    """
+
+    return metric_name.strip().lower().replace(' ', '_')
+
+
+def write_pass_partition(dataset_root, pass_name, programs, metrics, clusters):
+    """
+    Writes (or replaces) the partition of one pass.
+
+    Parameter:
+    dataset_root (string): path to the root directory of the dataset
+    pass_name (string): name of the pass
+    programs (list: string): program name of every row
+    metrics (dict: array-like): values of every metric, keyed by metric name
+    clusters (array-like): cluster of every row
+
+    Return:
+    Nothing, writes the partition's Parquet file
+    """
+
+    columns = {PROGRAM: pa.array([str(program) for program in programs], type = pa.string())}
+
+    for metric_name, values in metrics.items():
+        columns[column_name(metric_name)] = pa.array(values, type = pa.float64())
+
+    columns[CLUSTER] = pa.array(clusters, type = pa.int32())
+
+    partition_path = os.path.join(dataset_root, PASS + '=' + pass_name)
+    os.makedirs(partition_path, exist_ok = True)
+
+    pq.write_table(pa.table(columns), os.path.join(partition_path, 'part-0.parquet'))
+
+
+def open_dataset(dataset_root):
+    """
+    Opens the dataset without reading any data.
+
+    Parameter:
+    dataset_root (string): path to the root directory of the dataset
+
+    Return:
+    dataset (Dataset): the dataset, with the pass as a partition column
+    """
+
+    return ds.dataset(dataset_root, format = 'parquet', partitioning = 'hive')
+
+
+def pass_filter(passes):
+    """
+    Filter keeping only the given passes, pushed down to skip the other partitions entirely.
+
+    Parameter:
+    passes (list: string): passes to keep
+
+    Return:
+    filter (Expression): filter expression
+    """
+
+    return ds.field(PASS).isin(list(passes))
+
+
+def read_table(dataset_root, columns = None, filter = None):
+    """
+    Reads the dataset into a table, loading only the given columns and rows matching the filter.
+
+    Parameter:
+    dataset_root (string): path to the root directory of the dataset
+    columns (list: string): columns to load, all of them if None
+    filter (Expression): filter pushed down to the Parquet reader, e.g. pass_filter(['sroa']) or ds.field('cluster') == 2
+
+    Return:
+    table (Table): the matching rows
+    """
+
+    return open_dataset(dataset_root).to_table(columns = columns, filter = filter)
+
+
+def iter_batches(dataset_root, columns = None, filter = None, batch_size = 65536):
+    """
+    Streams the dataset in record batches, so memory stays bounded regardless of its size.
+
+    Parameter:
+    dataset_root (string): path to the root directory of the dataset
+    columns (list: string): columns to load, all of them if None
+    filter (Expression): filter pushed down to the Parquet reader
+    batch_size (int): maximum number of rows per batch
+
+    Return:
+    batch (RecordBatch): each batch of matching rows
+    """
+
+    return open_dataset(dataset_root).to_batches(columns = columns, filter = filter, batch_size = batch_size)
+
+
+def read_program_clusters(dataset_root, passes = None):
+    """
+    Loads the cluster of every program for every pass, reading only the program, pass and cluster columns.
+
+    Parameter:
+    dataset_root (string): path to the root directory of the dataset
+    passes (list: string): passes to load, all of them if None
+
+    Return:
+    program_clusters (dict: list): clusters of every program, one per pass, in pass order
+    """
+
+    filter = None if passes is None else pass_filter(passes)
+
+    program_clusters = {}
+
+    for batch in iter_batches(dataset_root, columns = [PROGRAM, PASS, CLUSTER], filter = filter):
+
+        for program, pass_name, cluster in zip(*(batch.column(name).to_pylist() for name in (PROGRAM, PASS, CLUSTER))):
+            program_clusters.setdefault(program, []).append((pass_name, cluster))
+
+    # Order the clusters of every program by pass so batches arriving in any order give the same result
+    return {program: [cluster for pass_name, cluster in sorted(clusters)] for program, clusters in program_clusters.items()}
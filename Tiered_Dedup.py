@@ -0,0 +1,268 @@
+# Tiered equivalence check of a new program state against the graph, so almost no pair reaches llvm-diff.
+# Tier 1 compares structure: every state is summarized by the instruction and basic block counts of each
+# function it defines, and the states are indexed by those counts. llvm-diff walks a function from its
+# entry block along the branches and reports every instruction of those blocks it can't match, but ignores
+# unreachable blocks, globals and functions only one program defines. So only the blocks reachable from
+# the entry block are counted, and two states can only be equivalent if the functions they both define
+# have the same counts. States with the same functions are bucketed by their counts and found with one
+# lookup, the rare states with other functions are checked on the functions in common. Byte size and
+# function count would not be safe filters. Tier 2 compares the hash of the canonical IR (see IR_Cache.py):
+# equal hashes are the same state, and the first node with the hash is taken without running llvm-diff,
+# even if an earlier node is one llvm-diff finds no differences with. Otherwise tier 3 is llvm-diff, run by
+# the caller on the candidates left in graph order, so the node found is the first equivalent node, as a
+# full scan finds it. Every tier counts the candidates it eliminates in the profiler. Nodes are indexed as
+# the exploration inserts them.
+
+import os
+import re
+import weakref
+import itertools
+
+import IR_Cache
+import Profiling
+
+# Function definition line, the name is either plain or quoted
+DEFINE = re.compile(r'^define\b[^@]*@("(?:[^"\\]|\\.)*"|[-\w.$]+)\s*\(')
+
+# Basic block label at the start of an unindented line, e.g. '5:' or 'for.body:' (as in IR_Features.py)
+LABEL = re.compile(r'^([-\w.$]+|"[^"]*"):')
+
+# Block a terminator (br, switch, invoke, ...) can branch to, e.g. 'label %5'
+SUCCESSOR = re.compile(r'\blabel %([-\w.$]+|"(?:[^"\\]|\\.)*")')
+
+# Index of every graph being deduped, dropped with the graph
+INDEXES = weakref.WeakKeyDictionary()
+
+
+def reachable_counts(blocks, labels):
+    """
+    Instruction and basic block counts of the blocks of a function reachable from its entry block.
+
+    Parameter:
+    blocks (list: list): [instructions, successor labels] of every block, the entry block first
+    labels (dict: int): index of every labelled block
+
+    Return:
+    counts (tuple): (instructions, basic blocks) of the reachable blocks
+    """
+
+    reached = {0}
+    stack = [0]
+
+    while stack:
+        for successor in blocks[stack.pop()][1]:
+            block = labels.get(successor)
+            if block is not None and block not in reached:
+                reached.add(block)
+                stack.append(block)
+
+    return sum(blocks[block][0] for block in reached), len(reached)
+
+
+def describe(ir):
+    """
+    Canonical hash and structure of a program.
+
+    Parameter:
+    ir (string): contents of the LLVM IR file
+
+    Return:
+    digest (string): content address of the canonical IR
+    functions (dict: tuple): (instructions, basic blocks) reachable from the entry block of every defined function
+    """
+
+    canonical_ir = IR_Cache.canonicalize_ir(ir)
+
+    functions = {}
+    function = None
+
+    for line in canonical_ir.splitlines():
+
+        if function is None:
+            match = DEFINE.match(line)
+            if match is not None:
+                function = match.group(1)
+                blocks = [[0, []]]
+                labels = {}
+            continue
+
+        if line.startswith('}'):
+            functions[function] = reachable_counts(blocks, labels)
+            function = None
+            continue
+
+        match = LABEL.match(line)
+        if match is not None:
+
+            # A label before the first instruction names the entry block
+            if blocks[-1][0] > 0:
+                blocks.append([0, []])
+            labels[match.group(1)] = len(blocks) - 1
+            continue
+
+        # Cases of a switch and its closing bracket continue the instruction before them
+        if not line.startswith('    ') and line.strip() != ']':
+            blocks[-1][0] += 1
+        blocks[-1][1].extend(SUCCESSOR.findall(line))
+
+    return IR_Cache.ir_hash(canonical_ir), functions
+
+
+class DedupIndex:
+    """
+    Hashes and structure of the nodes of a graph, indexed for tiers 1 and 2. Nodes are LLVM IR file paths,
+    indexed as the graph grows.
+
+    Parameter:
+    graph (DiGraph): graph of program states
+    """
+
+    def __init__(self, graph):
+
+        self.graph = graph
+        self.nodes = []
+        self.position = {}
+
+        # First node of every canonical hash
+        self.hashes = {}
+
+        # Sorted function names to counts of those functions to the nodes having them
+        self.groups = {}
+
+        # Description of the last program looked up, it usually becomes the next node
+        self.last = (None, None)
+
+    def add(self, node):
+        """
+        Indexes a node just added to the graph.
+
+        Parameter:
+        node (string): path to the node's LLVM IR file
+
+        Return:
+        Nothing, updates the index
+        """
+
+        # Nodes added before it without add() come first
+        if self.graph.number_of_nodes() != len(self.nodes) + 1:
+            self.sync()
+            return
+
+        self.index_node(node)
+
+    def index_node(self, node):
+        """
+        Indexes a node of the graph, after every node before it.
+
+        Parameter:
+        node (string): path to the node's LLVM IR file
+
+        Return:
+        Nothing, updates the index
+        """
+
+        # The program looked up last usually becomes the node, no need to read it again. A node without a file
+        # (opt failed on it) has no functions, so it is a candidate for every program
+        path, description = self.last
+        if path != node:
+            if os.path.exists(node):
+                with open(node, 'r') as file:
+                    description = describe(file.read())
+            else:
+                description = (None, {})
+
+        digest, functions = description
+        self.position[node] = len(self.nodes)
+        self.nodes.append(node)
+        self.hashes.setdefault(digest, node)
+
+        names = tuple(sorted(functions))
+        self.groups.setdefault(names, {}).setdefault(tuple(functions[name] for name in names), []).append(node)
+
+    def sync(self):
+        """
+        Indexes the nodes added to the graph without add(), e.g. the root or a graph built elsewhere.
+
+        Return:
+        Nothing, updates the index
+        """
+
+        if self.graph.number_of_nodes() == len(self.nodes):
+            return
+
+        for node in list(itertools.islice(self.graph.nodes, len(self.nodes), None)):
+            self.index_node(node)
+
+    def candidates(self, program_path, cache = None, profiler = None):
+        """
+        Runs tiers 1 and 2 for a program.
+
+        Parameter:
+        program_path (string): path to the LLVM IR file of the program
+        cache (IRCache): cache the program is stored in, None to only hash it
+        profiler (Profiler): profiler counting the candidates every tier eliminates
+
+        Return:
+        node (string): node with the same canonical IR, None if there is none
+        target (string): content address of the program in the cache, None without a cache
+        candidates (list: string): nodes left for llvm-diff in graph order, empty if node was found
+        """
+
+        profiler = Profiling.active(profiler)
+
+        self.sync()
+
+        with open(program_path, 'r') as file:
+            ir = file.read()
+
+        digest, functions = describe(ir)
+        self.last = (program_path, (digest, functions))
+        target = None if cache is None else cache.put_ir(ir)
+
+        profiler.count('dedup candidates', len(self.nodes))
+
+        # Tier 1, the states whose common functions have the same counts
+        names = tuple(sorted(functions))
+        counts = tuple(functions[name] for name in names)
+        candidates = list(self.groups.get(names, {}).get(counts, ()))
+
+        for group_names, buckets in self.groups.items():
+            if group_names == names:
+                continue
+            common = [(index, functions[name]) for index, name in enumerate(group_names) if name in functions]
+            for group_counts, nodes in buckets.items():
+                if all(group_counts[index] == function_counts for index, function_counts in common):
+                    candidates.extend(nodes)
+
+        profiler.count('stats eliminated', len(self.nodes) - len(candidates))
+
+        # Tier 2, identical canonical IR is the same program state, no llvm-diff needed (it even reports
+        # spurious differences between identical loops with phi nodes)
+        node = self.hashes.get(digest)
+        if node is not None:
+            profiler.count('hash hits')
+            profiler.count('hash eliminated', len(candidates))
+            return node, target, []
+
+        candidates.sort(key = self.position.__getitem__)
+        profiler.count('diff candidates', len(candidates))
+
+        return None, target, candidates
+
+
+def index_for(graph):
+    """
+    Dedup index of a graph, created on first use.
+
+    Parameter:
+    graph (DiGraph): graph of program states
+
+    Return:
+    index (DedupIndex): the graph's index
+    """
+
+    index = INDEXES.get(graph)
+    if index is None:
+        index = INDEXES[graph] = DedupIndex(graph)
+
+    return index
@@ -0,0 +1,111 @@
+# Locally installed LLVM toolchains. A toolchain is the opt, llvm-diff and clang binaries of one LLVM
+# install, found from a bin directory or an install prefix, with the version reported by opt. Its key
+# (version and opt hash) names everything cached for it, so two builds of the same version never mix.
+
+import os
+import re
+import shutil
+import subprocess
+
+import Pass_Registry
+
+# Version line of 'opt --version', e.g. 'Debian LLVM version 14.0.6' or 'LLVM version 17.0.1git'
+VERSION = re.compile(r'LLVM version ([0-9][0-9A-Za-z.\-_+]*)')
+
+
+class Toolchain:
+    """
+    The binaries of one LLVM install.
+
+    Parameter:
+    opt (string): path to opt
+    llvm_diff (string): path to llvm-diff
+    clang (string): path to clang, None if the install has none
+    """
+
+    def __init__(self, opt, llvm_diff, clang = None):
+
+        self.opt = opt
+        self.llvm_diff = llvm_diff
+        self.clang = clang
+
+        self.version = opt_version(opt)
+
+        # Version and the start of the opt hash, unique per build
+        self.key = self.version + '-' + Pass_Registry.opt_fingerprint(opt)[:12]
+
+    def __repr__(self):
+
+        return 'Toolchain(' + self.key + ', ' + self.opt + ')'
+
+
+def opt_version(opt):
+    """
+    Version of LLVM an opt binary belongs to.
+
+    Parameter:
+    opt (string): path to opt
+
+    Return:
+    version (string): version number, e.g. '14.0.6'
+    """
+
+    output = subprocess.run([opt, '--version'], capture_output = True, text = True, check = True).stdout
+
+    match = VERSION.search(output)
+    if match is None:
+        raise ValueError("Can't read the LLVM version of " + opt)
+
+    return match.group(1)
+
+
+def find_binary(directories, name):
+    """
+    Finds a binary in the first directory that has it.
+
+    Parameter:
+    directories (list: string): directories to search, in order
+    name (string): name of the binary
+
+    Return:
+    path (string): path to the binary, None if no directory has it
+    """
+
+    for directory in directories:
+        path = os.path.join(directory, name)
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+
+    return None
+
+
+def toolchain(path):
+    """
+    Toolchain of an LLVM install.
+
+    Parameter:
+    path (string): bin directory of the install (holding opt) or its prefix (holding bin/opt)
+
+    Return:
+    toolchain (Toolchain): the install's toolchain, raises FileNotFoundError if opt or llvm-diff is missing
+    """
+
+    directories = [path, os.path.join(path, 'bin')]
+
+    opt = find_binary(directories, 'opt')
+    llvm_diff = find_binary(directories, 'llvm-diff')
+    if opt is None or llvm_diff is None:
+        raise FileNotFoundError('No opt and llvm-diff in ' + path + ' or ' + os.path.join(path, 'bin'))
+
+    return Toolchain(opt, llvm_diff, find_binary(directories, 'clang'))
+
+
+def default_toolchain():
+    """
+    Toolchain of the opt, llvm-diff and clang found on PATH.
+
+    Return:
+    toolchain (Toolchain): the default toolchain
+    """
+
+    return Toolchain(shutil.which('opt') or 'opt', shutil.which('llvm-diff') or 'llvm-diff', shutil.which('clang'))
@@ -0,0 +1,225 @@
+# Evolution of pass interactions across LLVM versions. Runs the same exploration of every program with
+# several locally installed toolchains in parallel, all sharing one IR cache: identical programs are
+# stored once, transitions are cached per toolchain and llvm-diff verdicts are shared by every version,
+# so N versions cost far less than N separate runs. Writes the graphs and a timing report per version,
+# and a diff report of the graphs and timings of every pair of consecutive versions.
+
+import os
+import csv
+import time
+import argparse
+
+import Diff_Engine
+import Exploration
+import IR_Cache
+import Pass_Registry
+import Profiling
+import Toolchain
+
+# Counters of an exploration, reported per program and version
+COUNTERS = ['opt runs', 'transition hits', 'diff runs', 'diff hits', 'hash hits']
+
+
+def graph_states(graph):
+    """
+    Content addresses of the program states of an exploration graph.
+
+    Parameter:
+    graph (DiGraph): graph returned by Exploration.explore() with a cache
+
+    Return:
+    states (set: string): hash of every node
+    """
+
+    return {node_hash for node, node_hash in graph.nodes(data = 'hash')}
+
+
+def graph_transitions(graph):
+    """
+    Transitions of an exploration graph, independent of the node names.
+
+    Parameter:
+    graph (DiGraph): graph returned by Exploration.explore() with a cache
+
+    Return:
+    transitions (set: tuple): (source hash, pass, target hash) of every pass on every edge
+    """
+
+    transitions = set()
+
+    for source, target, relationship in graph.edges(data = 'relationship'):
+        for opt_pass in relationship.split(','):
+            transitions.add((graph.nodes[source]['hash'], opt_pass, graph.nodes[target]['hash']))
+
+    return transitions
+
+
+def explore_toolchain(toolchain, programs, passes, output_directory, cache, max_nodes = 10000, time_limit = 10000):
+    """
+    Explores every program with one toolchain and writes its graphs and report.
+
+    Parameter:
+    toolchain (Toolchain): toolchain used
+    programs (list: string): paths to the LLVM IR files of the programs
+    passes (list: string): passes applied on every state
+    output_directory (string): path to the root directory of the matrix, the toolchain writes to <root>/<toolchain key>
+    cache (IRCache): cache shared by every toolchain
+    max_nodes (int): node limit of every exploration
+    time_limit (float): time limit of every exploration, in seconds
+
+    Return:
+    results (list: dict): program name, graph, seconds and counters of every exploration
+    """
+
+    # Fail fast if this version doesn't know one of the passes
+    Pass_Registry.validate_passes(passes, toolchain.opt)
+
+    version_directory = os.path.join(output_directory, toolchain.key)
+    optimized_path = os.path.join(version_directory, 'optimized')
+    os.makedirs(optimized_path, exist_ok = True)
+
+    results = []
+
+    for program in programs:
+
+        profiler = Profiling.Profiler()
+        start_time = time.time()
+        graph = Exploration.explore(program, passes, optimized_path, toolchain, cache, max_nodes, time_limit, profiler)
+        seconds = time.time() - start_time
+
+        # Same node names as Pass_Relations_Graph.py, the hash attribute identifies the states across versions
+        with profiler.stage('export'):
+            Exploration.write_graph(graph, os.path.join(version_directory, os.path.basename(program) + '.gml'))
+
+        profiler.write_json(os.path.join(version_directory, os.path.basename(program) + '.profile.json'))
+
+        results.append({'program': os.path.basename(program), 'graph': graph, 'seconds': seconds, 'stats': profiler.counters})
+
+    write_report(os.path.join(version_directory, 'report.csv'), toolchain, results)
+
+    return results
+
+
+def write_report(csv_path, toolchain, results):
+    """
+    Outputs the size, time and cache counters of every exploration of a toolchain to a csv file.
+
+    Parameter:
+    csv_path (string): path of the csv file
+    toolchain (Toolchain): toolchain the explorations ran with
+    results (list: dict): results returned by explore_toolchain()
+
+    Return:
+    Nothing, generates the csv file
+    """
+
+    with open(csv_path, mode = 'w', newline = '') as file:
+
+        writer = csv.writer(file)
+        writer.writerow(['Version', 'Toolchain', 'Program', 'Nodes', 'Edges', 'Seconds'] + [counter.title() for counter in COUNTERS])
+
+        for result in results:
+            graph = result['graph']
+            writer.writerow([toolchain.version, toolchain.key, result['program'], graph.number_of_nodes(), graph.number_of_edges(), result['seconds']] + [result['stats'].get(counter, 0) for counter in COUNTERS])
+
+
+def write_version_diff(csv_path, first_results, second_results):
+    """
+    Outputs how the graph and timing of every program changed between two versions to a csv file.
+
+    Parameter:
+    csv_path (string): path of the csv file
+    first_results (list: dict): results of the older version
+    second_results (list: dict): results of the newer version, same programs in the same order
+
+    Return:
+    Nothing, generates the csv file
+    """
+
+    with open(csv_path, mode = 'w', newline = '') as file:
+
+        writer = csv.writer(file)
+        writer.writerow(['Program', 'Nodes Before', 'Nodes After', 'Shared Nodes', 'Transitions Before', 'Transitions After', 'Shared Transitions', 'Seconds Before', 'Seconds After'])
+
+        for first, second in zip(first_results, second_results):
+
+            first_transitions = graph_transitions(first['graph'])
+            second_transitions = graph_transitions(second['graph'])
+
+            writer.writerow([
+                first['program'],
+                first['graph'].number_of_nodes(),
+                second['graph'].number_of_nodes(),
+                len(graph_states(first['graph']) & graph_states(second['graph'])),
+                len(first_transitions),
+                len(second_transitions),
+                len(first_transitions & second_transitions),
+                first['seconds'],
+                second['seconds']
+            ])
+
+
+def run_matrix(toolchains, programs, passes, output_directory, cache, max_nodes = 10000, time_limit = 10000, jobs = None):
+    """
+    Explores every program with every toolchain, one toolchain per thread, and writes the version diff reports.
+
+    Parameter:
+    toolchains (list: Toolchain): toolchains to compare, oldest first
+    programs (list: string): paths to the LLVM IR files of the programs
+    passes (list: string): passes applied on every state
+    output_directory (string): path to the root directory of the matrix
+    cache (IRCache): cache shared by every toolchain
+    max_nodes (int): node limit of every exploration
+    time_limit (float): time limit of every exploration, in seconds
+    jobs (int): number of toolchains explored at once, all of them if None
+
+    Return:
+    results (list: list): results of explore_toolchain() for every toolchain
+    """
+
+    if jobs is None:
+        jobs = len(toolchains)
+
+    results = list(Diff_Engine.ordered_map(lambda toolchain: explore_toolchain(toolchain, programs, passes, output_directory, cache, max_nodes, time_limit), toolchains, jobs))
+
+    # Compare every version with the next one
+    for index in range(len(toolchains) - 1):
+        csv_name = toolchains[index].key + '-vs-' + toolchains[index + 1].key + '.csv'
+        write_version_diff(os.path.join(output_directory, csv_name), results[index], results[index + 1])
+
+    return results
+
+
+def parse_arguments():
+
+    parser = argparse.ArgumentParser(description = 'Explores the same programs with several LLVM toolchains and compares the graphs across versions.')
+    parser.add_argument('toolchains', nargs = '+', help = 'bin directory or install prefix of every toolchain, oldest first')
+    parser.add_argument('--programs', default = '/Users/ahmedelzaria/Documents/LLVM/Test_Programs', help = 'directory of the LLVM IR files to explore, readable by every toolchain')
+    parser.add_argument('--output', default = '/Users/ahmedelzaria/Documents/LLVM/Toolchain_Matrix', help = 'directory the graphs and reports are written to')
+    parser.add_argument('--passes', nargs = '+', default = Pass_Registry.LOOP_PASSES, help = 'passes applied on every state')
+    parser.add_argument('--cache', default = None, help = 'path of the shared IR cache, in the user cache directory by default')
+    parser.add_argument('--max-nodes', type = int, default = 10000, help = 'node limit of every exploration')
+    parser.add_argument('--time-limit', type = float, default = 10000, help = 'time limit of every exploration, in seconds')
+    parser.add_argument('--jobs', type = int, default = None, help = 'number of toolchains explored at once, all of them by default')
+
+    return parser.parse_args()
+
+
+def main():
+
+    arguments = parse_arguments()
+
+    toolchains = [Toolchain.toolchain(path) for path in arguments.toolchains]
+
+    programs = sorted(os.path.join(arguments.programs, item) for item in os.listdir(arguments.programs) if item.endswith('.ll'))
+
+    cache = IR_Cache.IRCache(arguments.cache)
+
+    try:
+        run_matrix(toolchains, programs, arguments.passes, arguments.output, cache, arguments.max_nodes, arguments.time_limit, arguments.jobs)
+    finally:
+        cache.close()
+
+
+if __name__ == '__main__':
+    main()
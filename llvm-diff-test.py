@@ -36,5 +36,5 @@ for line in diff_output:
 # Append the current comparison to main list/dictionary
 differences.append(differences_entry)
 
-print(differences['Num Additions'])
+print(differences[0]['Num Additions'])
 